@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import stat
 import inspect
 from optparse import OptionParser
@@ -22,8 +23,34 @@ opts.add_option('-o', '--output', type='string', dest='output',
                 metavar='OUTPUT', default='a.py')
 opts.add_option('-p', '--nproc', type='int', dest='np', metavar='NPROC',
                 default=1)
+opts.add_option('-b', '--batch-size', type='int', dest='batch_size',
+                metavar='BATCH_SIZE', default=64)
 opts.add_option('-d', action='store_true', dest='debug', default=False)
 
+
+def combine_ref(combine, decls):
+    """
+    Name of the combine function of a reductor in the generated program,
+    and the import or definition to emit for it: functions of the box
+    declarations are copied, others are imported from their module.
+    """
+    module = combine.__module__
+    name = combine.__name__
+
+    if module == decls.__name__:
+        return name, ''.join(inspect.getsourcelines(combine)[0]) + '\n'
+
+    if module == 'builtins':
+        return name, ''
+
+    # Prefer the public module of C accelerators (operator for _operator).
+    public = module.lstrip('_')
+
+    if getattr(sys.modules.get(public), name, None) is combine:
+        module = public
+
+    return '%s.%s' % (module, name), 'import %s\n' % module
+
 if __name__ == '__main__':
 
     (options, args) = opts.parse_args()
@@ -78,11 +105,41 @@ if __name__ == '__main__':
 
     boxes = {box.func.__name__: box for box in used_boxes}
 
+    # Combine functions of unordered reductors: imports go first,
+    # definitions right before the boxes.
+    combines = {}
+    imports = set()
+    definitions = {}
+
+    for name, box in boxes.items():
+        combine = getattr(box.func, 'combine', None)
+
+        if combine is None:
+            continue
+
+        ref, source = combine_ref(combine, decls)
+        combines[name] = ref
+
+        if source.startswith('import'):
+            imports.add(source)
+        elif source:
+            definitions[ref] = source
+
+    if imports:
+        output += ''.join(sorted(imports)) + '\n'
+
+    output += ''.join(definitions.values())
+
     # Box functions.
     for box in boxes.values():
         func_lines = inspect.getsourcelines(box.func)[0]
 
-        if hasattr(box.func, 'ordered'):
+        if box.func.__name__ in combines:
+            decorator = "@%s.%s(%s, combine=%s)\n" \
+                % (__runtime_pkg__, box.func.cat, box.func.ordered,
+                   combines[box.func.__name__])
+
+        elif hasattr(box.func, 'ordered'):
             decorator = "@%s.%s(%s)\n" % (__runtime_pkg__, box.func.cat,
                                           box.func.ordered)
 
@@ -106,24 +163,23 @@ if __name__ == '__main__':
     # Synchronisers
     for sync in used_syncs:
         ast = syncs[sync.name]
-        output += aksync.compiler.compile_sync(ast)
+        labels = getattr(sync, 'labels', None) or ()
+        output += aksync.compiler.compile_sync(ast, labels)
 
     # Reverse exit mapping
     exit_bbs = defaultdict(list)
     for channel, bb in graph.exit.items():
         exit_bbs[bb].append(channel)
 
-    # Add exit nodes.
+    # Add exit nodes: a single output vertex per basic block, fired by
+    # messages of any of its channels.
     for bb, channels in exit_bbs.items():
-        # Create separate output vertex for each output as multi-input vertices
-        # are not currently supported
-        for ch in channels:
-            exit_node = '%s_exit_%s' % (bb, ch)
+        exit_node = '%s_exit' % bb
 
-            graph.add_node(exit_node,
-                           stmts=[('__output__', (ch,), ())],
-                           exit=True)
-            graph.add_edge(bb, exit_node, {'chn': {ch}})
+        graph.add_node(exit_node,
+                       stmts=[('__output__', tuple(channels), ())],
+                       exit=True)
+        graph.add_edge(bb, exit_node, {'chn': set(channels)})
 
     # Control flow graph.
     output += "nodes = [\n"
@@ -150,8 +206,12 @@ if __name__ == '__main__':
     output += "__input__ = %s\n\n" % repr(decls.__input__)
 
     # Runners.
-    output += "runner = %s.Runner(cfg, __input__)\n" % __runtime_pkg__
-    output += "runner.run()\n"
+    # Guarded: nodes of a multi-node run (see akr.cluster) execute the
+    # program only to build the net.
+    output += "if __name__ == '__main__':\n"
+    output += "    runner = %s.Runner(cfg, __input__, batch_size=%d)\n" \
+        % (__runtime_pkg__, options.batch_size)
+    output += "    runner.run()\n"
 
     with open(options.output, 'w') as f:
         f.write(output)
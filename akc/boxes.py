@@ -28,7 +28,9 @@ ORDERED = True
 UNORDERED = False
 
 
-def reductor(adity, ordered, n_out):
+def reductor(adity, ordered, n_out, combine=None):
+    # `combine' of an UNORDERED reductor is a function of two partial
+    # results, as for akr.reductor.
     assert adity == 1 or adity == 2
     assert ordered is True or ordered is False
 
@@ -36,6 +38,7 @@ def reductor(adity, ordered, n_out):
         func.n_in = adity
         func.n_out = n_out
         func.ordered = ordered
+        func.combine = None if ordered else combine
         func.cat = 'reductor'
         def getf():
             return func
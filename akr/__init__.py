@@ -1,3 +1,4 @@
 from .runtime import *
 from .boxes import *
 from .stream import *
+from .cluster import *
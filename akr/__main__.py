@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+'''
+Multi-node runs of compiled programs over TCP (see akr.cluster).
+
+The coordinator runs the program `a.py' on N nodes:
+
+    python3 -m akr -n N -l HOST:PORT a.py
+
+and every node joins it with:
+
+    python3 -m akr -j HOST:PORT [-H HOST]
+
+Nodes listen for the other nodes at HOST (127.0.0.1 by default: give the
+address of an interface other hosts reach to run on several hosts).
+
+All processes must share the key in the environment variable AKR_AUTHKEY,
+which authenticates every connection. The coordinator makes one up and
+prints it if it is not set.
+'''
+
+import os
+import sys
+import secrets
+from optparse import OptionParser
+
+from .cluster import Coordinator, run_node
+
+
+def address(s):
+    host, _, port = s.rpartition(':')
+    return host, int(port)
+
+
+usage = "usage: %prog [options] -n NODES program | %prog -j HOST:PORT"
+opts = OptionParser(usage=usage)
+
+opts.add_option('-n', '--nodes', type='int', dest='n_nodes',
+                metavar='NODES', default=1)
+opts.add_option('-l', '--listen', type='string', dest='listen',
+                metavar='HOST:PORT', default='127.0.0.1:0',
+                help='Address of the coordinator')
+opts.add_option('-j', '--join', type='string', dest='join',
+                metavar='HOST:PORT', help='Run a node of this coordinator')
+opts.add_option('-H', '--host', type='string', dest='host',
+                metavar='HOST', default='127.0.0.1',
+                help='Address the node listens at')
+opts.add_option('-b', '--batch-size', type='int', dest='batch_size',
+                metavar='BATCH_SIZE', default=64)
+
+if __name__ == '__main__':
+
+    (options, args) = opts.parse_args()
+
+    authkey = os.environ.get('AKR_AUTHKEY')
+
+    if options.join:
+        if not authkey:
+            opts.error('AKR_AUTHKEY is not set')
+
+        run_node(address(options.join), authkey.encode(), options.host)
+        sys.exit(0)
+
+    if len(args) != 1:
+        opts.error('Program is required')
+
+    with open(args[0]) as f:
+        source = f.read()
+
+    if not authkey:
+        authkey = secrets.token_hex(16)
+        print('AKR_AUTHKEY=%s' % authkey, file=sys.stderr)
+
+    coordinator = Coordinator(source, options.n_nodes,
+                              address(options.listen),
+                              batch_size=options.batch_size,
+                              authkey=authkey.encode())
+
+    print('Waiting for %d nodes at %s:%d' % ((options.n_nodes, )
+                                             + coordinator.address),
+          file=sys.stderr)
+
+    elapsed = coordinator.run()
+    print('Done in %.3f s' % elapsed, file=sys.stderr)
@@ -0,0 +1,247 @@
+import os
+import struct
+import weakref
+from multiprocessing import resource_tracker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .shm import SharedMemory
+
+__all__ = ['Arrays', 'Handle', 'available']
+
+
+_count = struct.Struct('q')
+
+
+def available():
+    return numpy is not None and SharedMemory is not None
+
+
+class Handle:
+    """Reference to an array in a shared memory block, sent instead of it."""
+
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.name, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.name, self.shape, self.dtype = state
+
+
+class Arrays:
+    """
+    Zero-copy passing of NumPy arrays between worker processes.
+
+    An array in an outgoing record is copied once into a shared memory block
+    and replaced by a Handle. The receiver maps the block and gets an array
+    backed by it, so forwarding that array again sends only the handle.
+
+    Arrays are thus passed by reference past the first copy, as they are
+    between boxes of the same worker: every receiver of a forwarded array
+    maps the same block, and sees what the others write to it. A box must
+    not modify an array it has sent on, and must copy an array it sends to
+    several statements if they modify it.
+
+    The block header holds the number of live references: every handle in
+    flight and every mapped array counts as one. A handle's reference passes
+    to the array it is mapped to; when the array is garbage collected the
+    count is decremented and the last reference unlinks the block. The
+    count is updated under `lock', a recursive lock shared by all workers
+    (a reference may be released by the garbage collector while it is held).
+    A process that is done with the arrays it mapped releases them at once
+    with release().
+
+    Every process that maps a block registers it with its resource tracker,
+    and the one unlinking it unregisters it. Create Arrays before starting
+    the worker processes: they then share the tracker of this process, so a
+    block unlinked by another process than its creator is not reported as
+    leaked.
+
+    Arrays smaller than `threshold' bytes are pickled as usual.
+    """
+
+    HEADER = 64
+
+    def __init__(self, lock, threshold=1024):
+        self.lock = lock
+        self.threshold = threshold
+
+        # id(array) -> handle and finalizer, for arrays mapped by this
+        # process.
+        self.mapped = {}
+        self.finalizers = {}
+
+        # Blocks of collected arrays, closed once their buffer is released.
+        self.closing = []
+
+        self.stats = {
+            'arrays_shared': 0,
+            'arrays_forwarded': 0,
+            'arrays_mapped': 0,
+            'bytes_shared': 0,
+        }
+
+        if os.name == 'posix':
+            resource_tracker.ensure_running()
+
+    def export(self, record):
+        """
+        Return `record' with large arrays replaced by handles, or None if
+        there are no such arrays.
+        """
+        if self.closing:
+            self._close()
+
+        record, found = self._export(record)
+        return record if found else None
+
+    def attach(self, record):
+        """Map the handles in `record' to arrays."""
+        return self._attach(record)
+
+    def release(self):
+        """
+        Release the references of all arrays mapped by this process, which
+        must not use them afterwards.
+        """
+        for finalizer in list(self.finalizers.values()):
+            finalizer()
+
+        self._close()
+
+    def _export(self, obj):
+        t = type(obj)
+
+        if t is numpy.ndarray:
+            if id(obj) in self.mapped:
+                return self._forward(obj), True
+            if obj.nbytes < self.threshold or obj.dtype.hasobject:
+                return obj, False
+            return self._share(obj), True
+
+        if t is tuple or t is list:
+            items = None
+
+            for i, x in enumerate(obj):
+                y, found = self._export(x)
+
+                if found:
+                    if items is None:
+                        items = list(obj)
+                    items[i] = y
+
+            if items is None:
+                return obj, False
+
+            return (tuple(items) if t is tuple else items), True
+
+        if t is dict:
+            items = None
+
+            for k, x in obj.items():
+                y, found = self._export(x)
+
+                if found:
+                    if items is None:
+                        items = dict(obj)
+                    items[k] = y
+
+            if items is None:
+                return obj, False
+
+            return items, True
+
+        return obj, False
+
+    def _forward(self, array):
+        # Already in shared memory: one more reference for the handle.
+        handle = self.mapped[id(array)]
+        shm = SharedMemory(name=handle.name)
+
+        with self.lock:
+            count = _count.unpack_from(shm.buf)[0]
+            _count.pack_into(shm.buf, 0, count + 1)
+
+        shm.close()
+
+        self.stats['arrays_forwarded'] += 1
+        return handle
+
+    def _share(self, array):
+        shm = SharedMemory(create=True, size=self.HEADER + array.nbytes)
+        _count.pack_into(shm.buf, 0, 1)
+
+        view = numpy.ndarray(array.shape, array.dtype, shm.buf, self.HEADER)
+        view[...] = array
+        del view
+
+        handle = Handle(shm.name, array.shape, array.dtype.str)
+        shm.close()
+
+        self.stats['arrays_shared'] += 1
+        self.stats['bytes_shared'] += array.nbytes
+        return handle
+
+    def _attach(self, obj):
+        t = type(obj)
+
+        if t is Handle:
+            return self._map(obj)
+
+        if t is tuple:
+            return tuple(self._attach(x) for x in obj)
+
+        if t is list:
+            return [self._attach(x) for x in obj]
+
+        if t is dict:
+            return {k: self._attach(x) for k, x in obj.items()}
+
+        return obj
+
+    def _map(self, handle):
+        shm = SharedMemory(name=handle.name)
+
+        array = numpy.ndarray(handle.shape, numpy.dtype(handle.dtype),
+                              shm.buf, self.HEADER)
+
+        self.mapped[id(array)] = handle
+        self.finalizers[id(array)] = weakref.finalize(array, self._release,
+                                                      id(array), shm)
+
+        self.stats['arrays_mapped'] += 1
+        return array
+
+    def _release(self, key, shm):
+        del self.mapped[key]
+        del self.finalizers[key]
+
+        with self.lock:
+            count = _count.unpack_from(shm.buf)[0] - 1
+            _count.pack_into(shm.buf, 0, count)
+
+        if count == 0:
+            shm.unlink()
+
+        # The array still holds the buffer while being finalized.
+        self.closing.append(shm)
+
+    def _close(self):
+        closing = []
+
+        for shm in self.closing:
+            try:
+                shm.close()
+            except BufferError:
+                closing.append(shm)
+
+        self.closing = closing
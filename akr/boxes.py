@@ -1,35 +1,86 @@
+from contextvars import ContextVar
+from inspect import iscoroutinefunction
+
+__all__ = ['transductor', 'inductor', 'reductor', 'join', 'output']
+
+
+# Boxes may be coroutine functions (`async def') except reductors; they are
+# run by the asyncio backend (see AsyncWorker), `coroutine' tells them apart.
+
+
+class Box:
+    """
+    Inductor or reductor. Its continuation (`cont') is kept in a context
+    variable, i.e. per thread and per asyncio task, as the workers of the
+    thread backend share boxes and an AsyncWorker runs several invocations
+    at a time.
+    """
+
+    def __init__(self, func, cat):
+        self.func = func
+        self.cat = cat
+        self.name = func.__name__
+        self.coroutine = iscoroutinefunction(func)
+        self._cont = ContextVar(self.name, default=None)
+
+    def __call__(self, channel, msg):
+        return self.func(msg)
+
+    @property
+    def cont(self):
+        return self._cont.get()
+
+    @cont.setter
+    def cont(self, value):
+        self._cont.set(value)
+
+
 def transductor(func):
     def run(channel, msg):
         return func(msg)
     run.cat = 'transductor'
     run.name = func.__name__
+    run.coroutine = iscoroutinefunction(func)
     return run
 
 
 def inductor(func):
-    def run(channel, msg):
-        return func(msg)
-    run.cat = 'inductor'
-    run.cont = None
-    run.name = func.__name__
-    return run
+    return Box(func, 'inductor')
 
 
-def reductor(ordered):
+def reductor(ordered, combine=None):
+    # An unordered reductor may give `combine', a function of two partial
+    # results (continuations) that returns their combination: the elements
+    # of a list are then folded by whichever worker holds them (see
+    # Partials). Without it, they are reduced in order by the owner of the
+    # list, as for ordered reductors.
     def getf(func):
-        def run(channel, msg):
-            return func(msg)
-        run.cat = 'reductor'
-        run.cont = None
+        if iscoroutinefunction(func):
+            raise TypeError('Reductor %s cannot be a coroutine function.'
+                            % func.__name__)
+
+        run = Box(func, 'reductor')
         run.ordered = ordered
-        run.name = func.__name__
+        run.combine = None if ordered else combine
         return run
     return getf
 
 
+def join(func):
+    # Transductor with several inputs, fired with a message from each.
+    def run(channel, msgs):
+        return func(*msgs)
+    run.cat = 'transductor'
+    run.ready = 'all'
+    run.name = func.__name__
+    run.coroutine = iscoroutinefunction(func)
+    return run
+
+
 def output(func):
     def run(channel, msg):
         return func(channel, msg)
     run.cat = 'output'
     run.name = func.__name__
+    run.coroutine = iscoroutinefunction(func)
     return run
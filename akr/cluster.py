@@ -0,0 +1,387 @@
+import queue
+import socket
+import threading
+import time
+from multiprocessing import current_process, AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from .plan import Plan, ROUTE_LABELS
+from .feeder import Feeder
+from .transport import Transport
+from .runtime import Worker, Runner
+from .utils import ids_fingerprint
+
+__all__ = ['Coordinator', 'Link', 'run_node', 'load_program']
+
+
+# Name a program is executed under, so that it does not run itself (akc
+# guards Runner.run with `if __name__ == '__main__'').
+PROGRAM_NAME = '__akr_program__'
+
+
+def load_program(source):
+    """Execute the source of a compiled program, return its namespace."""
+    scope = {'__name__': PROGRAM_NAME}
+    exec(compile(source, '<program>', 'exec'), scope)
+    return scope
+
+
+def _socket(conn):
+    # Socket of a connection (a duplicate of its descriptor).
+    return socket.socket(fileno=socket.dup(conn.fileno()))
+
+
+class Link:
+    """
+    Connection to another process of the net (see connect()). Objects put
+    on it are pickled and sent as messages, so it stands in for the inbound
+    queue of a remote worker.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+        with _socket(conn) as s:
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.lock = threading.Lock()
+
+    def put(self, obj):
+        with self.lock:
+            self.conn.send(obj)
+
+    def frames(self):
+        """Received objects, until the connection is closed."""
+        while True:
+            try:
+                yield self.conn.recv()
+            except (EOFError, OSError):
+                return
+
+    def close(self):
+        # Shut down first: a reader blocked on the connection gets end of
+        # file.
+        try:
+            with _socket(self.conn) as s:
+                s.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self.conn.close()
+
+
+# Connections are authenticated with a key shared by all processes of a net
+# (an HMAC challenge, see multiprocessing.connection) before anything is
+# unpickled. The key is that of the current process by default, which child
+# processes inherit.
+
+
+def connect(address, authkey=None):
+    """Link to the listener at `address'."""
+    if authkey is None:
+        authkey = current_process().authkey
+
+    return Link(Client(tuple(address), 'AF_INET', authkey))
+
+
+def listen(address, authkey=None, backlog=16):
+    if authkey is None:
+        authkey = current_process().authkey
+
+    return Listener(tuple(address), 'AF_INET', backlog, authkey)
+
+
+class Credits:
+    """Feeder credits of a node, given back to the coordinator."""
+
+    def __init__(self, link):
+        self.link = link
+
+    def release(self):
+        self.link.put(('credit', ))
+
+
+def pump(frames, inbound, end=None):
+    for batch in frames:
+        inbound.put(batch)
+
+    if end is not None:
+        inbound.put(end)
+
+
+def accept(listener, inbound):
+    # Records from the other nodes.
+    while True:
+        try:
+            conn = listener.accept()
+        except AuthenticationError:
+            # Not one of ours.
+            continue
+        except OSError:
+            # Closed.
+            return
+
+        frames = Link(conn).frames()
+
+        threading.Thread(target=pump, args=(frames, inbound),
+                         daemon=True).start()
+
+
+def run_node(address, authkey=None, host='127.0.0.1'):
+    """
+    Join the coordinator at `address' (host, port) as a worker, and run
+    until the coordinator stops the net. Other nodes connect to this one
+    at `host'. All of them share the key `authkey' (see connect()).
+    """
+    coordinator = connect(address, authkey)
+    frames = coordinator.frames()
+
+    listener = listen((host, 0), authkey)
+
+    coordinator.put(('join', listener.address, ids_fingerprint()))
+
+    setup = next(frames, None)
+
+    if setup is None:
+        # Refused (see Coordinator.connect), or the coordinator is gone.
+        listener.close()
+        coordinator.close()
+        return
+
+    _, wid, peers, source, channels, options, seed = setup
+
+    plan = Plan(load_program(source)['cfg'])
+
+    # Same channel ids as in the feeder.
+    for channel in channels:
+        plan.intern(channel)
+
+    if ROUTE_LABELS in plan.route and hash(PROGRAM_NAME) != seed:
+        raise RuntimeError('Synch tables are routed by the hash of their '
+                           'labels: run all nodes with the PYTHONHASHSEED '
+                           'of the coordinator.')
+
+    inbound = queue.Queue()
+
+    threading.Thread(target=accept, args=(listener, inbound),
+                     daemon=True).start()
+
+    # The worker stops once the coordinator is gone.
+    reader = threading.Thread(target=pump,
+                              args=(frames, inbound, [('stop', )]),
+                              daemon=True)
+    reader.start()
+
+    queues = [inbound if i == wid else connect(peer, authkey)
+              for i, peer in enumerate(peers)]
+
+    transport = Transport(wid, queues, options['batch_size'])
+
+    worker = Worker(wid, plan, [], transport, coordinator,
+                    options['induction_burst'], options['stealing'],
+                    Credits(coordinator), options['join_limit'],
+                    options['quantum'], options['poll_timeout'])
+
+    try:
+        worker.run()
+
+    except OSError:
+        # Reports to a coordinator that is gone.
+        reader.join(Runner.STOP_TIMEOUT)
+
+        if reader.is_alive():
+            raise
+
+    finally:
+        for q in queues:
+            if q is not inbound:
+                q.close()
+
+        listener.close()
+        coordinator.close()
+
+
+class Coordinator(Runner):
+    """
+    Runs a compiled program on workers of other processes or hosts (nodes)
+    that talk over TCP.
+
+    Nodes connect to `address' (see run_node) with the key `authkey' (by
+    default that of the current process) and are given a worker id, the
+    addresses of the other nodes and the source of the program, which they
+    execute to build the same plan. Workers exchange the records of
+    the process runtime (Message.dump() etc.) over a connection per pair of
+    nodes. The coordinator streams the input to the nodes and detects
+    termination as Runner does.
+
+    List identifiers are hashes of tuples, which differ between Python
+    versions: the run fails if a node computes other identifiers than the
+    coordinator (see akr.utils.ids_fingerprint).
+
+    Input channels are those of `__input__', by default the one of the
+    program.
+    """
+
+    def __init__(self, source, n_nodes, address=('127.0.0.1', 0),
+                 __input__=None, induction_burst=16, stealing=True,
+                 batch_size=64, window=4, join_limit=1 << 16, quantum=64,
+                 poll_timeout=0.1, authkey=None):
+
+        # No local workers: Runner only lends its termination detection.
+        self.source = source
+        self.n_nodes = n_nodes
+
+        program = load_program(source)
+
+        if __input__ is None:
+            __input__ = program['__input__']
+
+        self.plan = Plan(program['cfg'])
+        self.input = __input__
+
+        self.options = {
+            'induction_burst': induction_burst,
+            'stealing': stealing,
+            'batch_size': batch_size,
+            'join_limit': join_limit,
+            'quantum': quantum,
+            'poll_timeout': poll_timeout,
+        }
+
+        self.window = window
+
+        self.server = listen(address, authkey, n_nodes)
+        self.address = self.server.address
+
+        self.links = None
+        self.readers = None
+        self.feeder = None
+        self.rings = None
+
+        self.reports = queue.Queue()
+        self._stats = {}
+        self.errors = {}
+
+    def connect(self):
+        # Wait for all nodes and send them their setup.
+        links = []
+        frames = []
+        peers = []
+        fingerprints = []
+
+        while len(links) < self.n_nodes:
+            try:
+                conn = self.server.accept()
+            except AuthenticationError:
+                continue
+
+            link = Link(conn)
+            f = link.frames()
+            _, peer, ids = next(f)
+
+            links.append(link)
+            frames.append(f)
+            peers.append(peer)
+            fingerprints.append(ids)
+
+        self.server.close()
+
+        for wid, ids in enumerate(fingerprints):
+            if ids != ids_fingerprint():
+                for link in links:
+                    link.close()
+
+                raise RuntimeError('Node %d makes other list identifiers: run '
+                                   'all nodes with the Python version of the '
+                                   'coordinator.' % wid)
+
+        credits = [threading.Semaphore(self.window) for _ in links]
+
+        # Channels are interned here, before the setup is sent.
+        self.feeder = Feeder(self.plan, self.input, links, credits, None,
+                             self.options['batch_size'], self.check)
+
+        channels = list(self.input)
+
+        for wid, link in enumerate(links):
+            link.put(('setup', wid, peers, self.source, channels,
+                      self.options, hash(PROGRAM_NAME)))
+
+        self.links = links
+        self.readers = [threading.Thread(target=self.receive,
+                                         args=(f, credits[wid]), daemon=True)
+                        for wid, f in enumerate(frames)]
+
+        for t in self.readers:
+            t.start()
+
+    def receive(self, frames, credits):
+        # Credits and reports of a node.
+        for r in frames:
+            if r[0] == 'credit':
+                credits.release()
+            else:
+                self.reports.put(r)
+
+    def run(self):
+        """
+        Wait for the nodes, then run the net until it is quiescent and stop
+        the nodes. Return the time it took to get quiescent in seconds.
+        """
+        self.connect()
+
+        start = time.perf_counter()
+
+        try:
+            self.feeder.run()
+            self.wait()
+
+            self.elapsed = time.perf_counter() - start
+
+            self.stop()
+
+        except BaseException:
+            # Do not leave the other nodes running.
+            self.stop(self.STOP_TIMEOUT)
+            raise
+
+        finally:
+            for link in self.links:
+                link.close()
+
+        return self.elapsed
+
+    def stop(self, timeout=None):
+        """
+        Stop the nodes and wait (at most `timeout' seconds if given) for them
+        to close their connection after their final report.
+        """
+        for link in self.links:
+            try:
+                link.put([('stop', )])
+            except OSError:
+                # Gone already.
+                pass
+
+        if timeout is not None:
+            timeout += time.perf_counter()
+
+        for t in self.readers:
+            t.join(None if timeout is None
+                   else max(timeout - time.perf_counter(), 0))
+
+        self.stats()
+
+    def check(self):
+        # Raise if a node is gone.
+        for wid, t in enumerate(self.readers):
+            if t.is_alive():
+                continue
+
+            self.stats()
+
+            if wid in self.errors:
+                raise RuntimeError('Node %d failed: %s'
+                                   % (wid, self.errors[wid]))
+
+            raise RuntimeError('Node %d disconnected.' % wid)
@@ -0,0 +1,120 @@
+from itertools import islice, count
+
+from .stream import Stream, Events
+
+__all__ = ['Feeder']
+
+
+class Feeder:
+    """
+    Streams the input of a program to the workers.
+
+    Input channels (nested sequences, or flat event streams wrapped in
+    Events) are read lazily and in turn, `batch_size' messages at a time,
+    so the first outputs may appear before the input is exhausted.
+    Messages are dealt to the workers in turn and sent in batches as
+    ('input', records) records on their inbound queues. Messages to routed
+    statements (see Plan.route) go straight to their worker, which keeps
+    their order.
+
+    Every worker has `window' credits: a batch takes one, and the worker
+    gives it back once the tasks it queued have been taken up (see
+    Worker.event_loop). The feeder waits for a credit of the worker whose
+    batch is full; this bounds the memory held by the input in flight.
+    A dead worker gives back no credits: while waiting, the feeder calls
+    `check' (if given) every CHECK_INTERVAL seconds, which is to raise if
+    a worker is gone.
+    """
+
+    CHECK_INTERVAL = 1.
+
+    def __init__(self, plan, sources, queues, credits, bells=None,
+                 batch_size=64, check=None):
+        self.plan = plan
+        self.queues = queues
+        self.credits = credits
+        self.bells = bells
+        self.batch_size = batch_size
+        self.check = check
+
+        self.n_workers = len(queues)
+
+        # Per channel: (interned channel, entry pc, route, message generator).
+        self.sources = []
+
+        # Outermost lists of all channels are numbered apart.
+        outer_ids = count()
+
+        for channel, seq in sources.items():
+            stream = Stream(outer_ids)
+
+            if isinstance(seq, Events):
+                msgs = stream.scan(seq)
+            else:
+                msgs = stream.iter(seq)
+
+            pc = plan.entry[channel]
+
+            self.sources.append((plan.intern(channel), pc, plan.route[pc],
+                                 msgs))
+
+        self.stats = {'input_batches': 0, 'input_messages': 0}
+
+    def run(self):
+        n = self.n_workers
+        batches = [[] for _ in range(n)]
+        wid = 0
+
+        sources = list(self.sources)
+
+        while sources:
+            for source in list(sources):
+                channel, pc, route, stream = source
+                count = 0
+
+                for msg in islice(stream, self.batch_size):
+                    msg.set_loc(channel, pc)
+                    count += 1
+
+                    dst = route and self.plan.owner(msg, n)
+
+                    if dst is None:
+                        dst = wid
+                        wid = (wid + 1) % n
+
+                    batches[dst].append(msg.dump())
+
+                    if len(batches[dst]) == self.batch_size:
+                        self.put(dst, batches[dst])
+                        batches[dst] = []
+
+                if count < self.batch_size:
+                    sources.remove(source)
+
+        for wid in range(n):
+            if batches[wid]:
+                self.put(wid, batches[wid])
+
+            # End of input.
+            self.queues[wid].put([('input', None)])
+            self.ring(wid)
+
+    def put(self, wid, batch):
+        while not self.credits[wid].acquire(True, self.CHECK_INTERVAL):
+            if self.check is not None:
+                self.check()
+
+        self.queues[wid].put([('input', batch)])
+        self.ring(wid)
+
+        self.stats['input_batches'] += 1
+        self.stats['input_messages'] += len(batch)
+
+    def ring(self, wid):
+        # Wake up a worker sleeping on its shared-memory rings.
+        if self.bells is not None:
+            bells, sleeping = self.bells
+
+            if sleeping[wid]:
+                sleeping[wid] = 0
+                bells[wid].release()
@@ -0,0 +1,131 @@
+from collections import deque
+
+__all__ = ['ANY', 'ALL', 'vertex_owner', 'merge_brackets', 'Joins']
+
+
+# Readiness of a statement with several inputs (the `ready' attribute of
+# its box): fired by every message on any input, or once there is a message
+# on each of them.
+ANY = 'any'
+ALL = 'all'
+
+
+def vertex_owner(pc, n_workers):
+    """Worker hosting the input buffers of the statement `pc'."""
+    return pc % n_workers
+
+
+def merge_brackets(msgs):
+    """
+    Bracket of a message made from `msgs': the one closing the most lists
+    (0 closes all of them, None none).
+    """
+    brackets = [m.bracket for m in msgs if m.bracket is not None]
+
+    if not brackets:
+        return None
+
+    if 0 in brackets:
+        return 0
+
+    return max(brackets)
+
+
+class Joins:
+    """
+    Input buffers of the multi-input statements hosted by a worker.
+
+    Messages of the inputs are paired by their position in the input lists,
+    i.e. by the indices of their id (list identifiers differ between the
+    channels): a statement fires once there is a message with the same
+    position on each of its inputs. Messages arrive in any order, as
+    workers steal and batch them, so pairing them by arrival would mix up
+    elements of different lists. A bitmask of the non-empty buffers is kept
+    per position, so readiness is a single comparison with the mask of all
+    inputs.
+
+    A statement holds at most `limit' messages per input: one that receives
+    far more messages on one input than on another is reported with an
+    OverflowError instead of growing without bound.
+    """
+
+    def __init__(self, plan, limit=None):
+        self.plan = plan
+        self.limit = limit
+
+        # pc -> {position: [bitmask of non-empty deques, deque per input
+        # port, ...]}
+        self.buffers = {}
+
+        # pc -> [number of messages buffered per input port]
+        self.counts = {}
+
+        self.stats = {'joins': 0, 'join_buffered': 0}
+
+    def __len__(self):
+        return self.stats['join_buffered']
+
+    def put(self, task):
+        """
+        Buffer `task'. Return the messages to fire the statement with (one
+        per input port) if it is ready, otherwise None. The first one gets
+        the merged bracket of all (see merge_brackets), as the output is
+        made from it.
+        """
+        pc = task.pc
+        inputs = self.plan.inputs[pc]
+        port = inputs.index(task.channel)
+
+        buffers = self.buffers.get(pc)
+
+        if buffers is None:
+            buffers = self.buffers[pc] = {}
+            self.counts[pc] = [0] * len(inputs)
+
+        counts = self.counts[pc]
+
+        if self.limit is not None and counts[port] >= self.limit:
+            box = self.plan.boxes[self.plan.box[pc]]
+            raise OverflowError('Input buffer of channel %s of %s is full'
+                                % (self.plan.channels[task.channel],
+                                   getattr(box, 'name', box)))
+
+        position = task.id[1::2]
+        entry = buffers.get(position)
+
+        if entry is None:
+            entry = buffers[position] = [0] + [deque() for _ in inputs]
+
+        entry[port + 1].append(task)
+        counts[port] += 1
+        self.stats['join_buffered'] += 1
+
+        mask = entry[0] | (1 << port)
+
+        if mask != (1 << len(inputs)) - 1:
+            entry[0] = mask
+            return None
+
+        slots = entry[1:]
+        msgs = tuple(slot.popleft() for slot in slots)
+
+        mask = 0
+
+        for i, slot in enumerate(slots):
+            if slot:
+                mask |= 1 << i
+
+        if mask:
+            entry[0] = mask
+        else:
+            del buffers[position]
+
+        for i in range(len(inputs)):
+            counts[i] -= 1
+
+        msgs[0].bracket = merge_brackets(msgs)
+
+        self.stats['joins'] += 1
+        self.stats['join_buffered'] -= len(inputs)
+
+        return msgs
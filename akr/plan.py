@@ -0,0 +1,138 @@
+from .joins import ANY, ALL, vertex_owner
+from .reduction import owner
+from .syncs import table_key
+
+__all__ = ['Plan', 'ROUTE_LIST', 'ROUTE_VERTEX', 'ROUTE_LABELS']
+
+
+# Routes of input messages (see Plan.route).
+ROUTE_LIST = 1
+ROUTE_VERTEX = 2
+ROUTE_LABELS = 3
+
+
+class Plan:
+    """
+    Execution plan: the control-flow graph flattened into integer-indexed
+    lists.
+
+    Statements of all basic blocks are laid out contiguously, so a program
+    counter is a single integer indexing `box', `inputs', `outputs' and
+    `succ'. Channels and box functions are interned to integers as well:
+    messages carry only small ints for their location.
+    """
+
+    def __init__(self, cfg):
+
+        # Interned names.
+        self.channels = []
+        self.channel_ids = {}
+        self.boxes = []
+        box_ids = {}
+
+        # pc -> interned statement.
+        self.box = []
+        self.inputs = []
+        self.outputs = []
+
+        # pc -> next pc for each output port (-1 if the channel is dangling).
+        self.succ = []
+
+        # pc -> route of the input messages: elements of a list reduced in
+        # order (by a reductor without `combine') go to the owner of the list
+        # (ROUTE_LIST), inputs of a stateful statement (a join or a
+        # synchroniser) to the worker hosting it (ROUTE_VERTEX), those of a
+        # synch table to the worker hosting the instance of their label
+        # values (ROUTE_LABELS), others are not routed (None).
+        self.route = []
+
+        if cfg.dispatch is None:
+            cfg.build_dispatch()
+
+        block_pc = {}
+
+        for bb_name, attrs in cfg.nodes(data=True):
+            block_pc[bb_name] = len(self.box)
+
+            for func, inputs, outputs in attrs['stmts']:
+
+                if id(func) not in box_ids:
+                    box_ids[id(func)] = len(self.boxes)
+                    self.boxes.append(func)
+
+                self.box.append(box_ids[id(func)])
+                self.inputs.append(tuple(map(self.intern, inputs)))
+                self.outputs.append(tuple(map(self.intern, outputs)))
+
+        for bb_name, attrs in cfg.nodes(data=True):
+            for index, (_, _, outputs) in enumerate(attrs['stmts']):
+                succ = []
+
+                for channel in outputs:
+                    next_pc = cfg.dispatch.get((bb_name, index, channel))
+
+                    if next_pc is None:
+                        succ.append(-1)
+                    else:
+                        next_bb, next_index = next_pc
+                        succ.append(block_pc[next_bb] + next_index)
+
+                self.succ.append(tuple(succ))
+
+        for pc, b in enumerate(self.box):
+            func = self.boxes[b]
+
+            if getattr(func, 'cat', None) == 'reductor' \
+                    and len(self.inputs[pc]) > 1:
+                # The elements of a list come from a single channel.
+                raise ValueError(
+                    'Reductor %s has %d inputs, reductors with several '
+                    'inputs are not supported' % (getattr(func, 'name', func),
+                                                   len(self.inputs[pc])))
+
+            self.route.append(self._route(func, self.inputs[pc]))
+
+        self.entry = {channel: block_pc[bb]
+                      for channel, bb in cfg.entry.items()}
+
+    @staticmethod
+    def _route(func, inputs):
+        cat = getattr(func, 'cat', None)
+
+        if cat == 'reductor' and func.combine is None:
+            return ROUTE_LIST
+
+        if cat == 'sync':
+            return ROUTE_LABELS if getattr(func, 'labels', None) \
+                else ROUTE_VERTEX
+
+        if len(inputs) > 1 and getattr(func, 'ready', ANY) == ALL:
+            return ROUTE_VERTEX
+
+        return None
+
+    def intern(self, channel):
+        if channel not in self.channel_ids:
+            self.channel_ids[channel] = len(self.channels)
+            self.channels.append(channel)
+
+        return self.channel_ids[channel]
+
+    def __len__(self):
+        return len(self.box)
+
+    def owner(self, m, n_workers):
+        """Worker that must run the message `m', or None if any may."""
+        route = self.route[m.pc]
+
+        if route == ROUTE_LIST:
+            return owner(m.id[:-1], n_workers)
+
+        elif route == ROUTE_VERTEX:
+            return vertex_owner(m.pc, n_workers)
+
+        elif route == ROUTE_LABELS:
+            labels = self.boxes[self.box[m.pc]].labels
+            return owner(table_key(labels, m.content), n_workers)
+
+        return None
@@ -0,0 +1,151 @@
+__all__ = ['owner', 'Sessions', 'Partials']
+
+
+def owner(list_id, n_workers):
+    """
+    Worker that owns the reduction of the list `list_id'. List identifiers
+    are tuples of ints, so the hash is the same in every worker process.
+    """
+    return hash(list_id) % n_workers
+
+
+class Sessions:
+    """
+    Reduction state of the lists owned by a single worker.
+
+    All elements of a list are routed to its owner, hence the partial result
+    and the elements that arrived ahead of their turn are kept locally and
+    resuming a reduction never involves other processes.
+    """
+
+    def __init__(self):
+        # list_id -> [next index, partial result]
+        self.sessions = {}
+
+        # list_id + (index,) -> suspended task
+        self.suspended = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def acquire(self, task):
+        """
+        Return the session of the list `task' belongs to if the task is the
+        next element to reduce, otherwise suspend the task and return None.
+        """
+        index = task.id[-1]
+        list_id = task.id[:-1]
+
+        session = self.sessions.get(list_id)
+
+        if session is None:
+            session = [0, None]
+
+            if index == 0:
+                self.sessions[list_id] = session
+
+        if session[0] != index:
+            self.suspended[task.id] = task
+            return None
+
+        return session
+
+    def release(self, task, cont):
+        """
+        Save the partial result after `task' was reduced and return the
+        suspended successor if it has already arrived.
+        """
+        index = task.id[-1]
+        list_id = task.id[:-1]
+
+        session = self.sessions[list_id]
+        session[0] = index + 1
+        session[1] = cont
+
+        return self.suspended.pop(list_id + (index + 1, ), None)
+
+    def close(self, task):
+        del self.sessions[task.id[:-1]]
+
+
+class Partials:
+    """
+    Partial aggregation of unordered (commutative) reductions.
+
+    Every worker folds the elements of a list it happens to hold into a local
+    partial result, regardless of their order. Partials are sent to the owner
+    of the list which merges them with the `combine' function of the reductor
+    (see akr.reductor) and completes the reduction once the number of folded
+    elements reaches the length of the list. The length is known from the
+    index of the element carrying the closing bracket.
+
+    A partial is a list [count, cont, length, bracket, id, pc], where `id'
+    and `pc' are those of the message the reduction produces.
+    """
+
+    def __init__(self):
+        # list_id -> partial folded by this worker
+        self.local = {}
+
+        # list_id -> partials combined by the owner
+        self.combined = {}
+
+    def __len__(self):
+        return len(self.local)
+
+    def fold(self, func, task):
+        """
+        Fold an element into the local partial. Return True if the element
+        closes its list.
+        """
+        list_id = task.id[:-1]
+
+        partial = self.local.get(list_id)
+
+        if partial is None:
+            partial = [0, None, None, None, task.id_down(0), task.pc]
+            self.local[list_id] = partial
+
+        func.cont = partial[1]
+        func(task.channel, task.content)
+
+        partial[0] += 1
+        partial[1] = func.cont
+
+        if task.bracket is not None:
+            partial[2] = task.id[-1] + 1
+            partial[3] = task.bracket
+            return True
+
+        return False
+
+    def take(self, list_id):
+        return self.local.pop(list_id, None)
+
+    def take_all(self):
+        local = self.local
+        self.local = {}
+        return local.items()
+
+    def combine(self, func, list_id, partial):
+        """
+        Fold a partial into the combined result of the list. Return the
+        result if the reduction is complete, otherwise None.
+        """
+        acc = self.combined.get(list_id)
+
+        if acc is None:
+            acc = self.combined[list_id] = list(partial)
+
+        else:
+            acc[0] += partial[0]
+            acc[1] = func.combine(acc[1], partial[1])
+
+            if partial[2] is not None:
+                acc[2:4] = partial[2:4]
+
+        if acc[0] == acc[2]:
+            del self.combined[list_id]
+            return acc
+
+        return None
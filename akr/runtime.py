@@ -1,19 +1,66 @@
+import time
+import queue
+import random
+import asyncio
+import warnings
+import threading
 from collections import deque
-from itertools import chain
 
-from multiprocessing import Process, Queue, Manager, Lock
-from queue import Empty as Empty
-from .stream import Stream, Message
-from . import utils
+from multiprocessing import Process, Queue, RLock, Semaphore
+from .stream import Message, Continuation, load
+from .plan import Plan
+from .reduction import Sessions, Partials, owner
+from .transport import Transport, RingTransport, Empty
+from .feeder import Feeder
+from .joins import Joins, ANY, vertex_owner
+from .syncs import Syncs
+from .shm import SharedMemory
+from . import arrays
 
 import networkx as nx
 
-__all__ = ['DiGraph', 'Worker', 'Runner']
+__all__ = ['DiGraph', 'Plan', 'Transport', 'RingTransport', 'Worker',
+           'AsyncWorker', 'Runner']
 
 
 class DiGraph(nx.DiGraph):
 
+    # Successor table: (bb_name, index, channel) -> next pc.
+    dispatch = None
+
+    def build_dispatch(self):
+        # The graph itself is only traversed here, at load time, so that the
+        # worker resolves the next vertex with a single dict lookup.
+        dispatch = {}
+
+        for bb_name, attrs in self.nodes(data=True):
+            for index, (_, _, outputs) in enumerate(attrs['stmts']):
+                for channel in outputs:
+                    try:
+                        next_pc = self._next_pc_scan((bb_name, index), channel)
+                    except AssertionError:
+                        # Dangling channel: report it on the actual send.
+                        continue
+
+                    dispatch[bb_name, index, channel] = next_pc
+
+        self.dispatch = dispatch
+
     def next_pc(self, old_pc, channel):
+        if self.dispatch is None:
+            return self._next_pc_scan(old_pc, channel)
+
+        bb_name, index = old_pc
+
+        try:
+            return self.dispatch[bb_name, index, channel]
+
+        except KeyError as ke:
+            raise AssertionError(
+                'Cannot find appropriate basic block'
+            ) from ke
+
+    def _next_pc_scan(self, old_pc, channel):
         bb_name, index = old_pc
         bb_stmts = self.node[bb_name]['stmts']
 
@@ -42,245 +89,1021 @@ class DiGraph(nx.DiGraph):
 
 class Worker:
 
-    def __init__(self, wid, cfg, tasks, queues):
+    def __init__(self, wid, plan, tasks, transport, reports=None,
+                 induction_burst=16, stealing=True, credits=None,
+                 join_limit=None, quantum=64, poll_timeout=0.1):
 
         self.wid = wid
         self.nonce = 0
-        self.cfg = cfg
-        self.queues = queues
-        self.n_workers = len(queues)
+        self.plan = plan
+        self.transport = transport
+        self.reports = reports
+        self.n_workers = transport.n_workers
+
+        self.induction_burst = induction_burst
+
+        # Tasks run between two polls of the inbound queue, and the longest
+        # wait for inbound records when idle (None for no limit).
+        self.quantum = quantum
+        self.poll_timeout = poll_timeout
 
         self.tasks = deque(tasks)
-        self.tasks_suspended = {}
+
+        # Work stealing: victim of the pending steal request (if any), and
+        # the backoff after unsuccessful requests.
+        self.stealing = stealing and self.n_workers > 1
+        self.victim = None
+        self.backoff = self.BACKOFF_MIN
+        self.steal_after = 0.
+
+        # Input streaming: credits of the feeder (see akr.feeder) held by
+        # this worker, and whether the input is exhausted.
+        self.credits = credits
+        self.owed = 0
+        self.input_done = credits is None
+
+        # Termination detection (see Runner.wait): records received from
+        # other workers, the pending probe of the runner, and whether to
+        # stop.
+        self.received = 0
+        self.probe = None
+        self.stopped = False
+
+        self.stats = {
+            'tasks': 0,
+            'steal_requests': 0,
+            'steals': 0,
+            'stolen_tasks': 0,
+            'given_tasks': 0,
+            'polls': 0,
+            'empty_polls': 0,
+            'blocked_time': 0.,
+            'cpu_time': 0.,
+            'uptime': 0.,
+        }
+        self._reported = None
+
+        # Reductions of the lists owned by this worker.
+        self.sessions = Sessions()
+        self.partials = Partials()
+
+        # Input buffers of the multi-input statements hosted here.
+        self.joins = Joins(plan, join_limit)
+
+        # Synchronisers hosted here.
+        self.syncs = Syncs(plan)
+
+        self.route = plan.route
+
+    # CPU time of the worker: time.thread_time for the thread backend.
+    cpu_clock = time.process_time
+
+    BACKOFF_MIN = 0.001
+    BACKOFF_MAX = 0.1
+
+    # Ask for more input when fewer tasks are queued.
+    INPUT_LOW = 64
 
     @property
     def is_ready(self):
+        # There are tasks to run now.
         return bool(self.tasks)
 
+    @property
+    def is_idle(self):
+        # There is nothing left to do until records come in.
+        return not self.tasks
+
     def event_loop(self):
+        # Take in all inbound records, then let run() execute a quantum of
+        # tasks. Block (at most `poll_timeout' seconds at a time) only when
+        # there is nothing to do locally.
 
         while True:
-            try:
-                is_blocked = not self.is_ready
-                r = self.queues[self.wid].get(is_blocked)
-            except Empty:
-                break
+            if self.owed and len(self.tasks) < self.INPUT_LOW:
+                self.owed -= 1
+                self.credits.release()
 
-            if r[0] == 'msg':
-                m = Message(*r[1:4])
+            if self.is_idle:
+                # Going idle: hand over partial reductions.
+                self.flush_partials()
 
-                channel, pc = r[4:]
-                m.set_loc(channel, pc)
+            if self.is_idle:
+                self.idle()
 
-                self.tasks.append(m)
+                # Do not keep partially filled batches while waiting.
+                self.transport.flush()
 
-            elif r[0] == 'wakeup':
-                self.tasks.append(self.tasks_suspended[r[1]])
+                if self.probe is not None:
+                    self.answer()
 
-            # print('New req at worker %d: %s' % (self.wid, r))
+            is_blocked = not self.is_ready
+            self.stats['polls'] += 1
 
-        return True
+            if is_blocked:
+                timeout = self.poll_timeout
 
-    def send(self, wid, data):
-        self.queues[wid].put(data)
+                if self.stealing:
+                    timeout = self.backoff if timeout is None \
+                        else min(self.backoff, timeout)
 
-    def run(self, sessions, session_lock):
+                t = time.perf_counter()
+                records = self.block(timeout)
+                self.stats['blocked_time'] += time.perf_counter() - t
 
-        while self.event_loop():
+            else:
+                try:
+                    records = self.transport.recv_all(False)
+                except Empty:
+                    records = None
 
-            task = self.tasks.popleft()
+            if records is None:
+                self.stats['empty_polls'] += 1
 
-            # Sanity check for id completeness.
-            assert not (len(task.id) % 2)
+                if is_blocked:
+                    # Nothing has come in time, maybe it's time to steal.
+                    continue
 
-            bb_name, index = task.pc
-            bb_stmts = self.cfg.node[bb_name]['stmts']
-            func, inputs, outputs = bb_stmts[index]
+                return True
 
-            if len(inputs) == 1:
-                # Execute vertex
-                assert inputs[0] == task.channel
+            for r in records:
+                self.handle(r)
 
-                if func.cat == 'transductor':
+            if self.stopped:
+                self.report(final=True)
+                return False
 
-                    output = func(task.channel, task.content)
+            if self.is_ready:
+                return True
 
-                    # For now expect transductors eager to have easier bracket
-                    # handling.
-                    assert len(outputs) == len(output)
+    def block(self, timeout):
+        # Wait for inbound records at most `timeout' seconds, return them or
+        # None.
+        try:
+            return self.transport.recv_all(True, timeout)
+        except Empty:
+            return None
 
-                    for port, (channel, msg) in enumerate(zip(outputs, output)):
+    def handle(self, r):
+        # Process an inbound record.
+        if r[0] not in ('input', 'probe', 'stop'):
+            self.received += 1
 
-                        next_pc = self.cfg.next_pc(task.pc, channel)
+        if r[0] in ('msg', 'cont'):
+            self.tasks.append(load(r))
 
-                        m = Message(msg, task.id_eye(port), task.bracket)
-                        m.set_loc(channel, next_pc)
+        elif r[0] == 'input':
+            if r[1] is None:
+                self.input_done = True
+            else:
+                self.tasks.extend(map(load, r[1]))
+                self.owed += 1
 
-                        self.tasks.append(m)
+        elif r[0] == 'steal':
+            self.give(r[1])
 
-                elif func.cat == 'inductor':
+        elif r[0] == 'stolen':
+            self.victim = None
 
-                    output = func(task.channel, task.content)
+            if r[1]:
+                self.tasks.extend(map(load, r[1]))
+                self.stats['steals'] += 1
+                self.stats['stolen_tasks'] += len(r[1])
+                self.backoff = self.BACKOFF_MIN
 
-                    # Lists corresponding to outputs of each port.
-                    seqs = ([item] for item in output)
+            else:
+                self.steal_after = time.perf_counter() + self.backoff
+                self.backoff = min(2 * self.backoff, self.BACKOFF_MAX)
 
-                    # Iterate inductor until continuation is not issues.
-                    # NOTE: in current implementation the whole sequence is
-                    # generated in one execution step while originally it was
-                    # supposed to output it `lazyly'.
-                    while func.cont:
-                        output = func(None, func.cont)
-                        seqs = map(lambda a, b: a + [b], seqs, output)
+        elif r[0] == 'partial':
+            self.combine_partial(r[1], r[2:])
 
-                    # --
+        elif r[0] == 'close':
+            self.flush_partials(r[1])
 
-                    task_seqs = tuple([] for i in outputs)
+        elif r[0] == 'probe':
+            self.probe = r[1]
 
-                    for port, (channel, seq, ts) in enumerate(zip(outputs, seqs, task_seqs)):
+        elif r[0] == 'stop':
+            self.stopped = True
 
-                        next_pc = self.cfg.next_pc(task.pc, channel)
+    def answer(self):
+        # Reply to a probe of the runner once idle: records sent to and
+        # received from other workers so far, whether the input is
+        # exhausted, the reductor tasks suspended, the reductions started
+        # but not complete and the messages buffered by joins here.
+        self.reports.put(('probe', self.wid, self.probe,
+                          self.transport.stats['records_sent'],
+                          self.received, self.input_done,
+                          len(self.sessions.suspended),
+                          len(self.sessions) + len(self.partials.combined),
+                          len(self.joins)))
+        self.probe = None
 
-                        for index, msg in enumerate(seq):
+    def send(self, wid, data, urgent=False):
+        self.transport.send(wid, data, urgent)
 
-                            m = Message(msg, task.id_up(port, index))
-                            m.set_loc(channel, next_pc)
+    def idle(self):
+        # Nothing to do locally: publish statistics and ask a random worker
+        # to share its tasks unless a request is already pending.
+        self.report()
 
-                            ts.append(m)
+        if not self.stealing or self.victim is not None:
+            return
 
-                        ts[-1].sm_inc(task.bracket)
-                        #print(ts[-1], ts[-1].content)
+        if time.perf_counter() < self.steal_after:
+            return
 
-                    # TODO: proper task distribution. Critical part of
-                    # performance, implement something more sophisticated.
-                    tasks_parted = utils.partition(chain(*task_seqs),
-                                                   self.n_workers)
+        victim = random.randrange(self.n_workers - 1)
+        self.victim = victim + (victim >= self.wid)
 
-                    self.tasks.extend(tasks_parted[self.wid])
+        self.send(self.victim, ('steal', self.wid), urgent=True)
+        self.stats['steal_requests'] += 1
 
-                    for wid, tasks in enumerate(tasks_parted):
-                        if wid != self.wid:
-                            for t in tasks:
-                                self.send(wid, t.dump())
+    def give(self, thief):
+        # Serve a steal request: hand over half of the queued tasks from the
+        # tail of the deque. Routed tasks (see Plan.route) stay here.
+        n = len(self.tasks) // 2
 
-                elif func.cat == 'reductor':
-                    # For simplicity temporarily assume a single output port
-                    port = 0
-                    channel = outputs[0]
+        kept = []
+        stolen = []
 
-                    # Initialise continuation
-                    func.cont = None
+        while n and self.tasks:
+            t = self.tasks.pop()
+
+            if self.route[t.pc]:
+                kept.append(t)
+            else:
+                stolen.append(t.dump())
+                n -= 1
+
+        self.tasks.extend(reversed(kept))
+
+        self.send(thief, ('stolen', stolen), urgent=True)
+        self.stats['given_tasks'] += len(stolen)
+
+    # Counters that change on every poll: a report with nothing else new is
+    # not worth sending.
+    CLOCKS = ('polls', 'empty_polls', 'blocked_time', 'cpu_time', 'uptime')
+
+    def report(self, final=False):
+        if self.reports is None:
+            return
+
+        self.stats.update(self.transport.stats)
+
+        if self.transport.arrays is not None:
+            self.stats.update(self.transport.arrays.stats)
+
+        self.stats.update(self.joins.stats)
+        self.stats['syncs'] = {name: dict(counters) for name, counters
+                               in self.syncs.stats.items()}
+
+        self.stats['uptime'] = time.perf_counter() - self.started
+        self.stats['cpu_time'] = self.cpu_clock() - self.started_cpu
+
+        counters = {k: v for k, v in self.stats.items()
+                    if k not in self.CLOCKS}
+
+        if counters == self._reported and not final:
+            return
+
+        self._reported = counters
+        self.reports.put(('stats', self.wid, dict(self.stats)))
+
+    def emit(self, m, wid=None):
+        # Queue a message at worker `wid' (this one by default). Routed
+        # messages always go to their worker.
+        if m.pc < 0:
+            # Sent on a dangling channel (see Plan.succ).
+            raise AssertionError('Cannot find appropriate basic block for '
+                                 'channel %s' % self.plan.channels[m.channel])
+
+        if self.route[m.pc]:
+            wid = self.plan.owner(m, self.n_workers)
+
+        if wid is None or wid == self.wid:
+            self.tasks.append(m)
+        else:
+            self.send(wid, m.dump())
+
+    def flush_partials(self, list_id=None):
+        # Send local partial results of unordered reductions (of all lists
+        # or of `list_id') to the owners of their lists.
+        if list_id is None:
+            partials = self.partials.take_all()
+        else:
+            partial = self.partials.take(list_id)
+            partials = ((list_id, partial), ) if partial else ()
+
+        for list_id, partial in partials:
+            wid = owner(list_id, self.n_workers)
+
+            if wid == self.wid:
+                self.combine_partial(list_id, partial)
+            else:
+                self.send(wid, ('partial', list_id) + tuple(partial))
+
+    def combine_partial(self, list_id, partial):
+        func = self.plan.boxes[self.plan.box[partial[5]]]
+        result = self.partials.combine(func, list_id, partial)
+
+        if result is None:
+            return
 
-                    index = task.id[-1]
-                    list_id = task.id[:-1]
+        _, cont, _, bracket, id, pc = result
+
+        m = Message(cont, id)
+        m.sm_dec(bracket)
+        m.set_loc(self.plan.outputs[pc][0], self.plan.succ[pc][0])
+
+        self.emit(m)
+
+    def transduce(self, task, output):
+        # Send the messages a transductor produced from `task', one per
+        # output port.
+        pc = task.pc
+        outputs = self.plan.outputs[pc]
+        succ = self.plan.succ[pc]
+
+        # For now expect transductors eager to have easier bracket handling.
+        assert len(outputs) == len(output)
+
+        for port, (channel, msg) in enumerate(zip(outputs, output)):
+            m = Message(msg, task.id_eye(port), task.bracket)
+            m.set_loc(channel, succ[port])
+
+            self.emit(m)
+
+    def synchronise(self, sync, task):
+        # Pass a message to the synchroniser hosted by the owner of its
+        # statement and send what it produces.
+        pc = task.pc
+        wid = self.plan.owner(task, self.n_workers)
+
+        if wid != self.wid:
+            self.send(wid, task.dump())
+            return
+
+        outputs = self.plan.outputs[pc]
+        succ = self.plan.succ[pc]
+
+        for port, content, origin in self.syncs.put(sync, task):
+            m = Message(content, origin.id_eye(port), origin.bracket)
+            m.set_loc(outputs[port], succ[port])
+
+            self.emit(m)
+
+    def induce(self, func, cont, output):
+        # Emit inductor output step by step: every element is queued as soon
+        # as it is produced, idle workers steal them from the tail. After
+        # `induction_burst' steps the continuation is put back to the task
+        # queue behind the emitted messages, which bounds the number of
+        # elements in flight.
+
+        outputs = self.plan.outputs[cont.pc]
+        succ = self.plan.succ[cont.pc]
+
+        index = cont.index
+
+        for _ in range(self.induction_burst):
+            # Continuation is not issued: the current element is the last one.
+            last = not func.cont
+            cont.content = func.cont
+
+            for port, (channel, msg) in enumerate(zip(outputs, output)):
+
+                m = Message(msg, cont.id_up(port, index))
+                m.set_loc(channel, succ[port])
+
+                if last:
+                    m.sm_inc(cont.bracket)
+
+                self.emit(m)
+
+            index += 1
+
+            if last:
+                return
+
+            if func.coroutine:
+                # Every step is a task of its own.
+                break
+
+            output = func(None, cont.content)
+
+        cont.index = index
+        self.tasks.append(cont)
+
+    def defer(self, func, coro, handler=None, *args):
+        # Coroutine boxes are run by AsyncWorker.
+        coro.close()
+        raise TypeError("Box %s is a coroutine function, run the net with "
+                        "backend='asyncio'." % func.name)
+
+    def run(self):
+
+        self.started = time.perf_counter()
+        self.started_cpu = self.cpu_clock()
+
+        try:
+            while self.event_loop():
+                self.step()
+
+        except Exception as e:
+            # Tell the runner why the worker is gone.
+            if self.reports is not None:
+                self.reports.put(('error', self.wid,
+                                  '%s: %s' % (type(e).__name__, e)))
+            raise
+
+        finally:
+            # Blocks of the arrays still held (by joins, tasks etc.) are
+            # unlinked once no other worker holds them either.
+            if self.transport.arrays is not None:
+                self.transport.arrays.release()
+
+    def step(self):
+
+        plan = self.plan
+        boxes, box, inputs_at, outputs_at, succ = (plan.boxes, plan.box,
+                                                   plan.inputs, plan.outputs,
+                                                   plan.succ)
+
+        # A bounded quantum of tasks between polls.
+        quantum = self.quantum
+
+        while quantum and self.tasks:
+            quantum -= 1
+
+            task = self.tasks.popleft()
+            self.stats['tasks'] += 1
+
+            # Sanity check for id completeness.
+            assert not (len(task.id) % 2)
+
+            pc = task.pc
+            func = boxes[box[pc]]
+
+            if type(task) is Continuation:
+                # Next step of a pending induction.
+                output = func(None, task.content)
+
+                if func.coroutine:
+                    self.defer(func, output, self.induce, func, task)
+                else:
+                    self.induce(func, task, output)
+                continue
+
+            if getattr(func, 'cat', None) == 'sync':
+                self.synchronise(func, task)
+                continue
+
+            inputs = inputs_at[pc]
+            outputs = outputs_at[pc]
+
+            if len(inputs) == 1:
+                # Execute vertex
+                assert inputs[0] == task.channel
+
+                if func.cat == 'transductor':
+
+                    output = func(task.channel, task.content)
+
+                    if func.coroutine:
+                        self.defer(func, output, self.transduce, task)
+                    else:
+                        self.transduce(task, output)
+
+                elif func.cat == 'inductor':
 
-                    # ---
-                    stop = False
-                    session_lock.acquire()
+                    output = func(task.channel, task.content)
 
-                    if index == 0:
-                        sessions[list_id] = 0
+                    cont = Continuation(None, task.id, task.bracket)
+                    cont.set_loc(task.channel, pc)
 
+                    if func.coroutine:
+                        self.defer(func, output, self.induce, func, cont)
                     else:
-                        if list_id not in sessions or sessions[list_id] != index:
-                            # Suspend task
-                            sessions[task.id] = self.wid
-                            self.tasks_suspended[task.id] = task
-                            stop = True
+                        self.induce(func, cont, output)
+
+                elif func.cat == 'reductor' and func.combine is not None:
+                    # Commutative reduction: fold locally in any order.
+                    if self.partials.fold(func, task):
+                        # Closing element: the length of the list is known
+                        # now, collect partials from all workers.
+                        list_id = task.id[:-1]
+
+                        for wid in range(self.n_workers):
+                            if wid != self.wid:
+                                self.send(wid, ('close', list_id))
+
+                        self.flush_partials(list_id)
 
-                        else:
-                            func.cont = sessions[list_id + (-1,)]
+                elif func.cat == 'reductor':
+                    # For simplicity temporarily assume a single output
+                    # port
+                    port = 0
+                    channel = outputs[0]
 
-                    session_lock.release()
+                    wid = owner(task.id[:-1], self.n_workers)
 
-                    if stop:
+                    if wid != self.wid:
+                        # Forward the element to the owner of the list.
+                        self.send(wid, task.dump())
                         continue
-                    # ---
+
+                    session = self.sessions.acquire(task)
+
+                    if session is None:
+                        # Suspended until the preceding element is reduced.
+                        continue
+
+                    # Initialise continuation
+                    func.cont = session[1]
 
                     func(task.channel, task.content)
 
                     if task.bracket is not None:
                         # End of reduction
+                        self.sessions.close(task)
+
                         m = Message(func.cont, task.id_down(port))
                         m.sm_dec(task.bracket)
 
-                        next_pc = self.cfg.next_pc(task.pc, channel)
+                        next_pc = succ[pc][port]
                         m.set_loc(channel, next_pc)
 
-                        self.tasks.append(m)
+                        self.emit(m)
 
                     else:
-                        session_lock.acquire()
-
                         # Save intermediate result
-                        sessions[list_id] += 1
-                        sessions[list_id + (-1,)] = func.cont
+                        next_task = self.sessions.release(task, func.cont)
 
-                        next_task = list_id + (index+1,)
+                        if next_task is not None:
+                            self.tasks.append(next_task)
 
-                        if next_task in self.tasks_suspended:
-                            # Locally suspended
-                            self.tasks.append(self.tasks_suspended[next_task])
+                elif func.cat == 'output':
+                    output = func(plan.channels[task.channel],
+                                  (task.content, task.id))
 
-                        elif next_task in sessions:
-                            self.send(sessions[next_task], ('wakeup', next_task))
+                    if func.coroutine:
+                        self.defer(func, output)
 
-                        else:
-                            pass
+            elif getattr(func, 'cat', None) == 'output':
+                # Outputs of several channels need no synchronisation.
+                output = func(plan.channels[task.channel],
+                              (task.content, task.id))
 
-                        session_lock.release()
+                if func.coroutine:
+                    self.defer(func, output)
 
+            elif getattr(func, 'ready', ANY) == ANY:
+                # Fired by each message on its own.
+                output = func(task.channel, task.content)
 
-                elif func.cat == 'output':
-                    func(task.channel, (task.content, task.id))
+                if getattr(func, 'coroutine', False):
+                    self.defer(func, output, self.transduce, task)
+                else:
+                    self.transduce(task, output)
 
             else:
                 # Synchronisation point for inputs
-                pass
+                wid = vertex_owner(pc, self.n_workers)
+
+                if wid != self.wid:
+                    self.send(wid, task.dump())
+                    continue
+
+                msgs = self.joins.put(task)
+
+                if msgs is not None:
+                    output = func(None, tuple(m.content for m in msgs))
+
+                    # The output belongs to the list of the first input.
+                    if func.coroutine:
+                        self.defer(func, output, self.transduce, msgs[0])
+                    else:
+                        self.transduce(msgs[0], output)
 
             del task
 
+
+class AsyncWorker(Worker):
+    """
+    Worker running coroutine boxes (`async def') on an asyncio event loop.
+
+    A coroutine box is started as an asyncio task and the worker goes on
+    with its queue, at most `concurrency' invocations run at a time. Once
+    an invocation completes, its output is handled as that of a plain box.
+    The event loop runs between two quanta of tasks and while the worker
+    waits for invocations; the worker is idle only when none is left.
+    """
+
+    concurrency = 64
+
+    # Longest wait for invocations before the inbound queue is polled.
+    POLL_INTERVAL = 0.001
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.loop = None
+        self.limit = None
+
+        # Invocations in flight, and completed ones to handle.
+        self.pending = set()
+        self.done = deque()
+
+        self.stats['async_calls'] = 0
+
+    @property
+    def is_ready(self):
+        return bool(self.done) or (bool(self.tasks)
+                                   and len(self.pending) < self.concurrency)
+
+    @property
+    def is_idle(self):
+        return not (self.tasks or self.pending or self.done)
+
+    def block(self, timeout):
+        if not self.pending:
+            return super().block(timeout)
+
+        self.transport.flush()
+
+        if timeout is None or timeout > self.POLL_INTERVAL:
+            timeout = self.POLL_INTERVAL
+
+        self.loop.run_until_complete(
+            asyncio.wait(set(self.pending), timeout=timeout,
+                         return_when=asyncio.FIRST_COMPLETED))
+
+        try:
+            return self.transport.recv_all(False)
+        except Empty:
+            return None
+
+    def defer(self, func, coro, handler=None, *args):
+        t = self.loop.create_task(self.invoke(func, coro))
+        t.add_done_callback(lambda t: self.complete(t, func, handler, args))
+
+        self.pending.add(t)
+        self.stats['async_calls'] += 1
+
+    async def invoke(self, func, coro):
+        async with self.limit:
+            output = await coro
+
+        # The continuation set by an inductor is only visible in this task.
+        return output, getattr(func, 'cont', None)
+
+    def complete(self, t, func, handler, args):
+        self.pending.discard(t)
+        self.done.append((t, func, handler, args))
+
+    def step(self):
+        while self.done:
+            t, func, handler, args = self.done.popleft()
+            output, cont = t.result()
+
+            if handler is not None:
+                if func.cat == 'inductor':
+                    func.cont = cont
+
+                handler(*args, output)
+
+        super().step()
+
+        # Start new invocations and let the others go on.
+        if self.pending:
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+
+        # Before Python 3.10, asyncio primitives bind to the current loop
+        # when created.
+        asyncio.set_event_loop(self.loop)
+        self.limit = asyncio.Semaphore(self.concurrency)
+
+        try:
+            super().run()
+        finally:
+            asyncio.set_event_loop(None)
+            self.loop.close()
+
 #------------------------------------------------------------------------------
 
 class Runner:
 
-    def __init__(self, cfg, __input__, n_workers=2):
+    def __init__(self, cfg, __input__, n_workers=2, induction_burst=16,
+                 stealing=True, batch_size=64, transport='queue',
+                 share_arrays=True, window=4, join_limit=1 << 16,
+                 quantum=64, poll_timeout=0.1, backend='process',
+                 concurrency=64):
+        """
+        Input channels of `__input__' are sequences or any iterables (e.g.
+        generators), or flat event streams wrapped in Events. They are
+        streamed to the workers by the Feeder while they run; `window' is
+        the number of input batches in flight per worker.
+
+        `join_limit' bounds the input buffers of every multi-input statement
+        (messages per channel, None for no bound).
+
+        Workers run up to `quantum' tasks between two polls of their inbound
+        queue, and wait for records at most `poll_timeout' seconds at a time
+        when idle.
+
+        Worker processes exchange records over queues, or over rings in
+        shared memory if `transport' is 'shm' (see RingTransport).
+
+        With `share_arrays', large NumPy arrays sent to another worker
+        process go through shared memory (see akr.arrays.Arrays): they are
+        copied once, then passed by reference.
+
+        Workers are processes, or threads of this process if `backend' is
+        'thread'. Threads share records instead of pickling them, which pays
+        off when boxes spend their time in code releasing the GIL (e.g.
+        NumPy); the transport and share_arrays options do not apply then.
 
-        self.tasks = []
+        With the 'asyncio' backend, worker processes run boxes that are
+        coroutine functions on an event loop (see AsyncWorker), each with up
+        to `concurrency' invocations in flight.
+        """
+
+        if backend not in ('process', 'thread', 'asyncio'):
+            raise ValueError('Unknown backend: %r' % backend)
+
+        if transport not in ('queue', 'shm'):
+            raise ValueError('Unknown transport: %r' % transport)
+
+        self.backend = backend
         self.workers = []
         self.processes = None
+        self.rings = None
 
-        stream_factory = Stream()
+        cfg.build_dispatch()
+        self.plan = Plan(cfg)
 
-        for channel, msgs in __input__.items():
+        if backend == 'thread':
+            queues = [queue.Queue() for i in range(n_workers)]
+            credits = [threading.Semaphore(window) for i in range(n_workers)]
+            self.reports = queue.Queue()
+            transport = share_arrays = None
 
-            stream = stream_factory.read(msgs)
+        else:
+            queues = [Queue() for i in range(n_workers)]
+            credits = [Semaphore(window) for i in range(n_workers)]
+            self.reports = Queue()
 
-            init_pc = (cfg.entry[channel], 0)
+        shared = self.shared = None
 
-            for msg in stream:
-                msg.channel = channel
-                msg.pc = init_pc
-                self.tasks.append(msg)
+        if share_arrays and arrays.available():
+            shared = self.shared = arrays.Arrays(RLock())
 
-            tasks_parted = utils.partition(self.tasks, n_workers)
+        bells = None
 
-            queues = [Queue() for i in range(n_workers)]
+        if transport == 'shm' and SharedMemory is not None:
+            self.rings, bells = RingTransport.create(queues)
 
-            self.workers = [Worker(wid, cfg, tasks, queues)
-                            for wid, tasks in enumerate(tasks_parted)]
+            transports = [RingTransport(wid, queues, self.rings, bells,
+                                        batch_size, shared)
+                          for wid in range(n_workers)]
 
-    def run(self):
-        manager = Manager()
+        else:
+            # Fall back to plain queues.
+            transports = [Transport(wid, queues, batch_size, shared)
+                          for wid in range(n_workers)]
 
-        sessions = manager.dict()
-        session_lock = Lock()
+        worker = AsyncWorker if backend == 'asyncio' else Worker
 
-        self.processes = [Process(target=w.run, args=(sessions, session_lock))
-                          for w in self.workers]
+        self.workers = [worker(wid, self.plan, [], transports[wid],
+                               self.reports, induction_burst, stealing,
+                               credits[wid], join_limit, quantum,
+                               poll_timeout)
+                        for wid in range(n_workers)]
+
+        if backend == 'thread':
+            for w in self.workers:
+                w.cpu_clock = time.thread_time
+
+        elif backend == 'asyncio':
+            for w in self.workers:
+                w.concurrency = concurrency
+
+        # Channels are interned here, before the plan is sent to workers.
+        self.feeder = Feeder(self.plan, __input__, queues, credits, bells,
+                             batch_size, self.check)
+
+        self._stats = {}
+        self.errors = {}
+
+    def run(self):
+        """
+        Run the net until it is quiescent, then stop the workers. Return the
+        time it took to get quiescent in seconds.
+        """
+        start = time.perf_counter()
+
+        if self.backend == 'thread':
+            self.processes = [threading.Thread(target=w.run, daemon=True)
+                              for w in self.workers]
+        else:
+            self.processes = [Process(target=w.run) for w in self.workers]
 
         for p in self.processes:
             p.start()
 
+        try:
+            self.feeder.run()
+            self.wait()
+
+            self.elapsed = time.perf_counter() - start
+
+            self.stop()
+
+        except BaseException:
+            # A worker died or the run was interrupted: do not leave the
+            # others running.
+            self.stop(self.STOP_TIMEOUT)
+            raise
+
+        finally:
+            if self.rings is not None:
+                RingTransport.destroy(self.rings)
+
+        return self.elapsed
+
+    # Seconds to wait for the workers to stop after a failure.
+    STOP_TIMEOUT = 1.
+
+    # Seconds between checks that the workers are alive.
+    CHECK_INTERVAL = 1.
+
+    def stop(self, timeout=None):
+        """
+        Stop the workers and wait for them to exit. Worker processes still
+        running after `timeout' seconds (if given) are terminated. Shared
+        arrays still held by the workers or their queues are released.
+        """
+        self.signal(('stop', ))
+
+        if timeout is not None:
+            timeout += time.perf_counter()
+
+        for p in self.processes:
+            # Keep taking reports: a worker process exits only once the
+            # records it put on a queue are read.
+            while p.is_alive():
+                if timeout is not None and time.perf_counter() > timeout:
+                    break
+
+                self.stats()
+                p.join(0.1)
+
+        terminated = False
+
         for p in self.processes:
-            p.join()
+            # Threads of the thread backend are daemons, and are left.
+            if p.is_alive() and isinstance(p, Process):
+                p.terminate()
+                p.join()
+                terminated = True
+
+        # Final reports of the workers.
+        self.stats()
+
+        # A terminated worker may have left a record half written.
+        if self.shared is not None and not terminated:
+            self.drain()
+
+    def drain(self):
+        # Release the arrays of the records left on the queues of the
+        # workers (e.g. sent to a worker that failed). Those left in rings or
+        # held by terminated workers are unlinked by the resource tracker
+        # when this process exits.
+        for wid in range(len(self.workers)):
+            transport = Transport(wid, self.feeder.queues, arrays=self.shared)
+
+            while True:
+                try:
+                    transport.recv_all(False)
+                except Empty:
+                    break
+
+        self.shared.release()
+
+    def wait(self):
+        """
+        Wait until the net is quiescent: the input is exhausted and there is
+        nothing left to do.
+
+        Four-counter termination detection: the runner sends a probe to all
+        workers, which answer once idle with the numbers of records they
+        sent to and received from other workers. The net is quiescent when
+        two consecutive waves of probes find all the input read and the same
+        totals, with as many records received as sent: none was in flight,
+        and none was received between the waves.
+
+        Data still held then is never processed: reductor tasks suspended
+        for a preceding element (which is missing) and reductions that
+        never got all the elements of their list fail the run, messages
+        left in join buffers (the other inputs were shorter) are reported
+        with a RuntimeWarning.
+        """
+        n_workers = self.feeder.n_workers
+        last = None
+        wave = 0
+
+        # Workers report as they go: make sure they are alive even when
+        # reports keep coming in.
+        deadline = time.perf_counter() + self.CHECK_INTERVAL
+
+        while True:
+            wave += 1
+            self.signal(('probe', wave))
+
+            replies = {}
+
+            while len(replies) < n_workers:
+                if time.perf_counter() > deadline:
+                    self.check()
+                    deadline = time.perf_counter() + self.CHECK_INTERVAL
+
+                try:
+                    r = self.reports.get(True, self.CHECK_INTERVAL)
+                except Empty:
+                    continue
+
+                if r[0] == 'error':
+                    self.errors[r[1]] = r[2]
+                    raise RuntimeError('Worker %d failed: %s' % r[1:])
+
+                if r[0] == 'stats':
+                    self._stats[r[1]] = r[2]
+
+                elif r[2] == wave:
+                    replies[r[1]] = r[3:]
+
+            sent, received, done, suspended, incomplete, buffered = \
+                zip(*replies.values())
+            totals = (sum(sent), sum(received), all(done))
+
+            if totals == last and totals[0] == totals[1] and totals[2]:
+                break
+
+            last = totals
+
+        if sum(suspended):
+            raise RuntimeError('%d reductor tasks wait for elements that '
+                               'never came.' % sum(suspended))
+
+        if sum(incomplete):
+            raise RuntimeError('%d reductions never got all the elements of '
+                               'their lists.' % sum(incomplete))
+
+        if sum(buffered):
+            warnings.warn('%d messages left unmatched in join buffers.'
+                          % sum(buffered), RuntimeWarning)
+
+    def signal(self, record):
+        # Send a control record to all workers.
+        for wid, q in enumerate(self.feeder.queues):
+            q.put([record])
+            self.feeder.ring(wid)
+
+    def check(self):
+        # Raise if a worker died.
+        for wid, p in enumerate(self.processes):
+            if p.is_alive():
+                continue
+
+            # Its error, if it reported one (see Worker.run).
+            self.stats()
+
+            if wid in self.errors:
+                raise RuntimeError('Worker %d failed: %s'
+                                   % (wid, self.errors[wid]))
+
+            if self.backend == 'thread':
+                raise RuntimeError('Worker %d died.' % wid)
+
+            raise RuntimeError('Worker %d exited with code %s.'
+                               % (wid, p.exitcode))
+
+    def stats(self):
+        """Latest statistics reported by each worker: {wid: {name: value}}."""
+        while True:
+            try:
+                r = self.reports.get(False)
+            except Empty:
+                break
+
+            if r[0] == 'stats':
+                self._stats[r[1]] = r[2]
+
+            elif r[0] == 'error':
+                self.errors[r[1]] = r[2]
+
+        return self._stats
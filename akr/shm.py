@@ -0,0 +1,124 @@
+import struct
+
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # Python < 3.8
+    SharedMemory = None
+
+__all__ = ['Ring', 'SharedMemory']
+
+
+_pos = struct.Struct('Q')
+_len = struct.Struct('I')
+
+
+class Ring:
+    """
+    Single-producer/single-consumer ring buffer of byte records in shared
+    memory.
+
+    The header holds two monotonically increasing byte counters: the read
+    position (written by the consumer only) and the write position (written
+    by the producer only). A record is its 4-byte length followed by the
+    payload, both may wrap around the end of the data area.
+    """
+
+    HEAD = 0
+    TAIL = _pos.size
+    DATA = 2 * _pos.size
+
+    def __init__(self, capacity=1 << 20):
+        self.capacity = capacity
+
+        self.shm = SharedMemory(create=True, size=self.DATA + capacity)
+        self.buf = self.shm.buf
+
+        _pos.pack_into(self.buf, self.HEAD, 0)
+        _pos.pack_into(self.buf, self.TAIL, 0)
+
+        # Local copy of the position owned by this side.
+        self.head = 0
+        self.tail = 0
+
+    def __getstate__(self):
+        # Processes that are not forked attach to the same block by name.
+        return {'name': self.shm.name, 'capacity': self.capacity,
+                'head': self.head, 'tail': self.tail}
+
+    def __setstate__(self, state):
+        self.capacity = state['capacity']
+        self.head = state['head']
+        self.tail = state['tail']
+
+        self.shm = SharedMemory(name=state['name'])
+        self.buf = self.shm.buf
+
+    def fits(self, size):
+        return _len.size + size <= self.capacity
+
+    def write(self, data):
+        """Append a record. Return False if there is not enough free space."""
+        size = _len.size + len(data)
+        head = _pos.unpack_from(self.buf, self.HEAD)[0]
+
+        if self.capacity - (self.tail - head) < size:
+            return False
+
+        pos = self._copy_in(self.tail % self.capacity, _len.pack(len(data)))
+        self._copy_in(pos, data)
+
+        # Publish the record only when it is completely written.
+        self.tail += size
+        _pos.pack_into(self.buf, self.TAIL, self.tail)
+
+        return True
+
+    def read(self):
+        """Pop the oldest record, return None if the ring is empty."""
+        tail = _pos.unpack_from(self.buf, self.TAIL)[0]
+
+        if self.head == tail:
+            return None
+
+        pos = self.head % self.capacity
+
+        pos, raw = self._copy_out(pos, _len.size)
+        size, = _len.unpack(raw)
+        _, data = self._copy_out(pos, size)
+
+        self.head += _len.size + size
+        _pos.pack_into(self.buf, self.HEAD, self.head)
+
+        return data
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def _copy_in(self, pos, data):
+        data = memoryview(data)
+        first = min(len(data), self.capacity - pos)
+
+        self.buf[self.DATA + pos:self.DATA + pos + first] = data[:first]
+
+        if first < len(data):
+            rest = len(data) - first
+            self.buf[self.DATA:self.DATA + rest] = data[first:]
+            return rest
+
+        return (pos + first) % self.capacity
+
+    def _copy_out(self, pos, size):
+        first = min(size, self.capacity - pos)
+
+        data = bytes(self.buf[self.DATA + pos:self.DATA + pos + first])
+
+        if first < size:
+            rest = size - first
+            data += bytes(self.buf[self.DATA:self.DATA + rest])
+            return rest, data
+
+        return (pos + first) % self.capacity, data
@@ -1,97 +1,195 @@
-from collections import Sequence, defaultdict
-from itertools import chain
-from functools import partial
+from collections.abc import Sequence
+import itertools
 from . import utils
 
 
+class _Marker:
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+# Markers of a flat event stream: the beginning and the end of a list.
+OPEN = _Marker('OPEN')
+CLOSE = _Marker('CLOSE')
+
+
+def events(seq):
+    """
+    Flatten nested sequences into a stream of values and OPEN/CLOSE markers,
+    e.g. [[1, 2], [3]] -> OPEN OPEN 1 2 CLOSE OPEN 3 CLOSE CLOSE. Strings and
+    bytes are values. The outermost level may be any iterable.
+    """
+    yield OPEN
+
+    stack = [iter(seq)]
+
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, Sequence) \
+                    and not isinstance(item, (str, bytes)):
+                yield OPEN
+                stack.append(iter(item))
+                break
+
+            yield item
+
+        else:
+            stack.pop()
+            yield CLOSE
+
+
+class Events:
+    """Input of a channel given as a flat event stream (see events())."""
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+
 class Stream:
-    stream = None
-    depth = None
-    bc = None
-    bmax = None
+    """
+    Converts nested sequences into messages.
+
+    scan() generates the messages of a flat event stream, iter() those of
+    nested sequences (the outermost level of which may be any iterable) and
+    read() returns them as a list. Inputs are never materialised. Every
+    outermost list gets the next identifier of `outer_ids' (0, 1, ... by
+    default): Streams that share it number their lists apart.
+    """
 
-    def __init__(self):
-        self.list_ids = defaultdict(int)
-        self.list_idxs = defaultdict(int)
+    depth = None
 
-        self.index = 0
+    def __init__(self, outer_ids=None):
+        self.outer_ids = itertools.count() if outer_ids is None \
+            else outer_ids
 
-    def _clear(self):
-        self.bmax = 0
-        self.bc = 0
-        self.depth = None
-        self.stream = []
+        # Per level: list identifier and index of the current list.
+        self.list_ids = [None]
+        self.list_idxs = [0]
 
     def read(self, seq):
-        self._clear()
+        return list(self.iter(seq))
 
-        self._scan(seq)
-        s = self.stream
+    def iter(self, seq):
+        return self.scan(events(seq))
 
-        self.list_ids[0] += 1
+    def scan(self, events):
+        ids = self.list_ids
+        idxs = self.list_idxs
 
-        return s
+        level = -1
+        depth = None
+        index = 0
 
-    def _scan(self, stream, level=0):
+        # Bracketing: number of lists closed since the last message (bc is
+        # decremented by the lists opened after them).
+        bc = bmax = 0
 
-        assert isinstance(stream, Sequence)
+        # The bracket of a message is only known when the next one is
+        # found, hence messages are generated one step behind the scanner.
+        last = None
 
-        for item in stream:
+        # Id of the current list without the message index, built when
+        # the first message of the list is found.
+        prefix = None
 
-            if isinstance(item, Sequence):
-                # Nested list
+        for e in events:
 
-                if self.bc > 0:
-                    self.bc -= 1
+            if e is OPEN:
+                prefix = None
 
-                if self.bc == 0 and self.bmax > 0:
+                if level < 0:
+                    # New outermost list.
+                    level = 0
+                    depth = self.depth = None
+                    bc = bmax = 0
+                    index = 0
+                    ids[0] = next(self.outer_ids)
+                    idxs[0] = 0
+                    continue
+
+                if bc > 0:
+                    bc -= 1
+
+                if bc == 0 and bmax > 0:
                     # Bracketing sequence )..)(..( occured
+                    last.bracket = bmax
+                    index = 0
+                    bmax = 0
+
+                level += 1
 
-                    self.stream[-1].bracket = self.bmax
-                    self.index = 0
-                    self.bmax = 0
+                if level == len(ids):
+                    ids.append(0)
+                    idxs.append(0)
 
-                self.list_ids[level+1] += 1
+                ids[level] += 1
 
-                self._scan(item, level+1)
+            elif e is CLOSE:
+                prefix = None
 
-                self.list_idxs[level] += 1
+                if level < 0:
+                    raise ValueError('Unbalanced sequence')
+
+                # The next list of this level numbers its elements from 0.
+                idxs[level] = 0
+
+                # Exit list
+                bc += 1
+                bmax += 1
+                level -= 1
+
+                if level >= 0:
+                    idxs[level] += 1
+
+                elif last is not None:
+                    last.bracket = 0
 
             else:
                 # Message
 
-                self.depth = level if self.depth is None else self.depth
+                if depth is None:
+                    if level < 0:
+                        raise ValueError('Message outside of a list')
+
+                    depth = self.depth = level
 
                 # Make sure messages are only found at the innermost sequence.
-                if level != self.depth:
+                if level != depth:
                     raise ValueError('Wrong sequence')
 
-                # Join list identifiers and indicies
-                lists = ((self.list_ids[i], self.list_idxs[i])
-                         for i in range(level+1))
-
-                # Flatten ids and indicies, remove trailing 0 and insert msg id
-                mid = tuple(chain(*lists))[:-1] + (self.index, )
+                if prefix is None:
+                    # Join list identifiers and indicies, without the index
+                    # of the innermost list.
+                    prefix = tuple(x for i in range(level + 1)
+                                   for x in (ids[i], idxs[i]))[:-1]
 
-                self.stream.append(
-                    Message(item, mid)
-                )
+                m = Message(e, prefix + (index, ))
+                index += 1
 
-                self.index += 1
+                if last is not None:
+                    yield last
 
-        for k in filter(lambda x: x > level, self.list_idxs):
-            self.list_idxs[k] = 0
+                last = m
 
-        # Exit list
-        self.bc += 1
-        self.bmax += 1
+        if level >= 0:
+            raise ValueError('Unbalanced sequence')
 
-        if level == 0:
-            self.stream[-1].bracket = 0
+        if last is not None:
+            yield last
 
 
 class Message:
 
+    __slots__ = ('content', 'id', 'bracket', 'channel', 'pc')
+
     def __init__(self, content, id, bracket=None):
         self.content = content
         self.id = id
@@ -112,12 +210,7 @@ class Message:
         self.pc = pc
 
     def id_up(self, port, index):
-        pre_id = self.id_eye(port)
-
-        ls = b''.join(map(utils.to_bytes, self.id))
-        list_id = utils.md5s(ls, port)
-
-        return pre_id + (list_id, index)
+        return self.id_eye(port) + (utils.mix_seq(self.id, port), index)
 
     def id_down(self, port):
         return self.id_eye(port)[:-2]
@@ -125,9 +218,14 @@ class Message:
     def id_eye(self, port):
         # - dimension and indicies are the same
         # - update list identifiers
-        ids = map(partial(utils.md5i, port), self.id[::2])
-        idxs = self.id[1::2]
-        return tuple(chain(*zip(ids, idxs)))
+        id = list(self.id)
+        mask = utils.MASK
+
+        # hash((list_id, port)), see akr.utils.
+        for i in range(0, len(id) - 1, 2):
+            id[i] = hash((id[i], port)) & mask
+
+        return tuple(id)
 
     def sm_inc(self, sm_init=-1):
         if sm_init != -1:
@@ -155,3 +253,44 @@ class Message:
     def dump(self):
         return ('msg', self.content, self.id, self.bracket,
                 self.channel, self.pc)
+
+
+class Continuation(Message):
+    """
+    Pending inductor step: `content' holds the continuation returned by the
+    box, `id' and `bracket' are those of the message that started the
+    induction, and `index' is the position of the next element.
+    """
+
+    __slots__ = ('index', '_prefixes')
+
+    def __init__(self, content, id, bracket=None, index=0):
+        super().__init__(content, id, bracket)
+        self.index = index
+        self._prefixes = {}
+
+    def id_up(self, port, index):
+        # The list identifier is the same for every element of the induced
+        # sequence, so compute it once per port.
+        try:
+            prefix = self._prefixes[port]
+        except KeyError:
+            prefix = self._prefixes[port] = super().id_up(port, 0)[:-1]
+
+        return prefix + (index, )
+
+    def dump(self):
+        return ('cont', self.content, self.id, self.bracket,
+                self.channel, self.pc, self.index)
+
+
+def load(r):
+    """Restore a message or a continuation from its dump()."""
+    if r[0] == 'msg':
+        m = Message(*r[1:4])
+    else:
+        m = Continuation(*r[1:4], index=r[6])
+
+    m.set_loc(r[4], r[5])
+
+    return m
@@ -0,0 +1,205 @@
+import time
+from collections import deque
+from collections.abc import Mapping
+
+from .stream import Message
+
+__all__ = ['Syncs', 'SyncTable', 'table_key']
+
+
+def table_key(labels, content):
+    """Values of the `labels' of a synch table in a message `content'."""
+    try:
+        return tuple(content[label] for label in labels)
+
+    except (KeyError, TypeError):
+        raise ValueError('Message %r has no labels %s of a synch table.'
+                         % (content, ', '.join(labels))) from None
+
+
+class SyncTable:
+    """
+    Instances of a synch table (`tab [i, j] synch s'), one per distinct
+    tuple of label values.
+
+    An instance, [state, buffers] as a hosted synchroniser, is created with
+    the first message of its label values, which are stored in its state.
+    It is evicted once it is idle, with no buffered messages, and either
+    back in its initial state (a fresh instance would be the same) or in a
+    terminal state, one without transitions, which ends it. A later message
+    with the same label values gets a fresh instance.
+    """
+
+    def __init__(self, sync, n_inputs):
+        self.sync = sync
+        self.labels = sync.labels
+        self.n_inputs = n_inputs
+
+        # label values -> [state, buffers]
+        self.instances = {}
+
+        self.initial = sync.init()
+        self.stores = [v for v in self.initial._stores
+                       if v not in self.labels]
+
+    def __len__(self):
+        return len(self.instances)
+
+    def get(self, key):
+        instance = self.instances.get(key)
+
+        if instance is None:
+            state = self.sync.init()
+
+            for label, value in zip(self.labels, key):
+                setattr(state, label, value)
+
+            instance = [state, [deque() for _ in range(self.n_inputs)]]
+            self.instances[key] = instance
+
+        return instance
+
+    def release(self, key):
+        """Evict the instance of `key' if it is idle."""
+        state, buffers = self.instances[key]
+
+        if any(buffers):
+            return False
+
+        if state._name not in self.sync.terminal:
+            initial = self.initial
+
+            if state._name != initial._name or state._buf != initial._buf:
+                return False
+
+            for v in self.stores:
+                if getattr(state, v) != getattr(initial, v):
+                    return False
+
+        del self.instances[key]
+        return True
+
+
+class Syncs:
+    """
+    Synchronisers hosted by a worker.
+
+    A synchroniser compiled by aksync is a class with static methods: init()
+    returns its initial State and run(state, msgs) takes the first message
+    of every non-empty input port, fires a transition and returns (output,
+    state, consumed ports), or no consumed ports if none is enabled.
+
+    Every statement has its own State and a FIFO buffer per input port.
+    Messages wait in their buffer until a transition consumes them, and the
+    synchroniser is run as long as transitions fire. Messages it sends to
+    itself are buffered at once, as they would be on a channel. A synch
+    table (a synchroniser with `labels') has an instance per tuple of label
+    values instead, see SyncTable.
+
+    Counters per synchroniser: messages received, transitions fired,
+    messages sent and time spent in transitions; for synch tables also the
+    instances live, created and evicted.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+
+        # pc -> [state, buffers], or SyncTable
+        self.hosted = {}
+
+        # sync name -> counters
+        self.stats = {}
+
+    def __len__(self):
+        return len(self.hosted)
+
+    def put(self, sync, task):
+        """
+        Buffer `task' and run its synchroniser. Return the messages sent to
+        other statements as (output port, content, consumed task) tuples.
+        """
+        pc = task.pc
+        inputs = self.plan.inputs[pc]
+        succ = self.plan.succ[pc]
+
+        if not isinstance(task.content, Mapping):
+            raise TypeError('Synchroniser %s got %r on channel %s, '
+                            'synchronisers take records (dicts).'
+                            % (sync.name, task.content,
+                               self.plan.channels[task.channel]))
+
+        labels = getattr(sync, 'labels', None)
+        host = self.hosted.get(pc)
+
+        if host is None:
+            if labels:
+                host = SyncTable(sync, len(inputs))
+            else:
+                host = [sync.init(), [deque() for _ in inputs]]
+
+            self.hosted[pc] = host
+
+        stats = self.stats.get(sync.name)
+
+        if stats is None:
+            stats = self.stats[sync.name] = {'received': 0, 'transitions': 0,
+                                             'sent': 0, 'time': 0.}
+
+            if labels:
+                stats.update(instances=0, created=0, evicted=0)
+
+        if labels:
+            table = host
+            key = table_key(labels, task.content)
+
+            live = len(table)
+            host = table.get(key)
+            stats['created'] += len(table) - live
+
+        state, buffers = host
+        buffers[inputs.index(task.channel)].append(task)
+        stats['received'] += 1
+
+        sent = []
+        start = time.perf_counter()
+
+        while True:
+            heads = {port: buf[0].content
+                     for port, buf in enumerate(buffers) if buf}
+
+            output, state, consumed = sync.run(state, heads)
+
+            if not consumed:
+                break
+
+            stats['transitions'] += 1
+
+            for port in consumed:
+                origin = buffers[port].popleft()
+
+            for port, msgs in output.items():
+                stats['sent'] += len(msgs)
+
+                if succ[port] == pc:
+                    # Feedback to this statement.
+                    channel = self.plan.outputs[pc][port]
+                    buf = buffers[inputs.index(channel)]
+
+                    for content in msgs:
+                        m = Message(content, origin.id_eye(port),
+                                    origin.bracket)
+                        m.set_loc(channel, pc)
+                        buf.append(m)
+
+                else:
+                    sent.extend((port, content, origin) for content in msgs)
+
+        host[0] = state
+
+        if labels:
+            stats['evicted'] += table.release(key)
+            stats['instances'] = stats['created'] - stats['evicted']
+
+        stats['time'] += time.perf_counter() - start
+
+        return sent
@@ -0,0 +1,294 @@
+import time
+import pickle
+from collections import deque
+from queue import Empty
+
+__all__ = ['Transport', 'RingTransport', 'Empty']
+
+
+class Transport:
+    """
+    Inter-worker transport over one inbound queue per worker.
+
+    Records sent to the same worker are coalesced into batches: a batch is
+    put on the queue when it reaches `batch_size' records, when the sender is
+    about to go idle (flush()), or right away for urgent control records.
+
+    If `arrays' is given (see akr.arrays), large NumPy arrays in records are
+    passed through shared memory.
+    """
+
+    def __init__(self, wid, queues, batch_size=1, arrays=None):
+        self.wid = wid
+        self.queues = queues
+        self.n_workers = len(queues)
+        self.batch_size = batch_size
+        self.arrays = arrays
+
+        self.buffers = [[] for _ in queues]
+
+        # Received records not consumed yet.
+        self.inbox = deque()
+
+        self.stats = {
+            'batches_sent': 0,
+            'records_sent': 0,
+            'batches_received': 0,
+            'records_received': 0,
+        }
+
+    def send(self, wid, record, urgent=False):
+        if self.arrays is not None:
+            shared = self.arrays.export(record)
+
+            if shared is not None:
+                record = ('shared', shared)
+
+        buf = self.buffers[wid]
+        buf.append(record)
+
+        if urgent or len(buf) >= self.batch_size:
+            self.flush(wid)
+
+    def flush(self, wid=None):
+        """Put buffered records of `wid' (all workers by default)."""
+        wids = range(self.n_workers) if wid is None else (wid, )
+
+        for wid in wids:
+            buf = self.buffers[wid]
+
+            if buf:
+                self.buffers[wid] = []
+                self.put(wid, buf)
+
+                self.stats['batches_sent'] += 1
+                self.stats['records_sent'] += len(buf)
+
+    def recv(self, block=True, timeout=None):
+        """
+        Return the next inbound record. Raise Empty if there is none (after
+        `timeout' seconds if blocking).
+        """
+        if not self.inbox:
+            batch = self.get(block, timeout)
+
+            self.inbox.extend(batch)
+
+            self.stats['batches_received'] += 1
+            self.stats['records_received'] += len(batch)
+
+        record = self.inbox.popleft()
+
+        if record[0] == 'shared':
+            record = self.arrays.attach(record[1])
+
+        return record
+
+    def recv_all(self, block=True, timeout=None, max_batches=64):
+        """
+        Return all inbound records at once: those received and not consumed
+        yet, and those of the batches pending, up to `max_batches' of them.
+        If there are none, wait for a batch (at most `timeout' seconds) if
+        blocking, or raise Empty.
+        """
+        records = list(self.inbox)
+        self.inbox.clear()
+
+        pending = len(records)
+        n = 0
+
+        if not records:
+            records.extend(self.get(block, timeout))
+            n = 1
+
+        while n < max_batches:
+            try:
+                batch = self.get(False, None)
+            except Empty:
+                break
+
+            records.extend(batch)
+            n += 1
+
+        self.stats['batches_received'] += n
+        self.stats['records_received'] += len(records) - pending
+
+        if self.arrays is not None:
+            records = [self.arrays.attach(r[1]) if r[0] == 'shared' else r
+                       for r in records]
+
+        return records
+
+    def put(self, wid, batch):
+        self.queues[wid].put(batch)
+
+    def get(self, block, timeout):
+        return self.queues[self.wid].get(block, timeout)
+
+
+class RingTransport(Transport):
+    """
+    Transport over shared-memory rings, one per ordered pair of workers.
+
+    A batch is pickled into the ring of the destination. The destination is
+    woken up through its doorbell semaphore, which is only released if the
+    destination announced that it is about to sleep. If a ring is full,
+    batches wait in a local backlog and are retried on the next flush or
+    receive, so that two workers sending to each other never block. Batches
+    larger than a ring go through the queue of the destination instead, in
+    no particular order with those of the ring. A queue put may reach the
+    pipe after the doorbell is rung: a worker rung with nothing in its rings
+    waits on its queue for POLL_INTERVAL before it sleeps again.
+    """
+
+    POLL_INTERVAL = 0.01
+    MAX_WAIT = 0.1
+
+    def __init__(self, wid, queues, rings, bells, batch_size=1, arrays=None):
+        super().__init__(wid, queues, batch_size, arrays)
+
+        n = self.n_workers
+
+        self.bells, self.sleeping = bells
+        self.outbound = {dst: rings[wid, dst] for dst in range(n) if dst != wid}
+        self.inbound = [rings[src, wid] for src in range(n) if src != wid]
+
+        self.backlog = {dst: deque() for dst in self.outbound}
+        self.n_backlog = 0
+
+        # Inbound ring to poll first, for fairness.
+        self.next_ring = 0
+
+    @staticmethod
+    def create(queues, capacity=1 << 20):
+        """Allocate rings and doorbells for len(queues) workers."""
+        from multiprocessing import Semaphore, RawArray
+        from .shm import Ring
+
+        n = len(queues)
+
+        rings = {(src, dst): Ring(capacity)
+                 for src in range(n) for dst in range(n) if src != dst}
+        bells = [Semaphore(0) for _ in range(n)], RawArray('b', n)
+
+        return rings, bells
+
+    @staticmethod
+    def destroy(rings):
+        for ring in rings.values():
+            ring.close()
+            ring.unlink()
+
+    def flush(self, wid=None):
+        super().flush(wid)
+
+        if self.n_backlog:
+            self.retry()
+
+    def put(self, wid, batch):
+        data = pickle.dumps(batch, pickle.HIGHEST_PROTOCOL)
+        ring = self.outbound[wid]
+
+        if not ring.fits(len(data)):
+            self.queues[wid].put(batch)
+
+        elif self.backlog[wid] or not ring.write(data):
+            # Keep the order of batches behind the backlog.
+            self.backlog[wid].append(data)
+            self.n_backlog += 1
+            return
+
+        self.ring(wid)
+
+    def ring(self, wid):
+        # A spurious release only costs the destination an extra poll.
+        if self.sleeping[wid]:
+            self.sleeping[wid] = 0
+            self.bells[wid].release()
+
+    def retry(self):
+        for wid, backlog in self.backlog.items():
+            ring = self.outbound[wid]
+            sent = False
+
+            while backlog and ring.write(backlog[0]):
+                backlog.popleft()
+                self.n_backlog -= 1
+                sent = True
+
+            if sent:
+                self.ring(wid)
+
+    def get(self, block, timeout):
+        bell = self.bells[self.wid]
+        deadline = None if timeout is None else time.perf_counter() + timeout
+
+        while True:
+            if self.n_backlog:
+                self.retry()
+
+            batch = self.poll()
+
+            if batch is not None:
+                return batch
+
+            if not block:
+                raise Empty
+
+            # Announce sleeping before the last check: a batch written after
+            # the check rings the doorbell.
+            self.sleeping[self.wid] = 1
+
+            batch = self.poll()
+
+            if batch is not None:
+                self.sleeping[self.wid] = 0
+                return batch
+
+            wait = self.POLL_INTERVAL if self.n_backlog else self.MAX_WAIT
+
+            if deadline is not None:
+                left = deadline - time.perf_counter()
+
+                if left <= 0:
+                    raise Empty
+
+                wait = min(wait, left)
+
+            rung = bell.acquire(True, wait)
+            self.sleeping[self.wid] = 0
+
+            if not rung:
+                continue
+
+            # Rung: the batch is in a ring, or on its way through the queue.
+            batch = self.poll()
+
+            if batch is not None:
+                return batch
+
+            wait = self.POLL_INTERVAL
+
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.perf_counter(), 0))
+
+            try:
+                return self.queues[self.wid].get(True, wait)
+            except Empty:
+                pass
+
+    def poll(self):
+        n = len(self.inbound)
+
+        for i in range(n):
+            ring = self.inbound[(self.next_ring + i) % n]
+            data = ring.read()
+
+            if data is not None:
+                self.next_ring = (self.next_ring + i + 1) % n
+                return pickle.loads(data)
+
+        try:
+            return self.queues[self.wid].get(False)
+        except Empty:
+            return None
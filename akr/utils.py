@@ -1,22 +1,24 @@
-from typing import Iterable
+MASK = (1 << 64) - 1
 
+# List identifiers are 64-bit hashes. Python's hash of a tuple of ints is
+# computed in C and is the same in every process of an interpreter: unlike
+# strings, ints are not salted by PYTHONHASHSEED. The tuple hash algorithm
+# changes between CPython versions (it is xxHash-based since 3.8), so
+# processes that exchange messages must run the same version (see
+# ids_fingerprint()).
+#
+# Message.id_eye() hashes (list_id, port) for the identifier of a list after
+# it passes through `port', inline.
 
-def partition(lst: Iterable, n: int) -> list:
-    lst = list(lst)
-    return [lst[i::n] for i in range(n)]
 
+def mix_seq(ids: tuple, port: int) -> int:
+    """Identifier of a new list made by `port' from the message `ids'."""
+    return hash((ids, port)) & MASK
 
-import hashlib
 
-def md5i(n: int, p: int) -> int:
-    nb = (n + p).to_bytes(16, 'little')
-    h = hashlib.md5(nb).digest()
-    return int.from_bytes(h, 'little')
-
-def md5s(s: bytes, p: int) -> int:
-    sp = s + p.to_bytes(16, 'little')
-    h = hashlib.md5(sp).digest()
-    return int.from_bytes(h, 'little')
-
-def to_bytes(n: int) -> bytes:
-    return n.to_bytes(16, 'little')
+def ids_fingerprint() -> int:
+    """
+    Identifier of a list made from a fixed message: processes that compute
+    the same one make the same list identifiers.
+    """
+    return mix_seq((1, 2, 3, 4), 5)
@@ -1,9 +1,13 @@
+import io
+import keyword
+import tokenize
 from collections import defaultdict
 from itertools import chain
 
 from . import lexer as sync_lexer
 from . import parser as sync_parser
 from .backend import SyncBuilder
+from .ast import StateVar
 
 
 def indent(level):
@@ -18,6 +22,66 @@ def iprint(level, text):
         return indent(level) + text + "\n"
 
 
+def rewrite(exp, local_names, state_names, this=None):
+    """
+    Resolve the variables of a Python expression at compile time.
+
+    Names of transition locals become lookups in `local_vars', names of
+    state variables lookups in `state', and `__this__' becomes `this'.
+    Other names (builtins, ChainMap) are left as they are. This replaces
+    eval() of the expression source, which took the same two scopes.
+    """
+    tokens = tokenize.generate_tokens(io.StringIO(exp).readline)
+
+    out = []
+    last = 0
+    prev = None
+
+    for tok in tokens:
+        if tok.type == tokenize.NAME and not keyword.iskeyword(tok.string) \
+                and not (prev and prev.string == '.'):
+            name = tok.string
+
+            if name in local_names:
+                sub = 'local_vars["%s"]' % name
+            elif name in state_names:
+                sub = 'state.%s' % name
+            elif name == '__this__' and this:
+                sub = this
+            else:
+                sub = None
+
+            if sub:
+                assert tok.start[0] == tok.end[0] == 1
+                out.append(exp[last:tok.start[1]])
+                out.append(sub)
+                last = tok.end[1]
+
+        if tok.type not in (tokenize.NEWLINE, tokenize.NL,
+                            tokenize.ENDMARKER):
+            prev = tok
+
+    out.append(exp[last:])
+
+    return ''.join(out)
+
+
+def frozen(labels):
+    """Source of a frozenset of strings."""
+    if labels:
+        return 'frozenset({%s})' % ', '.join(map(repr, labels))
+    else:
+        return 'frozenset()'
+
+
+def guard(predicate_src):
+    """Source of a guard function, or None if it is always true."""
+    if predicate_src.strip() == 'True':
+        return 'None'
+    else:
+        return 'lambda state, local_vars: %s' % predicate_src
+
+
 def compile(code):
     asts = compile_to_ast(code)
 
@@ -48,8 +112,10 @@ def preamble():
     return output
 
 
-def compile_sync(ast):
-    # Build intermediate representation.
+def compile_sync(ast, labels=()):
+    # Build intermediate representation. `labels' are those of a synch table
+    # (`tab [i, j] synch s'): their values in an instance are constants,
+    # kept with its state.
 
     tree, vars, actions = SyncBuilder(ast).compile()
 
@@ -61,48 +127,70 @@ def compile_sync(ast):
 
     sync_name = sync_label.split(':')[1]
 
+    state_vars = [v.split('=')[0] for v in vars] + list(labels)
+    state_names = set(state_vars)
+
+    # Declared widths of int(N) variables.
+    widths = {decl.name: decl.type.size for decl in ast.decls.decls
+              if isinstance(decl, StateVar)}
+
     level = 0
     output = ''
 
     output += iprint(level, 'class %s:' % sync_name)
     level += 1
 
+    # Category and name used by the runtime to dispatch messages.
+    output += iprint(level, 'cat = "sync"')
+    output += iprint(level, 'name = "%s"' % sync_name)
+    output += iprint(level, '')
+
+    if labels:
+        output += iprint(level, 'labels = (%s)' % ''.join(
+            '"%s", ' % label for label in labels))
+        output += iprint(level, '')
+
+    output += iprint(level, 'class State(State):')
+    output += iprint(level + 1, '__slots__ = _stores = (%s)' % ''.join(
+        '"%s", ' % name for name in state_vars if name not in widths))
+    output += iprint(level + 1, '_ints = (%s)' % ''.join(
+        '("%s", %d), ' % (name, widths[name])
+        for name in state_vars if name in widths))
+    output += iprint(level, '')
+
     extracts = {}
     ghosts = {}
 
-    output += iprint(level, '@staticmethod')
-    output += iprint(level, 'def test(state, msgs, return_locals=False):')
-    level += 1
+    # Names bound by the pattern of each transition.
+    act_locals = defaultdict(set)
 
-    output += iprint(level, 'if not msgs: return None')
-    output += iprint(level, '')
+    # Decision table: transitions by state, in order of priority.
+    output += iprint(level, '_table = {')
+    level += 1
 
-    output += iprint(level, 'valid_acts = []')
-    output += iprint(level, '')
+    single = []
+    terminal = []
 
     # -- state level --
-    for st_i, state in enumerate(states):
+    for state in states:
         state_label, *scopes = state
         assert state_label.startswith('state:')
 
         state_name = state_label.split(':')[1]
 
-        output += iprint(level, '%sif state.name == "%s":'
-                         % ('el' if st_i > 0 else '', state_name))
-
+        output += iprint(level, '"%s": (' % state_name)
         level += 1
 
-        # -- scope level --
-        for sc_i, scope in enumerate(scopes):
-
-            if sc_i > 0:
-                output += iprint(level, '')
-                output += iprint(level, 'if not valid_acts:')
-                level += 1
+        n_trans = 0
 
+        # -- scope level --
+        for scope in scopes:
             scope_label, *ports = scope
             assert scope_label.startswith('scope:')
 
+            output += iprint(level, '(')
+            level += 1
+
             # -- port level --
             for port in ports:
                 port_label, *transitions = port
@@ -110,107 +198,96 @@ def compile_sync(ast):
 
                 port_id = int(port_label.split(':')[1])
 
-                output += iprint(level, 'if msgs.get(%d, None):' % port_id)
-                level += 1
-
-                tests = defaultdict(list)
-
-                for _, test, trans in transitions:
-                    if test:
-                        pattern, tail, depth = test
-                        s = (tuple(sorted(pattern)), tail, depth)
-                    else:
-                        s = None
+                entries = []
+                otherwise = []
 
-                    tests[s].append(trans)
-
-                # -- test level --
-                for test, predicates in tests.items():
+                for _, test, (predicate_label, act_id) in transitions:
+                    predicate = ':'.join(predicate_label.split(':')[1:])
+                    n_trans += 1
 
                     if test is None:
                         # else-clause
+                        guard_src = guard(rewrite(predicate, (), state_names))
+                        otherwise.append('(%d, %s)' % (act_id, guard_src))
                         continue
 
                     pattern, tail, depth = test
+                    pattern = tuple(sorted(pattern))
 
-                    labels = pattern + (('__n__',) if depth is not None else ())
-
-                    pattern_src = '{%s}' % ', '.join(map(repr, labels))\
-                        if labels else 'set()'
-                    test_src = '%s <= msgs[%d].keys()' % (pattern_src, port_id)
-
-                    output += iprint(level, 'if %s:' % test_src)
-                    level += 1
-
-                    for pr_i, (predicate_label, act_id) in enumerate(
-                            predicates):
-                        predicate = ':'.join(predicate_label.split(':')[1:])
+                    keys = pattern + (('__n__',) if depth is not None else ())
 
-                        extract_src = '%s._extract(msgs[%d], %d)' % (sync_name,
-                                                                     port_id,
-                                                                     act_id)
+                    # Save test values for lookup table.
+                    extracts[act_id] = '[%s], %s, %s' % (
+                        ', '.join(map(repr, pattern)),
+                        repr(tail),
+                        repr(depth)
+                    )
 
-                        # Save test values for lookup table.
-                        extracts[act_id] = '[%s], %s, %s' % (
-                            ', '.join(map(repr, pattern)),
-                            repr(tail),
-                            repr(depth)
-                        )
+                    act_locals[act_id].update(pattern)
+                    act_locals[act_id].update(n for n in (tail, depth) if n)
 
-                        eval_src = 'eval("%s", state.scope(), local_vars)' % predicate
+                    guard_src = guard(rewrite(predicate, act_locals[act_id],
+                                              state_names))
 
-                        output += iprint(level, 'local_vars = %s' % extract_src)
-                        output += iprint(level, 'if %s:' % eval_src)
-                        level += 1
-                        output += iprint(level, 'valid_acts.append((%d, %d, local_vars))'
-                                                % (act_id, port_id))
-                        level -= 1
+                    entries.append('(%s, %d, %s, %s)' % (
+                        frozen(keys), act_id, guard_src, extracts[act_id]))
 
-                    level -= 1
-                # -- test level --
+                output += iprint(level, '(%d, (' % port_id)
+                for entry in entries:
+                    output += iprint(level + 1, '%s,' % entry)
+                output += iprint(level, '), (%s)),' % ''.join(
+                    '%s, ' % e for e in otherwise))
+            # -- port level --
 
-                # -- else level --
-                if None in tests:
-                    output += iprint(level, 'else:')
-                    level += 1
+            level -= 1
+            output += iprint(level, '),')
+        # -- scope level --
 
-                    for i, (predicate_label, act_id) in enumerate(tests[None]):
-                        predicate = ':'.join(predicate_label.split(':')[1:])
+        if n_trans == 1:
+            single.append(state_name)
+        elif n_trans == 0:
+            terminal.append(state_name)
 
-                        eval_src = 'eval("%s", state.scope())' % predicate
-                        output += iprint(level, 'if %s:' % eval_src)
-                        level += 1
-                        output += iprint(level, 'valid_acts.append((%d, %d, {}))'
-                                         % (act_id, port_id))
-                        level -= 1
+        level -= 1
+        output += iprint(level, '),')
+    # -- state level --
 
-                    level -= 1
+    level -= 1
+    output += iprint(level, '}')
+    output += iprint(level, '')
 
-                level -= 1
-                # -- else level --
+    # States with a single transition: the first one enabled is the only one.
+    output += iprint(level, '_single = %s' % frozen(single))
+    output += iprint(level, '')
 
-            # -- port level --
+    # States without transitions, declared or not.
+    declared = {state[0].split(':')[1] for state in states}
+    terminal.extend(sorted({act[1] for acts in actions.values()
+                            for act in acts if act[0] == 'Goto'} - declared))
 
-            # Scope
-            if sc_i > 0:
-                level -= 1
-        # -- scope level --
+    output += iprint(level, 'terminal = %s' % frozen(terminal))
+    output += iprint(level, '')
 
-        # State
-        level -= 1
-        output += iprint(level, '')
-    # -- state level --
+    # Fire the first enabled transition instead of a random one.
+    output += iprint(level, 'first_match = False')
+    output += iprint(level, '')
 
-    output += iprint(level, 'if not valid_acts:')
+    output += iprint(level, '@staticmethod')
+    output += iprint(level, 'def test(state, msgs, return_locals=False):')
     level += 1
-    output += iprint(level, 'return None')
-    level -= 1
+
+    output += iprint(level, 'if not msgs: return None')
     output += iprint(level, '')
 
-    output += iprint(level, 'act_id, port_id, local_vars = choice(valid_acts)')
+    output += iprint(level, 'name = state._name')
+    output += iprint(level, 'test = dispatch(%s._table.get(name, ()), state, msgs,'
+                            % sync_name)
+    output += iprint(level, '                %s.first_match or name in %s._single)'
+                            % (sync_name, sync_name))
     output += iprint(level, '')
-    output += iprint(level, 'if return_locals: return act_id, port_id, local_vars')
-    output += iprint(level, 'else: return act_id, port_id')
+
+    output += iprint(level, 'if test is None or return_locals: return test')
+    output += iprint(level, 'else: return test[:2]')
 
     output += iprint(level, '')
     output += iprint(level, '')
@@ -219,17 +296,15 @@ def compile_sync(ast):
     # --------------------------------------------------------------------------
 
     output += iprint(level, '@staticmethod')
-    output += iprint(level, 'def execute(orig_state, msg, act_id, '
-                            'local_vars=None):')
+    output += iprint(level, 'def execute(state, msg, act_id, '
+                            'local_vars=None, snapshot=False):')
     level += 1
 
-    output += iprint(level, 'state = orig_state.copy()')
+    output += iprint(level, 'if snapshot: state = state._copy()')
     output += iprint(level, 'output = defaultdict(list)')
 
-    output += iprint(level, 'if not local_vars: '
+    output += iprint(level, 'if local_vars is None: '
                             'local_vars = %s._extract(msg, act_id)' % sync_name)
-    output += iprint(level, 'system = {"ChainMap": ChainMap, "__this__": msg}')
-    output += iprint(level, 'scope = dict(ChainMap(state.scope(), system))')
 
     output += iprint(level, '')
 
@@ -239,6 +314,8 @@ def compile_sync(ast):
                          '%sif act_id == %d:' % ('el' if i > 0 else '', act_id))
         level += 1
 
+        local_names = set(act_locals[act_id])
+
         if not acts:
             output += iprint(level, 'pass')
 
@@ -247,22 +324,33 @@ def compile_sync(ast):
 
                 if act_label == 'Assign':
                     lhs, rhs = act
-                    output += iprint(level, 'local_vars["%s"] = eval(%s, '
-                                            'scope, local_vars)' % (lhs,
-                                                                    repr(rhs)))
+                    rhs_src = rewrite(rhs, local_names, state_names, 'msg')
+
+                    if lhs in state_names:
+                        # Set in place.
+                        output += iprint(level, 'state.%s = %s'
+                                                % (lhs, rhs_src))
+                        local_names.discard(lhs)
+                    else:
+                        output += iprint(level, 'local_vars["%s"] = %s'
+                                                % (lhs, rhs_src))
+                        local_names.add(lhs)
 
                 if act_label == 'Send':
                     msg, port = act
-                    output += iprint(level, 'output[%d].append(' % port)
-                    output += iprint(level, '   eval(%s, scope, '
-                                            'local_vars)' % repr(msg))
-                    output += iprint(level, ')')
+                    msg_src = rewrite(msg, local_names, state_names, 'msg')
+                    output += iprint(level, 'output[%d].append(%s)'
+                                            % (port, msg_src))
 
                 if act_label == 'Goto':
                     state = act[0]
-                    output += iprint(level, 'state.name = "%s"' % state)
+                    output += iprint(level, 'state._name = "%s"' % state)
+
+        # Pattern variables named after state variables are stored.
+        for name in sorted(local_names & state_names - set(labels)):
+            output += iprint(level, 'state.%s = local_vars["%s"]'
+                                    % (name, name))
 
-        output += iprint(level, 'state.update(local_vars)')
         output += iprint(level, '')
         level -= 1
 
@@ -277,8 +365,9 @@ def compile_sync(ast):
     output += iprint(level, '@staticmethod')
     output += iprint(level, 'def init():')
     level += 1
-    output += iprint(level,
-                     'return State(name="start", %s)' % (", ".join(vars)))
+    output += iprint(level, 'return %s.State("start", %s)'
+                            % (sync_name, ", ".join(
+                                vars + ['%s=None' % l for l in labels])))
     level -= 1
     output += iprint(level, '')
 
@@ -302,7 +391,7 @@ def compile_sync(ast):
     # --------------------------------------------------------------------------
 
     output += iprint(level, '@staticmethod')
-    output += iprint(level, 'def run(state, msgs):')
+    output += iprint(level, 'def run(state, msgs, snapshot=False):')
     level += 1
 
     output += iprint(level, 'test = %s.test(state, msgs, True)' % sync_name)
@@ -311,7 +400,8 @@ def compile_sync(ast):
 
     output += iprint(level, 'act_id, port_id, local_vars = test')
     output += iprint(level, 'output, state = %s.execute(state, '
-                            'msgs[port_id], act_id, local_vars)' % sync_name)
+                            'msgs[port_id], act_id, local_vars, snapshot)'
+                            % sync_name)
 
     output += iprint(level, 'return(output, state, (port_id,))')
 
@@ -1,5 +1,7 @@
+import struct
 from typing import Sequence, Tuple
 from collections import ChainMap
+from random import choice
 
 
 def extract(msg, pattern, tail=None, depth=None):
@@ -17,24 +19,171 @@ def extract(msg, pattern, tail=None, depth=None):
     return local_vars
 
 
+def dispatch(scopes, state, msgs, first=False):
+    """
+    Find a transition of `state' enabled by `msgs' (port -> message).
+
+    `scopes' is the decision table of the state: its scopes in order of
+    priority, each a sequence of (port, transitions, else-transitions). A
+    transition is (labels, act_id, guard, pattern, tail, depth) with frozen
+    `labels', an else-transition (act_id, guard); a guard is None if it is
+    always true. Else-transitions are enabled if no pattern of their port
+    matches the message.
+
+    Return (act_id, port, local_vars) of a random transition enabled in
+    the first scope that has any, or of the first one enabled if `first' is
+    set; None if none is enabled.
+    """
+    for scope in scopes:
+        valid_acts = []
+
+        for port, transitions, otherwise in scope:
+            msg = msgs.get(port)
+
+            if not msg:
+                continue
+
+            keys = msg.keys()
+            matched = False
+
+            for labels, act_id, guard, pattern, tail, depth in transitions:
+                if labels <= keys:
+                    matched = True
+                    local_vars = extract(msg, pattern, tail, depth)
+
+                    if guard is None or guard(state, local_vars):
+                        if first:
+                            return act_id, port, local_vars
+
+                        valid_acts.append((act_id, port, local_vars))
+
+            if not matched:
+                for act_id, guard in otherwise:
+                    if guard is None or guard(state, {}):
+                        if first:
+                            return act_id, port, {}
+
+                        valid_acts.append((act_id, port, {}))
+
+        if valid_acts:
+            if len(valid_acts) == 1:
+                return valid_acts[0]
+            else:
+                return choice(valid_acts)
+
+    return None
+
+
+# Struct formats of int(N) variables by size in bytes.
+INT_FORMATS = ((1, 'b'), (2, 'h'), (4, 'i'), (8, 'q'))
+
+
+def int_property(width, offset):
+    """
+    Property of an int(`width') variable stored at `offset' of the buffer
+    of a State, and the number of bytes it takes.
+    """
+    if width < 1:
+        raise ValueError('int(%d): width must be positive' % width)
+
+    size = (width + 7) // 8
+    sign = 1 << (width - 1)
+    mask = (sign << 1) - 1
+
+    for n, fmt in INT_FORMATS:
+        if size <= n:
+            packer = struct.Struct('<' + fmt)
+            unpack_from, pack_into = packer.unpack_from, packer.pack_into
+
+            def get(self):
+                return unpack_from(self._buf, offset)[0]
+
+            def set(self, value):
+                pack_into(self._buf, offset, ((value & mask) ^ sign) - sign)
+
+            return property(get, set), n
+
+    # Wider than 64 bits.
+    end = offset + size
+
+    def get(self):
+        return int.from_bytes(self._buf[offset:end], 'little', signed=True)
+
+    def set(self, value):
+        value = ((value & mask) ^ sign) - sign
+        self._buf[offset:end] = value.to_bytes(size, 'little', signed=True)
+
+    return property(get, set), size
+
+
 class State:
+    """
+    State of a synchroniser: the name of its current state and its
+    variables.
+
+    The compiler derives a class per synchroniser that lists its store
+    variables in __slots__ and `_stores', and its int(N) variables with
+    their widths in `_ints'. Int variables are packed into one bytearray,
+    each in the smallest of 1, 2, 4 or 8 bytes that holds N bits (or
+    ceil(N/8) bytes beyond 64 bits). They are signed N-bit integers: a
+    value out of range wraps around, as in two's complement arithmetic.
+
+    Transitions update the state in place; _copy() takes a snapshot, with a
+    single copy of the buffer.
+
+    Variables are attributes named as in the synchroniser, hence all names
+    of State itself, including that of the current state (`_name'), start
+    with an underscore.
+    """
 
-    def __init__(self, name: str, **kawrgs):
-        self.name = name
-        self._variables = kawrgs.copy()
+    __slots__ = ('_name', '_buf')
 
-    def scope(self):
-        return dict(self._variables)
+    _stores = ()
+    _ints = ()
+
+    _variables = ()
+    _size = 0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        offset = 0
+
+        for name, width in cls._ints:
+            prop, size = int_property(width, offset)
+            setattr(cls, name, prop)
+            offset += size
+
+        cls._size = offset
+        cls._variables = tuple(cls._stores) + tuple(n for n, _ in cls._ints)
+
+    def __init__(self, _name: str, **kwargs):
+        self._name = _name
+        self._buf = bytearray(self._size)
+
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    def _scope(self):
+        return {k: getattr(self, k) for k in self._variables}
 
     def __getitem__(self, name):
-        return self._variables[name]
+        return getattr(self, name)
 
     def __setitem__(self, name, value):
-        self._variables[name] = value
+        setattr(self, name, value)
+
+    def _update(self, new):
+        for k in self._variables:
+            if k in new:
+                setattr(self, k, new[k])
+
+    def _copy(self):
+        new = object.__new__(type(self))
+        new._name = self._name
+        new._buf = bytearray(self._buf)
 
-    def update(self, new):
-        for k in self._variables.keys() & new.keys():
-            self._variables[k] = new[k]
+        for k in self._stores:
+            setattr(new, k, getattr(self, k))
 
-    def copy(self):
-        return State(self.name, **self._variables)
+        return new
@@ -19,8 +19,7 @@ def splitter(m):
         for i in range(m['Nb']):
             for j in range(i+1):
                 sl = (slice(i*bsz, (i+1)*bsz), slice(j*bsz, (j+1)*bsz))
-                A = m['A'].copy()
-                A[sl]
+                A = m['A'][sl].copy()
                 blocks.append({'Nb': m['Nb'], 'i': i, 'j': j, 'Aij': A})
 
         m['blocks'] = blocks
@@ -62,43 +61,28 @@ synch Router (_1 | _1, _2, _3)
 def InitFact(m):
     import numpy as np
 
-    sAij = m['Aij']
-    Aij = sAij.open()
+    Aij = m['Aij']
+    Aij[:] = np.linalg.cholesky(Aij)
 
-    t = np.linalg.cholesky(Aij)
-    Aij[:][:] = t
-
-    # Clean up shared object.
-    del Aij
-    sAij.close()
-
-    m['Lij'] = sAij
+    m['Lij'] = Aij
     del m['Aij']
     m['Nr'] = m['Nb'] - m['i'] - 1
 
-    r = {'Lij': sAij, 'Nb': m['Nb'], 'i': m['i'], 'j': m['j']}
+    r = {'Lij': Aij, 'Nb': m['Nb'], 'i': m['i'], 'j': m['j']}
     return ('send', {0: [m], 1: [r]}, None)
 
 @transductor(2)
 def TrigSolve(m):
     import numpy as np
 
-    sAij, sLij = m['Aij'], m['Lij']
-    Aij, Lij = sAij.open(), sLij.open()
-
-    t = np.dot(Aij, np.linalg.inv(Lij.T))
-    Aij[:][:] = t
-
-    # Clean up shared object.
-    del Aij, Lij
-    sAij.close()
-    sLij.close()
+    Aij, Lij = m['Aij'], m['Lij']
+    Aij[:] = np.dot(Aij, np.linalg.inv(Lij.T))
 
     m['Nr'] = m['Nb']
-    m['Lij'] = sAij
+    m['Lij'] = Aij
     del m['Aij']
 
-    r = {'Lij': sAij, 'Nb': m['Nb'], 'i': m['i'], 'j': m['j']}
+    r = {'Lij': Aij, 'Nb': m['Nb'], 'i': m['i'], 'j': m['j']}
     return ('send', {0: [m], 1: [r]}, None)
 
 
@@ -106,16 +90,8 @@ def TrigSolve(m):
 def SymRank(m):
     import numpy as np
 
-    sAij, sLik, sLjk = m['Aij'], m['Lik'], m['Ljk']
-    Aij, Lik, Ljk = sAij.open(), sLik.open(), sLjk.open()
-
-    t = Aij - np.dot(Lik, Ljk.T)
-    Aij[:][:] = t
-
-    del Aij, Lik, Ljk
-    sAij.close()
-    sLik.close()
-    sLjk.close()
+    Aij, Lik, Ljk = m['Aij'], m['Lik'], m['Ljk']
+    Aij -= np.dot(Lik, Ljk.T)
 
     del m['Lik'], m['Ljk']
     return ('send', {0: [m]}, None)
@@ -382,13 +358,8 @@ def ResultCombiner(ma, mb):
     ma['blocks'].remove((mb['i'], mb['j']))
 
     if not ma['blocks']:
-        ma['Lij'].key = None
-
-        A = ma['Lij'].open()
-        A[:][:] = np.tril(A)
-
-        del A
-        ma['Lij'].close()
+        A = ma['Lij']
+        A[:] = np.tril(A)
 
         return ('partial', {}, {'A': ma['Lij']})
 
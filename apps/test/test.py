@@ -1,8 +1,10 @@
+from operator import add
+
 from akc.boxes import *
 
 @transductor(1)
 def bar(m):
-    r = m ** 2
+    r = m['x'] * m['y']
     return (r, )
 
 @inductor(1)
@@ -11,7 +13,7 @@ def gen(m):
     gen.cont = r if r < 10 else None
     return (r, )
 
-@reductor(MONADIC, UNORDERED, 1)
+@reductor(MONADIC, UNORDERED, 1, combine=add)
 def summ(m):
     if summ.cont is None:
         summ.cont = 0
@@ -19,8 +21,9 @@ def summ(m):
 
 @transductor(2)
 def foo(m):
-    r1 = m - 1
-    r2 = m + 1
+    # Records for the zip synchroniser.
+    r1 = {'x': m - 1}
+    r2 = {'y': m + 1}
     return (r1, r2)
 
 def __output__(channel, msg):
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+'''
+Throughput of a box calling out to a slow local service, by concurrency.
+
+The service is a TCP server on localhost that answers every request after
+`latency' seconds. The box sends each number of a list to the server and
+an unordered reductor sums the answers. The box blocks the worker in the
+process backend, which is the baseline. With the asyncio backend it is a
+coroutine, and every worker keeps up to `concurrency' calls in flight.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import socket
+import asyncio
+from multiprocessing import Process, Queue
+from operator import add
+from optparse import OptionParser
+
+import akr
+
+
+# Port of the service and expected sum, checked by the output.
+port = None
+expected = None
+
+
+def serve(latency, ports):
+    async def handle(reader, writer):
+        line = await reader.readline()
+        await asyncio.sleep(latency)
+
+        writer.write(line)
+        await writer.drain()
+        writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0,
+                                            backlog=1024)
+        ports.put(server.sockets[0].getsockname()[1])
+
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+@akr.transductor
+def query(m):
+    with socket.create_connection(('127.0.0.1', port)) as s:
+        s.sendall(b'%d\n' % m)
+        reply = s.makefile('rb').readline()
+
+    return (int(reply), )
+
+
+@akr.transductor
+async def aquery(m):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+
+    writer.write(b'%d\n' % m)
+    reply = await reader.readline()
+
+    writer.close()
+    await writer.wait_closed()
+
+    return (int(reply), )
+
+
+@akr.reductor(False, combine=add)
+def summ(m):
+    summ.cont = (summ.cont or 0) + m
+
+
+@akr.output
+def __output__(channel, msg):
+    assert msg[0] == expected
+
+
+def make_nodes(box):
+    return [
+        ('bb_1', {'stmts': [(box, ('_1',), ('_1',)),
+                            (summ, ('_1',), ('r1',))]}),
+        ('bb_1_exit_r1', {'stmts': [(__output__, ('r1',), ())]}),
+    ]
+
+
+edges = [
+    ('bb_1', 'bb_1_exit_r1', {'chn': {'r1'}}),
+]
+
+
+def measure(n_workers, n, concurrency=None):
+    global expected
+
+    box = query if concurrency is None else aquery
+
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from(make_nodes(box))
+    cfg.add_edges_from(edges)
+    cfg.entry = {'_1': 'bb_1'}
+    cfg.exit = {'r1': 'bb_1'}
+
+    expected = sum(range(n))
+
+    if concurrency is None:
+        runner = akr.Runner(cfg, {'_1': [list(range(n))]},
+                            n_workers=n_workers)
+    else:
+        runner = akr.Runner(cfg, {'_1': [list(range(n))]},
+                            n_workers=n_workers, backend='asyncio',
+                            concurrency=concurrency)
+
+    return runner.run()
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-n', type='int', dest='n', default=2000,
+                    help='Number of calls')
+    opts.add_option('-w', type='int', dest='n_workers', default=2)
+    opts.add_option('-l', type='float', dest='latency', default=0.005,
+                    help='Latency of the service in seconds')
+    (options, args) = opts.parse_args()
+
+    ports = Queue()
+    server = Process(target=serve, args=(options.latency, ports),
+                     daemon=True)
+    server.start()
+
+    port = ports.get()
+
+    try:
+        elapsed = measure(options.n_workers, options.n)
+        print('%-12s %6.3f s, %8.0f calls/s'
+              % ('blocking', elapsed, options.n / elapsed))
+
+        for concurrency in (1, 4, 16, 64, 256):
+            elapsed = measure(options.n_workers, options.n, concurrency)
+            print('%-12s %6.3f s, %8.0f calls/s'
+                  % ('asyncio %d' % concurrency, elapsed,
+                     options.n / elapsed))
+
+    finally:
+        server.terminate()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+'''
+Process vs thread workers on the block kernels of apps/cholesky.
+
+Every input message is a tile update of a blocked Cholesky factorisation
+of a d x d matrix: `InitFact' factors the diagonal block, `TrigSolve'
+computes the panel block and `SymRank' updates the trailing block, with
+the NumPy calls of apps/cholesky. There are as many updates as in the
+factorisation (one per k <= j <= i < d/b). The blocks are not modified in
+place, so all messages carry the same input blocks.
+
+Process workers pickle every block they receive (or pass it through
+shared memory), thread workers share it; the kernels release the GIL.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+from optparse import OptionParser
+
+import numpy as np
+
+import akr
+
+
+# Trace of every result, checked by the output.
+trace = None
+
+
+@akr.transductor
+def InitFact(m):
+    m = dict(m)
+    m['Lkk'] = np.linalg.cholesky(m['Akk'])
+    return (m, )
+
+
+@akr.transductor
+def TrigSolve(m):
+    m = dict(m)
+    m['Lik'] = np.dot(m['Aik'], np.linalg.inv(m['Lkk'].T))
+    return (m, )
+
+
+@akr.transductor
+def SymRank(m):
+    Lik = m['Lik']
+    return (m['Aij'] - np.dot(Lik, Lik.T), )
+
+
+@akr.output
+def __output__(channel, msg):
+    assert np.isclose(np.trace(msg[0]), trace)
+
+
+nodes = [
+    ('bb_1', {'stmts': [(InitFact, ('_1',), ('_1',)),
+                        (TrigSolve, ('_1',), ('_1',)),
+                        (SymRank, ('_1',), ('r1',))]}),
+    ('bb_1_exit_r1', {'stmts': [(__output__, ('r1',), ())]}),
+]
+
+edges = [
+    ('bb_1', 'bb_1_exit_r1', {'chn': {'r1'}}),
+]
+
+
+def blocks(b):
+    rs = np.random.RandomState(0)
+
+    A = rs.rand(b, b)
+    Akk = np.dot(A, A.T) + b * np.eye(b)
+
+    return {'Akk': Akk, 'Aik': rs.rand(b, b), 'Aij': rs.rand(b, b)}
+
+
+def expected(job):
+    Lkk = np.linalg.cholesky(job['Akk'])
+    Lik = np.dot(job['Aik'], np.linalg.inv(Lkk.T))
+    return np.trace(job['Aij'] - np.dot(Lik, Lik.T))
+
+
+def measure(backend, n_workers, d, b):
+    global trace
+
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from(nodes)
+    cfg.add_edges_from(edges)
+    cfg.entry = {'_1': 'bb_1'}
+    cfg.exit = {'r1': 'bb_1'}
+
+    nb = d // b
+    n_jobs = nb * (nb + 1) * (nb + 2) // 6
+
+    job = blocks(b)
+    trace = expected(job)
+
+    __input__ = {'_1': (job for _ in range(n_jobs))}
+
+    runner = akr.Runner(cfg, __input__, n_workers=n_workers,
+                        backend=backend)
+    elapsed = runner.run()
+
+    tasks = sum(s['tasks'] for s in runner.stats().values())
+    assert tasks == 4 * n_jobs
+
+    return n_jobs, elapsed
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-d', type='int', dest='d', default=1024,
+                    help='Matrix dimension')
+    opts.add_option('-w', type='int', dest='n_workers', default=2)
+    opts.add_option('-b', dest='blocks', default='32,64,128,256',
+                    help='Block sizes')
+    (options, args) = opts.parse_args()
+
+    print('%5s  %6s  %17s  %17s  %7s' %
+          ('block', 'jobs', 'process s  job/s', 'thread s  job/s',
+           'speedup'))
+
+    for b in map(int, options.blocks.split(',')):
+        n_jobs, t_proc = measure('process', options.n_workers, options.d, b)
+        _, t_thread = measure('thread', options.n_workers, options.d, b)
+
+        print('%5d  %6d  %7.3f %9.0f  %7.3f %9.0f  %6.2fx' %
+              (b, n_jobs, t_proc, n_jobs / t_proc, t_thread,
+               n_jobs / t_thread, t_proc / t_thread))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+'''
+Successor lookup with and without the precomputed table, and worker
+throughput on the integer-indexed execution plan.
+
+The net is `gen .. bar .. summ' from apps/test, executed by a single
+in-process worker until its task queue drains.
+
+End to end, the compiled apps/test net is run by Runner with its output
+discarded, once with successors scanned from the graph on every message
+(as before the table) and once with the table.
+'''
+
+import os
+import sys
+sys.path[0:0] = ['..']
+
+import time
+from operator import add
+from optparse import OptionParser
+
+import akr
+from akr.cluster import load_program
+
+
+@akr.inductor
+def gen(m):
+    r = m+1
+    gen.cont = r if r < 10 else None
+    return (r, )
+
+
+@akr.transductor
+def bar(m):
+    r = m ** 2
+    return (r, )
+
+
+@akr.reductor(False, combine=add)
+def summ(m):
+    if summ.cont is None:
+        summ.cont = 0
+    summ.cont = m + summ.cont
+
+
+@akr.output
+def __output__(channel, msg):
+    pass
+
+
+nodes = [
+    ('bb_1', {'stmts': [(gen, ('_1',), ('_1',)), (bar, ('_1',), ('_1',)),
+                        (summ, ('_1',), ('r1',))]}),
+    ('bb_1_exit_r1', {'stmts': [(__output__, ('r1',), ())]}),
+]
+
+edges = [
+    ('bb_1', 'bb_1_exit_r1', {'chn': {'r1'}}),
+]
+
+
+class Worker(akr.Worker):
+    # Leave the loop once local tasks are exhausted instead of blocking.
+
+    def event_loop(self):
+        return self.is_ready
+
+
+def make_cfg():
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from(nodes)
+    cfg.add_edges_from(edges)
+    cfg.entry = {'_1': 'bb_1'}
+    cfg.exit = {'r1': 'bb_1'}
+    return cfg
+
+
+class ScanSucc:
+    # Stands in for Plan.succ: successors of a statement are scanned from
+    # the out-edges of the graph on every lookup.
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+        # pc -> (bb_name, index, outputs), in the order of Plan.
+        self.stmts = []
+        self.block_pc = {}
+
+        for bb_name, attrs in cfg.nodes(data=True):
+            self.block_pc[bb_name] = len(self.stmts)
+
+            for index, (_, _, outputs) in enumerate(attrs['stmts']):
+                self.stmts.append((bb_name, index, outputs))
+
+    def __getitem__(self, pc):
+        bb_name, index, outputs = self.stmts[pc]
+        succ = []
+
+        for channel in outputs:
+            try:
+                next_bb, next_index = self.cfg._next_pc_scan((bb_name, index),
+                                                             channel)
+            except AssertionError:
+                succ.append(-1)
+            else:
+                succ.append(self.block_pc[next_bb] + next_index)
+
+        return tuple(succ)
+
+
+@akr.output
+def discard(channel, msg):
+    pass
+
+
+def load_test():
+    # The compiled apps/test net, its output discarded.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                        'apps', 'test.py')
+
+    with open(path) as f:
+        program = load_program(f.read())
+
+    cfg = program['cfg']
+
+    for _, attrs in cfg.nodes(data=True):
+        attrs['stmts'] = [(discard if f is program['__output__'] else f,
+                           inputs, outputs)
+                          for f, inputs, outputs in attrs['stmts']]
+
+    return cfg
+
+
+def net_rate(n_lists, n_workers, scan):
+    cfg = load_test()
+    __input__ = {'_1': [list(range(1, 10))] * n_lists}
+
+    runner = akr.Runner(cfg, __input__, n_workers=n_workers)
+
+    if scan:
+        runner.plan.succ = ScanSucc(cfg)
+
+    elapsed = runner.run()
+    tasks = sum(s['tasks'] for s in runner.stats().values())
+
+    return tasks / elapsed
+
+
+def lookup_rate(cfg, n):
+    pcs = [(('bb_1', i), ch) for i, ch in ((0, '_1'), (1, '_1'), (2, 'r1'))]
+
+    start = time.perf_counter()
+    for _ in range(n):
+        for pc, channel in pcs:
+            cfg.next_pc(pc, channel)
+    elapsed = time.perf_counter() - start
+
+    return n * len(pcs) / elapsed
+
+
+def worker_rate(cfg, n_lists):
+    plan = akr.Plan(cfg)
+
+    tasks = akr.Stream().read([[i % 10 for i in range(10)]] * n_lists)
+
+    for msg in tasks:
+        msg.set_loc(plan.intern('_1'), plan.entry['_1'])
+
+    worker = Worker(0, plan, tasks, akr.Transport(0, [None]))
+
+    start = time.perf_counter()
+    worker.run()
+    elapsed = time.perf_counter() - start
+
+    return worker.stats['tasks'] / elapsed
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-n', type='int', dest='n_lists', default=2000)
+    opts.add_option('-r', type='int', dest='repeat', default=3)
+    opts.add_option('-w', type='int', dest='n_workers', default=2)
+    (options, args) = opts.parse_args()
+
+    for label, table in (('scan', False), ('table', True)):
+        cfg = make_cfg()
+
+        if table:
+            cfg.build_dispatch()
+
+        rate = max(lookup_rate(cfg, options.n_lists * 10)
+                   for _ in range(options.repeat))
+
+        print('next_pc %-6s %12.0f lookups/s' % (label, rate))
+
+    rate = max(worker_rate(make_cfg(), options.n_lists)
+               for _ in range(options.repeat))
+
+    print('worker (plan)  %12.0f msg/s' % rate)
+
+    for label, scan in (('scan', True), ('table', False)):
+        rate = max(net_rate(options.n_lists // 10, options.n_workers, scan)
+                   for _ in range(options.repeat))
+
+        print('apps/test %-5s %12.0f msg/s' % (label, rate))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+'''
+Cost of message id rewriting per box hop at nesting depths 1-4.
+
+Compares the former md5-based list identifiers with the 64-bit tuple
+hash: `eye' is a transductor hop (id_eye), `up' an inductor hop (id_up).
+Also reports the pickled size of an id.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import hashlib
+import pickle
+import time
+from itertools import chain
+from functools import partial
+from optparse import OptionParser
+
+import akr.stream
+
+
+def md5i(n, p):
+    nb = (n + p).to_bytes(16, 'little')
+    h = hashlib.md5(nb).digest()
+    return int.from_bytes(h, 'little')
+
+
+def md5s(s, p):
+    sp = s + p.to_bytes(16, 'little')
+    h = hashlib.md5(sp).digest()
+    return int.from_bytes(h, 'little')
+
+
+def to_bytes(n):
+    return n.to_bytes(16, 'little')
+
+
+class MD5Message(akr.stream.Message):
+    """Message with the md5 id scheme."""
+
+    def id_up(self, port, index):
+        pre_id = self.id_eye(port)
+
+        ls = b''.join(map(to_bytes, self.id))
+        list_id = md5s(ls, port)
+
+        return pre_id + (list_id, index)
+
+    def id_eye(self, port):
+        ids = map(partial(md5i, port), self.id[::2])
+        idxs = self.id[1::2]
+        return tuple(chain(*zip(ids, idxs)))
+
+
+def message(cls, depth):
+    # An id of `depth' nested lists that went through a few boxes already.
+    m = akr.stream.Message(None, (1, 0) * depth + (0, ))
+
+    for port in range(3):
+        m = akr.stream.Message(None, m.id_up(port, 5)[:-2] + (3, ))
+
+    return cls(None, m.id)
+
+
+def measure(m, op, n):
+    f = getattr(m, op)
+
+    start = time.perf_counter()
+
+    for i in range(n):
+        f(0, i) if op == 'id_up' else f(0)
+
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == '__main__':
+    op = OptionParser()
+    op.add_option('-n', '--hops', type='int', default=200000,
+                  help='Number of id rewrites per measure')
+    (options, args) = op.parse_args()
+
+    n = options.hops
+
+    print('%5s  %4s  %12s  %12s  %7s  %10s' %
+          ('depth', 'hop', 'md5 ns/hop', 'mix ns/hop', 'speedup',
+           'bytes md5/mix'))
+
+    for depth in range(1, 5):
+        old = message(MD5Message, depth)
+        new = message(akr.stream.Message, depth)
+
+        # Ids of the same shape as produced by each scheme.
+        old.id = old.id_up(0, 0)[:-2] + (0, )
+        new.id = new.id_up(0, 0)[:-2] + (0, )
+
+        for op, name in (('id_eye', 'eye'), ('id_up', 'up')):
+            t_old = measure(old, op, n)
+            t_new = measure(new, op, n)
+
+            print('%5d  %4s  %12.0f  %12.0f  %6.1fx  %5d/%d' %
+                  (depth, name, t_old * 1e9, t_new * 1e9, t_old / t_new,
+                   len(pickle.dumps(old.id_eye(0))),
+                   len(pickle.dumps(new.id_eye(0)))))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+'''
+Worker event loop: cost of polling the inbound queue.
+
+A single worker runs `gen .. bar .. summ' (see bench_dispatch.py) over a
+real multiprocessing queue until its tasks are exhausted, with quanta of
+1 (one non-blocking poll per task, as the former loop) to 256 tasks
+between polls. Reports the message rate and the poll counters.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import time
+from multiprocessing import Queue
+from optparse import OptionParser
+
+import akr
+
+from bench_dispatch import make_cfg
+
+
+class Done(Exception):
+    pass
+
+
+class Worker(akr.Worker):
+    # Leave the loop once local tasks are exhausted instead of blocking.
+
+    def idle(self):
+        raise Done
+
+
+def worker_rate(n_lists, quantum):
+    plan = akr.Plan(make_cfg())
+
+    tasks = akr.Stream().read([[i % 10 for i in range(10)]] * n_lists)
+
+    for msg in tasks:
+        msg.set_loc(plan.intern('_1'), plan.entry['_1'])
+
+    worker = Worker(0, plan, tasks, akr.Transport(0, [Queue()]),
+                    stealing=False, quantum=quantum)
+
+    start = time.perf_counter()
+
+    try:
+        worker.run()
+    except Done:
+        pass
+
+    elapsed = time.perf_counter() - start
+
+    return worker.stats['tasks'] / elapsed, worker.stats
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-n', type='int', dest='n_lists', default=2000)
+    opts.add_option('-r', type='int', dest='repeat', default=3)
+    (options, args) = opts.parse_args()
+
+    print('%7s  %12s  %8s  %11s' % ('quantum', 'msg/s', 'polls',
+                                   'empty polls'))
+
+    for quantum in (1, 8, 64, 256):
+        rate, stats = max(worker_rate(options.n_lists, quantum)
+                          for _ in range(options.repeat))
+
+        print('%7d  %12.0f  %8d  %11d' % (quantum, rate, stats['polls'],
+                                          stats['empty_polls']))
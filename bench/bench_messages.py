@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+'''
+Memory per queued message and cost of dumped messages.
+
+Fills a deque with messages as they sit in Worker.tasks and measures the
+allocated bytes with tracemalloc, for a Message with a __dict__ (as before)
+and the current one with __slots__. Contents are small ints, so the numbers
+are the runtime overhead per message.
+
+Dumped messages are compared in the tuple format of Message.dump() and in
+a binary format (struct header and u64 ids): pickled size in a batch and
+dump + pickle + unpickle + load time per message.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import gc
+import time
+import pickle
+import struct
+import tracemalloc
+from collections import deque
+from optparse import OptionParser
+
+import akr.stream
+from akr import utils
+
+
+class DictMessage:
+    """Message without __slots__."""
+
+    def __init__(self, content, id, bracket=None):
+        self.content = content
+        self.id = id
+
+        self.bracket = bracket
+        self.channel = None
+        self.pc = None
+
+
+_structs = {}
+
+
+def binary_dump(m):
+    # bracket, channel, pc, then the ids; their number is implied by the
+    # length of the record.
+    n = len(m.id)
+    s = _structs.get(n)
+
+    if s is None:
+        s = _structs[n] = struct.Struct('<hhi%dQ' % n)
+
+    raw = s.pack(-1 if m.bracket is None else m.bracket,
+                 m.channel, m.pc, *m.id)
+
+    return ('msg', m.content, raw)
+
+
+def binary_load(r):
+    raw = r[2]
+    n = (len(raw) - 8) // 8
+    s = _structs.get(n)
+
+    if s is None:
+        s = _structs[n] = struct.Struct('<hhi%dQ' % n)
+
+    v = s.unpack(raw)
+
+    m = akr.stream.Message(r[1], v[3:], None if v[0] == -1 else v[0])
+    m.set_loc(v[1], v[2])
+
+    return m
+
+
+def make(cls, n, depth):
+    for i in range(n):
+        # Ids of the same shape as produced by inductors.
+        id = (1, 0) * depth + (i, )
+
+        for port in range(depth):
+            id = id[:2 * port] \
+                + (hash((id[2 * port], port)) & utils.MASK, ) \
+                + id[2 * port + 1:]
+
+        m = cls(i, id)
+        m.channel = 1
+        m.pc = 3
+        yield m
+
+
+def queued(cls, n, depth):
+    gc.collect()
+    tracemalloc.start()
+
+    tasks = deque(make(cls, n, depth))
+
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del tasks
+    return size / n
+
+
+def dumped(dump, load, n, depth, batch_size=64):
+    msgs = list(make(akr.stream.Message, batch_size, depth))
+    size = len(pickle.dumps([dump(m) for m in msgs],
+                            pickle.HIGHEST_PROTOCOL))
+
+    rounds = max(1, n // batch_size)
+    start = time.perf_counter()
+
+    for _ in range(rounds):
+        data = pickle.dumps([dump(m) for m in msgs], pickle.HIGHEST_PROTOCOL)
+        [load(r) for r in pickle.loads(data)]
+
+    elapsed = time.perf_counter() - start
+
+    return size / batch_size, elapsed / (rounds * batch_size)
+
+
+if __name__ == '__main__':
+    op = OptionParser()
+    op.add_option('-n', '--messages', type='int', default=200000,
+                  help='Number of messages per measure')
+    (options, args) = op.parse_args()
+
+    n = options.messages
+
+    print('%5s  %17s  %17s  %17s' %
+          ('depth', 'queued B/msg', 'dumped B/msg', 'round-trip ns/msg'))
+    print('%5s  %8s %8s  %8s %8s  %8s %8s' %
+          ('', 'dict', 'slots', 'tuple', 'binary', 'tuple', 'binary'))
+
+    for depth in range(0, 4):
+        t_size, t_time = dumped(lambda m: m.dump(), akr.stream.load,
+                                n, depth)
+        b_size, b_time = dumped(binary_dump, binary_load, n, depth)
+
+        print('%5d  %8.0f %8.0f  %8.0f %8.0f  %8.0f %8.0f' %
+              (depth,
+               queued(DictMessage, n, depth),
+               queued(akr.stream.Message, n, depth),
+               t_size, b_size, t_time * 1e9, b_time * 1e9))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+'''
+Reduction over long lists: `bar .. summ' from apps/test with 1, 2, 4 and 8
+workers. The time is measured until the net is quiescent (Runner.run
+returns). The reductor is ordered unless -u is given.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+from multiprocessing import Queue
+from operator import add
+from optparse import OptionParser
+
+import akr
+
+
+done = None
+
+
+@akr.transductor
+def bar(m):
+    r = m ** 2
+    return (r, )
+
+
+@akr.reductor(True)
+def summ(m):
+    if summ.cont is None:
+        summ.cont = 0
+    summ.cont = m + summ.cont
+
+
+@akr.reductor(False, combine=add)
+def usumm(m):
+    if usumm.cont is None:
+        usumm.cont = 0
+    usumm.cont = m + usumm.cont
+
+
+@akr.output
+def __output__(channel, msg):
+    done.put(msg[0])
+
+
+def make_nodes(ordered):
+    reductor = summ if ordered else usumm
+
+    return [
+        ('bb_1', {'stmts': [(bar, ('_1',), ('_1',)),
+                            (reductor, ('_1',), ('r1',))]}),
+        ('bb_1_exit_r1', {'stmts': [(__output__, ('r1',), ())]}),
+    ]
+
+
+edges = [
+    ('bb_1', 'bb_1_exit_r1', {'chn': {'r1'}}),
+]
+
+
+def measure(n_workers, n_lists, length, ordered=True):
+    global done
+
+    done = Queue()
+
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from(make_nodes(ordered))
+    cfg.add_edges_from(edges)
+    cfg.entry = {'_1': 'bb_1'}
+    cfg.exit = {'r1': 'bb_1'}
+
+    __input__ = {'_1': [list(range(length)) for _ in range(n_lists)]}
+
+    runner = akr.Runner(cfg, __input__, n_workers=n_workers)
+
+    elapsed = runner.run()
+
+    expected = sum(i ** 2 for i in range(length))
+
+    for _ in range(n_lists):
+        assert done.get() == expected
+
+    return elapsed
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-n', type='int', dest='n_lists', default=4)
+    opts.add_option('-l', type='int', dest='length', default=5000)
+    opts.add_option('-u', action='store_false', dest='ordered', default=True)
+    (options, args) = opts.parse_args()
+
+    for n_workers in (1, 2, 4, 8):
+        elapsed = measure(n_workers, options.n_lists, options.length,
+                          options.ordered)
+        n_elems = options.n_lists * options.length
+
+        print('%d workers: %8.3f s, %10.0f elem/s'
+              % (n_workers, elapsed, n_elems / elapsed))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+'''
+Worker utilisation on a deliberately skewed net: `fan' expands every input
+into a list of `work' items, and only the first input carries heavy items,
+so without load balancing a single worker does almost everything.
+
+The time is measured until the net is quiescent (Runner.run returns).
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+from multiprocessing import Queue
+from operator import add
+from optparse import OptionParser
+
+import akr
+
+
+done = None
+
+
+@akr.inductor
+def fan(m):
+    cost, n = m['cost'], m['n']
+    fan.cont = {'cost': cost, 'n': n - 1} if n > 1 else None
+    return (cost, )
+
+
+@akr.transductor
+def work(m):
+    x = 0
+    for i in range(m):
+        x += i
+    return (x, )
+
+
+@akr.reductor(False, combine=add)
+def count(m):
+    count.cont = (count.cont or 0) + 1
+
+
+@akr.output
+def __output__(channel, msg):
+    done.put(msg[0])
+
+
+nodes = [
+    ('bb_1', {'stmts': [(fan, ('_1',), ('_1',)), (work, ('_1',), ('_1',)),
+                        (count, ('_1',), ('r1',))]}),
+    ('bb_1_exit_r1', {'stmts': [(__output__, ('r1',), ())]}),
+]
+
+edges = [
+    ('bb_1', 'bb_1_exit_r1', {'chn': {'r1'}}),
+]
+
+
+def measure(n_workers, stealing, n_items, heavy):
+    global done
+    done = Queue()
+
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from(nodes)
+    cfg.add_edges_from(edges)
+    cfg.entry = {'_1': 'bb_1'}
+    cfg.exit = {'r1': 'bb_1'}
+
+    inputs = [{'cost': heavy, 'n': n_items}] + \
+        [{'cost': 1, 'n': n_items}] * (n_workers - 1)
+    __input__ = {'_1': inputs}
+
+    runner = akr.Runner(cfg, __input__, n_workers=n_workers,
+                        stealing=stealing)
+
+    elapsed = runner.run()
+
+    for _ in inputs:
+        done.get()
+
+    return elapsed, runner.stats()
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-w', type='int', dest='n_workers', default=4)
+    opts.add_option('-n', type='int', dest='n_items', default=200)
+    opts.add_option('-c', type='int', dest='heavy', default=20000)
+    (options, args) = opts.parse_args()
+
+    for stealing in (False, True):
+        elapsed, stats = measure(options.n_workers, stealing,
+                                 options.n_items, options.heavy)
+
+        print('stealing=%s: %.3f s' % (stealing, elapsed))
+
+        for wid, s in sorted(stats.items()):
+            print('  worker %d: %5d tasks, cpu %.3f s, stolen %d in %d of '
+                  '%d requests, given %d'
+                  % (wid, s['tasks'], s['cpu_time'], s['stolen_tasks'],
+                     s['steals'], s['steal_requests'], s['given_tasks']))
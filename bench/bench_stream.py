@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+'''
+Input scanning: nested sequences and flat event streams into messages.
+
+Compares the former recursive scanner with the iterative one, reading
+nested lists (iter) and a pre-built flat event stream (scan), on inputs of
+10^6 elements (by default) at depths 0-3.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import time
+from collections import defaultdict, deque
+from collections.abc import Sequence
+from itertools import chain
+from optparse import OptionParser
+
+import akr.stream
+from akr.stream import Message
+
+
+class RecursiveStream:
+    """The former scanner: one recursive call per nested list."""
+
+    def __init__(self):
+        self.list_ids = defaultdict(int)
+        self.list_idxs = defaultdict(int)
+
+        self.index = 0
+
+    def read(self, seq):
+        self.bmax = 0
+        self.bc = 0
+        self.depth = None
+        self.stream = []
+
+        self._scan(seq)
+        self.list_ids[0] += 1
+
+        return self.stream
+
+    def _scan(self, stream, level=0):
+
+        for item in stream:
+
+            if isinstance(item, Sequence):
+                if self.bc > 0:
+                    self.bc -= 1
+
+                if self.bc == 0 and self.bmax > 0:
+                    self.stream[-1].bracket = self.bmax
+                    self.index = 0
+                    self.bmax = 0
+
+                self.list_ids[level+1] += 1
+
+                self._scan(item, level+1)
+
+                self.list_idxs[level] += 1
+
+            else:
+                self.depth = level if self.depth is None else self.depth
+
+                if level != self.depth:
+                    raise ValueError('Wrong sequence')
+
+                lists = ((self.list_ids[i], self.list_idxs[i])
+                         for i in range(level+1))
+
+                mid = tuple(chain(*lists))[:-1] + (self.index, )
+
+                self.stream.append(Message(item, mid))
+
+                self.index += 1
+
+        for k in filter(lambda x: x > level, self.list_idxs):
+            self.list_idxs[k] = 0
+
+        self.bc += 1
+        self.bmax += 1
+
+        if level == 0:
+            self.stream[-1].bracket = 0
+
+
+def nested(n, depth, inner=100):
+    # `n' elements in lists of `inner' elements, grouped by 10 per level.
+    seq = list(range(n))
+
+    if depth:
+        seq = [seq[i:i + inner] for i in range(0, n, inner)]
+
+    for _ in range(depth - 1):
+        seq = [seq[i:i + 10] for i in range(0, len(seq), 10)]
+
+    return seq
+
+
+def measure(f, n):
+    start = time.perf_counter()
+    deque(f(), maxlen=0)
+    return (time.perf_counter() - start) / n
+
+
+if __name__ == '__main__':
+    op = OptionParser()
+    op.add_option('-n', '--elements', type='int', default=10**6,
+                  help='Number of elements')
+    (options, args) = op.parse_args()
+
+    n = options.elements
+
+    print('%5s  %14s  %14s  %14s' %
+          ('depth', 'recursive ns', 'iter ns', 'scan ns'))
+
+    for depth in range(4):
+        seq = nested(n, depth)
+        flat = list(akr.stream.events(seq))
+
+        t_rec = measure(lambda: RecursiveStream().read(seq), n)
+        t_iter = measure(lambda: akr.stream.Stream().iter(seq), n)
+        t_scan = measure(lambda: akr.stream.Stream().scan(flat), n)
+
+        print('%5d  %14.0f  %14.0f  %14.0f' %
+              (depth, t_rec * 1e9, t_iter * 1e9, t_scan * 1e9))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+'''
+Synchroniser throughput: the cpu synchroniser of aksync/tests/cpu.py.
+
+Drives the compiled synchroniser with the feedback loop of that test on a
+program of 10^5 instructions (by default) and reports the time per
+instruction and per transition. The program stores four values first,
+then loads an address that is never stored: a load that matches leaves a
+record without an address in the memory loop, which stalls later loads.
+Each load walks through the four stored records.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import os
+import re
+import time
+from collections import deque
+from optparse import OptionParser
+
+from aksync.compiler import compile, preamble
+
+LD, ST, ADD, MUL, PRT = range(0, 5)
+
+STORES = [(ADD, 1), (ST, 1), (ST, 2), (ST, 3), (ST, 4)]
+
+# One load in every 16 instructions.
+PATTERN = [(ADD, 3), (PRT, 0), (MUL, 2), (ADD, 1), (PRT, 0), (ADD, 7),
+           (MUL, 3), (PRT, 0), (LD, 0), (ADD, 5), (PRT, 0), (MUL, 1),
+           (ADD, 2), (PRT, 0), (MUL, 0), (PRT, 0)]
+
+
+def load_cpu():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'aksync', 'tests', 'cpu.py')
+
+    with open(path) as f:
+        src = re.search(r'sync_src = """(.*?)"""', f.read(), re.S).group(1)
+
+    scope = {}
+    exec(preamble(), scope)
+    exec(compile(src), scope)
+
+    return scope['cpu']
+
+
+def drive(cpu, program):
+    channels = {
+        0: deque({'opc': opc, 'op0': op} for opc, op in reversed(program)),
+        1: deque(),
+        2: deque(),
+        3: deque(),
+    }
+
+    state = cpu.init()
+    transitions = 0
+    printed = 0
+
+    while True:
+        inputs = {i: ch[-1] for i, ch in channels.items() if ch}
+
+        output, state, consumed = cpu.run(state, inputs)
+
+        if not consumed:
+            break
+
+        transitions += 1
+
+        for i in consumed:
+            channels[i].pop()
+
+        for i, msgs in output.items():
+            if i > 0:
+                channels[i].extendleft(msgs)
+            else:
+                printed += len(msgs)
+
+    return transitions, printed
+
+
+if __name__ == '__main__':
+    op = OptionParser()
+    op.add_option('-n', '--instructions', type='int', default=100000,
+                  help='Number of instructions')
+    (options, args) = op.parse_args()
+
+    n = options.instructions
+    program = (STORES + PATTERN * (n // len(PATTERN) + 1))[:n]
+
+    cpu = load_cpu()
+
+    start = time.perf_counter()
+    transitions, printed = drive(cpu, program)
+    elapsed = time.perf_counter() - start
+
+    print('instructions: %d, transitions: %d, outputs: %d'
+          % (n, transitions, printed))
+    print('total: %.2f s, %.2f us/instruction, %.2f us/transition'
+          % (elapsed, elapsed / n * 1e6, elapsed / transitions * 1e6))
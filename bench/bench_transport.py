@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+'''
+Inter-worker transport microbenchmark: throughput of a one-way stream of
+message records between two processes for several batch sizes, and the
+round-trip latency of a single urgent record, for multiprocessing queues and
+shared-memory rings.
+'''
+
+import sys
+sys.path[0:0] = ['..']
+
+import time
+from multiprocessing import Process, Queue
+from optparse import OptionParser
+
+import akr
+
+
+record = akr.Message(list(range(8)), (1, 0, 2, 3)).dump()
+
+
+rings = None
+
+
+def make_transports(kind, batch_size):
+    global rings
+
+    queues = [Queue() for _ in range(2)]
+
+    if kind == 'shm':
+        if rings is not None:
+            akr.RingTransport.destroy(rings)
+
+        rings, bells = akr.RingTransport.create(queues)
+
+        return [akr.RingTransport(wid, queues, rings, bells, batch_size)
+                for wid in range(2)]
+
+    return [akr.Transport(wid, queues, batch_size) for wid in range(2)]
+
+
+def consume(t, n):
+    for _ in range(n):
+        t.recv()
+
+    t.send(0, 'done', urgent=True)
+
+
+def throughput(kind, batch_size, n):
+    producer, consumer = make_transports(kind, batch_size)
+
+    p = Process(target=consume, args=(consumer, n))
+    p.start()
+
+    start = time.perf_counter()
+
+    for _ in range(n):
+        producer.send(1, record)
+
+    producer.flush()
+    producer.recv()
+
+    elapsed = time.perf_counter() - start
+    p.join()
+
+    return n / elapsed
+
+
+def echo(t, n):
+    for _ in range(n):
+        t.send(0, t.recv(), urgent=True)
+
+
+def latency(kind, n):
+    ping, pong = make_transports(kind, 1)
+
+    p = Process(target=echo, args=(pong, n))
+    p.start()
+
+    start = time.perf_counter()
+
+    for _ in range(n):
+        ping.send(1, record, urgent=True)
+        ping.recv()
+
+    elapsed = time.perf_counter() - start
+    p.join()
+
+    return elapsed / n
+
+
+if __name__ == '__main__':
+    opts = OptionParser(usage='usage: %prog [options]')
+    opts.add_option('-n', type='int', dest='n', default=100000)
+    (options, args) = opts.parse_args()
+
+    for kind in ('queue', 'shm'):
+        for batch_size in (1, 16, 64, 256):
+            rate = throughput(kind, batch_size, options.n)
+            print('%-5s batch %4d: %10.0f msg/s' % (kind, batch_size, rate))
+
+        rtt = latency(kind, options.n // 10)
+        print('%-5s round trip: %8.1f us' % (kind, rtt * 1e6))
+
+    akr.RingTransport.destroy(rings)
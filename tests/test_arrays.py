@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import gc
+import unittest
+from multiprocessing import RLock, Process, Queue
+
+from akr import arrays
+from akr.shm import SharedMemory
+
+
+def forward(lock, inq, outq):
+    # Map the array, modify it in place and send it back.
+    shared = arrays.Arrays(lock)
+
+    record = shared.attach(inq.get())
+    record[1]['a'] += 1
+
+    outq.put(shared.export(record))
+
+
+@unittest.skipUnless(arrays.available(), 'numpy or shared memory missing')
+class TestArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = RLock()
+        self.shared = arrays.Arrays(self.lock, threshold=64)
+
+    def test_small(self):
+        a = arrays.numpy.zeros(4)
+        self.assertIsNone(self.shared.export(('msg', {'a': a})))
+
+    def test_roundtrip(self):
+        a = arrays.numpy.arange(100.0)
+        record = ('msg', {'a': a, 'n': 1}, (0, 1))
+
+        exported = self.shared.export(record)
+        self.assertIsInstance(exported[1]['a'], arrays.Handle)
+        self.assertIs(record[1]['a'], a)
+
+        name = exported[1]['a'].name
+
+        inq, outq = Queue(), Queue()
+        p = Process(target=forward, args=(self.lock, inq, outq))
+        p.start()
+
+        inq.put(exported)
+        returned = outq.get()
+        p.join()
+
+        # The array is forwarded by handle, not copied again.
+        self.assertEqual(returned[1]['a'].name, name)
+
+        b = self.shared.attach(returned)[1]['a']
+        self.assertTrue((b == a + 1).all())
+
+        del b
+        gc.collect()
+
+        # The last reference is gone.
+        with self.assertRaises(FileNotFoundError):
+            SharedMemory(name=name)
+
+    def test_aliasing(self):
+        # The sender's array is copied, forwarded ones are passed by
+        # reference: all receivers share a buffer.
+        a = arrays.numpy.zeros(100)
+
+        first = self.shared.attach(self.shared.export(('msg', a)))[1]
+        forwarded = self.shared.export(('msg', first))
+        second = self.shared.attach(forwarded)[1]
+
+        first[0] = 1
+        second[1] = 2
+
+        self.assertEqual(list(first[:2]), [1, 2])
+        self.assertEqual(list(second[:2]), [1, 2])
+        self.assertFalse(a.any())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import os
+import pickle
+import socket
+import struct
+import unittest
+import tempfile
+from multiprocessing import Process
+
+import akr
+from akr.cluster import Coordinator, run_node, load_program
+
+
+# A compiled program writing its output to `path'. Its transductor raises
+# on the message `fail'.
+source = '''
+import akr
+
+@akr.inductor
+def gen(m):
+    r = m + 1
+    gen.cont = r if r < 10 else None
+    return (r, )
+
+@akr.transductor
+def bar(m):
+    if m == %(fail)d:
+        raise ValueError(m)
+
+    return (m ** 2, )
+
+@akr.reductor(True)
+def summ(m):
+    summ.cont = (summ.cont or 0) + m
+
+@akr.output
+def __output__(channel, msg):
+    with open(%(path)r, 'a') as f:
+        f.write('%%s %%d\\n' %% (channel, msg[0]))
+
+nodes = [
+    ('bb_1', {'stmts': [(gen, ('_1',), ('_1',)), (bar, ('_1',), ('_1',)),
+                        (summ, ('_1',), ('r1',))]}),
+    ('bb_1_exit', {'stmts': [(__output__, ('r1',), ())]}),
+]
+
+edges = [
+    ('bb_1', 'bb_1_exit', {'chn': {'r1'}}),
+]
+
+cfg = akr.DiGraph()
+cfg.add_nodes_from(nodes)
+cfg.add_edges_from(edges)
+cfg.entry = {'_1': 'bb_1'}
+cfg.exit = {'r1': 'bb_1'}
+
+__input__ = {'_1': [list(range(i, i + 5)) for i in range(20)]}
+
+if __name__ == '__main__':
+    runner = akr.Runner(cfg, __input__)
+    runner.run()
+'''
+
+
+class Touch:
+    # Creates the file `path' when unpickled.
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return open, (self.path, 'w')
+
+
+def make_source(path, fail=-1):
+    return source % {'path': path, 'fail': fail}
+
+
+def other_node(address):
+    # A node whose interpreter makes other list identifiers.
+    akr.cluster.ids_fingerprint = lambda: 0
+    run_node(address)
+
+
+def lines(path):
+    with open(path) as f:
+        return sorted(f)
+
+
+class TestCluster(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_guard(self):
+        path = os.path.join(self.tmp.name, 'out')
+        load_program(make_source(path))
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_localhost(self):
+        local = os.path.join(self.tmp.name, 'local')
+        remote = os.path.join(self.tmp.name, 'remote')
+
+        program = load_program(make_source(local))
+        akr.Runner(program['cfg'], program['__input__'], n_workers=2).run()
+
+        coordinator = Coordinator(make_source(remote), 3,
+                                  batch_size=4)
+
+        nodes = [Process(target=run_node, args=(coordinator.address, ))
+                 for _ in range(3)]
+
+        for p in nodes:
+            p.start()
+
+        coordinator.run()
+
+        for p in nodes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        self.assertEqual(len(lines(local)), 100)
+        self.assertEqual(lines(remote), lines(local))
+
+        stats = coordinator.stats()
+        self.assertEqual(sorted(stats), [0, 1, 2])
+        self.assertGreater(sum(s['records_sent'] for s in stats.values()), 0)
+
+    def test_authentication(self):
+        # A connection without the key is dropped before anything it sends
+        # is unpickled.
+        out = os.path.join(self.tmp.name, 'out')
+        touched = os.path.join(self.tmp.name, 'touched')
+
+        coordinator = Coordinator(make_source(out), 1)
+
+        data = pickle.dumps(('join', Touch(touched)))
+
+        intruder = socket.create_connection(coordinator.address)
+        intruder.sendall(struct.pack('!i', len(data)) + data)
+
+        node = Process(target=run_node, args=(coordinator.address, ))
+        node.start()
+
+        coordinator.run()
+        node.join()
+        intruder.close()
+
+        self.assertEqual(node.exitcode, 0)
+        self.assertEqual(len(lines(out)), 100)
+        self.assertFalse(os.path.exists(touched))
+
+    def test_failure(self):
+        # A node fails: the coordinator stops the other one.
+        out = os.path.join(self.tmp.name, 'out')
+        coordinator = Coordinator(make_source(out, fail=13), 2)
+
+        nodes = [Process(target=run_node, args=(coordinator.address, ))
+                 for _ in range(2)]
+
+        for p in nodes:
+            p.start()
+
+        with self.assertRaisesRegex(RuntimeError, 'ValueError: 13'):
+            coordinator.run()
+
+        for p in nodes:
+            p.join(10.)
+            self.assertFalse(p.is_alive())
+
+        self.assertEqual(sorted(p.exitcode for p in nodes), [0, 1])
+
+    def test_versions(self):
+        # A node of another Python version is refused: the run fails.
+        out = os.path.join(self.tmp.name, 'out')
+        coordinator = Coordinator(make_source(out), 1)
+
+        node = Process(target=other_node, args=(coordinator.address, ))
+        node.start()
+
+        with self.assertRaisesRegex(RuntimeError, 'Python version'):
+            coordinator.run()
+
+        node.join(10.)
+        self.assertEqual(node.exitcode, 0)
+        self.assertFalse(os.path.exists(out))
+
+    def test_lost_coordinator(self):
+        # The coordinator is gone before the input: the node stops.
+        out = os.path.join(self.tmp.name, 'out')
+        coordinator = Coordinator(make_source(out), 1)
+
+        node = Process(target=run_node, args=(coordinator.address, ))
+        node.start()
+
+        coordinator.connect()
+
+        for link in coordinator.links:
+            link.close()
+
+        node.join(10.)
+
+        self.assertFalse(node.is_alive())
+        self.assertEqual(node.exitcode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
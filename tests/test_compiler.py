@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import os
+import shutil
+import operator
+import unittest
+import tempfile
+import subprocess
+
+from akr.plan import Plan
+from akr.cluster import load_program
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Box declarations of a net reducing its input with a combine function of
+# its own.
+decls = '''
+from akc.boxes import *
+
+def plus(a, b):
+    return a + b
+
+@reductor(MONADIC, UNORDERED, 1, combine=plus)
+def summ(m):
+    summ.cont = (summ.cont or 0) + m
+
+def __output__(channel, msg):
+    print(channel, msg)
+
+__input__ = {'_1': [[1, 2, 3]]}
+'''
+
+net = '''
+net Red (_1 | r1)
+connect
+  summ|r1>
+end
+'''
+
+sync = '''
+sync id (a | a)
+{
+  start {
+    on:
+      a {
+        send this => a;
+      }
+  }
+}
+'''
+
+
+def compile_net(src):
+    # Source of the program akc compiles from the net `src'.
+    output = os.path.join(os.path.dirname(src), 'a.py')
+
+    subprocess.run([sys.executable, '-m', 'akc', src, '-o', output],
+                   cwd=root, check=True, stdout=subprocess.DEVNULL)
+
+    with open(output) as f:
+        return f.read()
+
+
+class TestReductors(unittest.TestCase):
+
+    def assertUnordered(self, program, combine):
+        # The reductor folds elements wherever they are (see Partials).
+        summ = program['summ']
+        self.assertFalse(summ.ordered)
+        self.assertIs(summ.combine, combine)
+
+        plan = Plan(program['cfg'])
+        pc = plan.box.index(plan.boxes.index(summ))
+        self.assertIsNone(plan.route[pc])
+
+    def test_imported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, 'test.ak')
+
+            for ext in ('ak', 'py', 'sync'):
+                shutil.copy(os.path.join(root, 'apps', 'test', 'test.' + ext),
+                            tmp)
+
+            program = load_program(compile_net(src))
+            self.assertUnordered(program, operator.add)
+
+    def test_local(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for ext, text in (('ak', net), ('py', decls), ('sync', sync)):
+                with open(os.path.join(tmp, 'red.' + ext), 'w') as f:
+                    f.write(text)
+
+            source = compile_net(os.path.join(tmp, 'red.ak'))
+            self.assertIn('def plus(a, b):', source)
+
+            program = load_program(source)
+            self.assertUnordered(program, program['plus'])
+
+
+if __name__ == '__main__':
+    unittest.main()
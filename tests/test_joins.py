@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import unittest
+from types import SimpleNamespace
+
+from akr.stream import Message
+from akr.joins import Joins, merge_brackets
+
+
+def zip3(a, b, c):
+    pass
+
+
+plan = SimpleNamespace(inputs=[(0, 1, 2)], channels=['a', 'b', 'c'],
+                       boxes=[zip3], box=[0])
+
+
+def msg(channel, index, content=None, bracket=None):
+    # Element `index' of a list, with an id as made by Stream.
+    m = Message(content, (0, 0, channel + 1, index), bracket)
+    m.set_loc(channel, 0)
+    return m
+
+
+def contents(msgs):
+    return [m.content for m in msgs]
+
+
+class TestJoins(unittest.TestCase):
+
+    def test_ready(self):
+        joins = Joins(plan)
+
+        self.assertIsNone(joins.put(msg(0, 0, 1)))
+        self.assertIsNone(joins.put(msg(0, 1, 2)))
+        self.assertIsNone(joins.put(msg(2, 0, 3)))
+        self.assertEqual(len(joins), 3)
+
+        fired = joins.put(msg(1, 0, 4))
+        self.assertEqual(contents(fired), [1, 4, 3])
+
+        # The second message on `a' waits for the others again.
+        self.assertIsNone(joins.put(msg(1, 1, 5)))
+        fired = joins.put(msg(2, 1, 6))
+        self.assertEqual(contents(fired), [2, 5, 6])
+
+        self.assertEqual(len(joins), 0)
+        self.assertEqual(joins.stats['joins'], 2)
+
+    def test_position(self):
+        # Messages are paired by position, whatever the order of arrival.
+        joins = Joins(plan)
+
+        for index in (2, 0, 1):
+            self.assertIsNone(joins.put(msg(0, index, 'a%d' % index)))
+
+        for index in (1, 2):
+            self.assertIsNone(joins.put(msg(1, index, 'b%d' % index)))
+
+        self.assertIsNone(joins.put(msg(2, 0, 'c0')))
+
+        fired = joins.put(msg(2, 2, 'c2'))
+        self.assertEqual(contents(fired), ['a2', 'b2', 'c2'])
+
+        fired = joins.put(msg(1, 0, 'b0'))
+        self.assertEqual(contents(fired), ['a0', 'b0', 'c0'])
+
+        self.assertEqual(len(joins), 2)
+
+    def test_brackets(self):
+        # The output closes the lists closed by any of the inputs.
+        joins = Joins(plan)
+
+        joins.put(msg(0, 0))
+        joins.put(msg(1, 0, bracket=1))
+        fired = joins.put(msg(2, 0))
+        self.assertEqual(fired[0].bracket, 1)
+
+        joins.put(msg(0, 1, bracket=1))
+        joins.put(msg(1, 1, bracket=0))
+        fired = joins.put(msg(2, 1))
+        self.assertEqual(fired[0].bracket, 0)
+
+        self.assertIsNone(merge_brackets((msg(0, 2), msg(1, 2))))
+
+    def test_limit(self):
+        joins = Joins(plan, limit=2)
+
+        joins.put(msg(0, 0))
+        joins.put(msg(0, 1))
+
+        with self.assertRaises(OverflowError):
+            joins.put(msg(0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import os
+import time
+import asyncio
+import unittest
+import tempfile
+from operator import add
+
+import akr
+from akr import arrays
+from aksync.compiler import compile_to_ast, compile_sync, preamble
+
+
+# Output boxes run in the workers: they append to the file at `path'.
+path = None
+
+# Seconds inductors and reductors sleep after setting their continuation,
+# so that other threads run boxes meanwhile.
+nap = 0.
+
+
+def record(channel, msg):
+    with open(path, 'a') as f:
+        f.write('%s %r\n' % (channel, msg[0]))
+
+
+@akr.output
+def __output__(channel, msg):
+    record(channel, msg)
+
+
+@akr.transductor
+def square(m):
+    return (m ** 2, )
+
+
+def plain(channel, m):
+    # Box without a category, fired by the messages of either input.
+    return (m + 1, )
+
+
+@akr.transductor
+def split(m):
+    return (m, -m)
+
+
+@akr.inductor
+def expand(m):
+    # Elements m + 1, ..., 0 of a new list.
+    r = m + 1
+    expand.cont = r if r < 0 else None
+    time.sleep(nap)
+    return (r, )
+
+
+@akr.transductor
+def work(m):
+    # Takes some time.
+    sum(range(2000))
+    return (m, )
+
+
+@akr.transductor
+async def asquare(m):
+    await asyncio.sleep(0.001)
+    return (m ** 2, )
+
+
+@akr.inductor
+async def aexpand(m):
+    await asyncio.sleep(0.001)
+
+    r = m + 1
+    aexpand.cont = r if r < 0 else None
+    return (r, )
+
+
+@akr.transductor
+async def slow(m):
+    await asyncio.sleep(0.5)
+    return (m, )
+
+
+# Invocations of `running' in flight in a worker, and the most seen.
+in_flight = 0
+peak = 0
+
+
+@akr.transductor
+async def running(m):
+    global in_flight, peak
+
+    in_flight += 1
+    peak = max(peak, in_flight)
+
+    await asyncio.sleep(0.01)
+
+    in_flight -= 1
+    return (peak, )
+
+
+@akr.join
+def pair(a, b):
+    return ((a, b), )
+
+
+@akr.transductor
+def vector(m):
+    # Large enough to go through shared memory.
+    return (arrays.numpy.full(200, m), )
+
+
+@akr.join
+def dot(a, b):
+    if a[0] == 13:
+        raise ValueError(a[0])
+
+    return (int(a @ b), )
+
+
+@akr.transductor
+def fail(m):
+    if m == 13:
+        raise ValueError(m)
+
+    return (m, )
+
+
+# Passes on positive values, and the others to a second output.
+positive_src = """
+sync positive (a | x, y)
+{
+  start {
+    on:
+      a.(v) & [v > 0] {
+        send this => x;
+      }
+
+      a.(v) & [v <= 0] {
+        send this => y;
+      }
+  }
+}
+"""
+
+
+def load_sync(src, name):
+    scope = {}
+    exec(preamble(), scope)
+
+    for ast in compile_to_ast(src):
+        exec(compile_sync(ast, ()), scope)
+
+    return scope[name]
+
+
+def reductors(*args, **kwargs):
+    # Reductors counting and summing the elements of a list. The count is
+    # not of the type of the elements.
+    @akr.reductor(*args, **kwargs)
+    def count(m):
+        count.cont = (count.cont or 0) + 1
+        time.sleep(nap)
+
+    @akr.reductor(*args, **kwargs)
+    def summ(m):
+        summ.cont = (summ.cont or 0) + m
+        time.sleep(nap)
+
+    return count, summ
+
+
+def make_cfg(stmts, outputs, inputs=('_1', )):
+    # Net of one basic block running `stmts', with input channels `inputs'
+    # and output channels `outputs'.
+    cfg = akr.DiGraph()
+    cfg.add_nodes_from([
+        ('bb_1', {'stmts': stmts}),
+        ('bb_1_exit', {'stmts': [(__output__, tuple(outputs), ())]}),
+    ])
+    cfg.add_edges_from([('bb_1', 'bb_1_exit', {'chn': set(outputs)})])
+    cfg.entry = {c: 'bb_1' for c in inputs}
+    cfg.exit = {c: 'bb_1' for c in outputs}
+    return cfg
+
+
+class RunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        global path
+
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'out')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_net(self, cfg, __input__, **kwargs):
+        # Sorted output of a run.
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self.runner = akr.Runner(cfg, __input__, **kwargs)
+        self.runner.run()
+
+        if not os.path.exists(path):
+            return []
+
+        with open(path) as f:
+            return sorted(f)
+
+
+class TestTermination(RunnerTest):
+
+    def test_run(self):
+        cfg = make_cfg([(square, ('_1', ), ('r1', ))], ['r1'])
+        __input__ = {'_1': [list(range(i, i + 10)) for i in range(20)]}
+
+        expected = sorted('r1 %r\n' % (m ** 2, )
+                          for l in __input__['_1'] for m in l)
+
+        for backend in ('process', 'thread'):
+            for n_workers in (1, 3):
+                with self.subTest(backend=backend, n_workers=n_workers):
+                    self.assertEqual(self.run_net(cfg, __input__,
+                                                  n_workers=n_workers,
+                                                  backend=backend),
+                                     expected)
+
+                    runner = self.runner
+                    self.assertFalse(any(p.is_alive()
+                                         for p in runner.processes))
+                    self.assertEqual(sorted(runner.stats()),
+                                     list(range(n_workers)))
+
+    def test_plain_box(self):
+        cfg = make_cfg([(plain, ('_1', '_2'), ('r1', ))], ['r1'],
+                       ('_1', '_2'))
+
+        self.assertEqual(self.run_net(cfg, {'_1': [[1, 2]], '_2': [[5]]}),
+                         ['r1 2\n', 'r1 3\n', 'r1 6\n'])
+
+    def test_failure(self):
+        # A box raising kills its worker: the run fails instead of waiting
+        # forever, and the other workers are stopped.
+        cfg = make_cfg([(fail, ('_1', ), ('r1', ))], ['r1'])
+        __input__ = {'_1': [list(range(20))]}
+
+        for backend in ('process', 'thread'):
+            for n_workers in (1, 2):
+                with self.subTest(backend=backend, n_workers=n_workers):
+                    runner = akr.Runner(cfg, __input__, n_workers=n_workers,
+                                        backend=backend)
+
+                    with self.assertRaises(RuntimeError):
+                        runner.run()
+
+                    self.assertFalse(any(p.is_alive()
+                                         for p in runner.processes))
+
+    def test_dangling(self):
+        # Messages to a channel that goes nowhere are an error, not output.
+        cfg = make_cfg([(split, ('_1', ), ('r1', 'lost'))], ['r1'])
+
+        with self.assertRaises(RuntimeError):
+            self.run_net(cfg, {'_1': [[1, 2]]}, n_workers=1)
+
+        if os.path.exists(path):
+            with open(path) as f:
+                self.assertNotIn('lost', f.read())
+
+    def test_suspended(self):
+        # The first element of the list goes elsewhere: the reduction of the
+        # others never resumes, which fails the run instead of dropping them.
+        counter, _ = reductors(True)
+        positive = load_sync(positive_src, 'positive')
+
+        cfg = akr.DiGraph()
+        cfg.add_nodes_from([
+            ('bb_1', {'stmts': [(positive, ('_1', ), ('_2', 'r2'))]}),
+            ('bb_2', {'stmts': [(counter, ('_2', ), ('r1', ))]}),
+            ('bb_2_exit', {'stmts': [(__output__, ('r1', 'r2'), ())]}),
+        ])
+        cfg.add_edges_from([('bb_1', 'bb_2', {'chn': {'_2'}}),
+                            ('bb_1', 'bb_2_exit', {'chn': {'r2'}}),
+                            ('bb_2', 'bb_2_exit', {'chn': {'r1'}})])
+        cfg.entry = {'_1': 'bb_1'}
+        cfg.exit = {'r1': 'bb_2', 'r2': 'bb_1'}
+
+        __input__ = {'_1': [[{'v': v} for v in range(3)]]}
+
+        for n_workers in (1, 2):
+            with self.subTest(n_workers=n_workers):
+                with self.assertRaisesRegex(RuntimeError, '2 reductor'):
+                    self.run_net(cfg, __input__, n_workers=n_workers)
+
+    def test_failure_feeding(self):
+        # The worker dies while the feeder waits for its credits.
+        cfg = make_cfg([(fail, ('_1', ), ('r1', ))], ['r1'])
+        __input__ = {'_1': [list(range(1000))]}
+
+        for backend in ('process', 'thread'):
+            with self.subTest(backend=backend):
+                runner = akr.Runner(cfg, __input__, n_workers=2,
+                                    batch_size=4, window=1, backend=backend)
+
+                with self.assertRaises(RuntimeError):
+                    runner.run()
+
+
+class TestReduction(RunnerTest):
+
+    def test_workers(self):
+        # Lists long enough to be folded by several workers, each in several
+        # partials.
+        __input__ = {'_1': [list(range(i, i + 500)) for i in range(8)]}
+
+        counts = ['r1 500\n'] * 8
+        sums = sorted('r1 %d\n' % sum(m ** 2 for m in l)
+                      for l in __input__['_1'])
+
+        kinds = {
+            'ordered': reductors(True),
+            'unordered': reductors(False),
+            'combine': reductors(False, combine=add),
+        }
+
+        for kind, (counter, adder) in sorted(kinds.items()):
+            for reductor, expected in ((counter, counts), (adder, sums)):
+                cfg = make_cfg([(square, ('_1', ), ('_1', )),
+                                (reductor, ('_1', ), ('r1', ))], ['r1'])
+
+                for n_workers in (1, 3):
+                    with self.subTest(kind=kind, reductor=reductor.name,
+                                      n_workers=n_workers):
+                        self.assertEqual(self.run_net(cfg, __input__,
+                                                      n_workers=n_workers,
+                                                      batch_size=16),
+                                         expected)
+
+    def test_outer_lists(self):
+        # Several outermost lists on a channel (flat events) and lists of
+        # two channels reach the same reductor: each is reduced on its own.
+        _, adder = reductors(True)
+        cfg = make_cfg([(plain, ('_1', '_2'), ('_3', )),
+                        (adder, ('_3', ), ('r1', ))], ['r1'], ('_1', '_2'))
+
+        OPEN, CLOSE = akr.OPEN, akr.CLOSE
+        __input__ = {
+            '_1': akr.Events([OPEN, 1, 2, CLOSE, OPEN, 3, 4, CLOSE]),
+            '_2': [5, 6],
+        }
+
+        self.assertEqual(self.run_net(cfg, __input__, n_workers=1),
+                         ['r1 13\n', 'r1 5\n', 'r1 9\n'])
+
+    def test_nested(self):
+        # Lists of lists: the inner lists of every mid-level list are
+        # reduced, then the lists of their results.
+        __input__ = {'_1': [[list(range(i + j, i + j + 10)) for j in range(5)]
+                            for i in range(4)]}
+
+        expected = sorted('r1 %d\n' % sum(m ** 2 for l in ls for m in l)
+                          for ls in __input__['_1'])
+
+        kinds = {
+            'ordered': (True, ),
+            'unordered': (False, ),
+            'combine': (False, add),
+        }
+
+        for kind, args in sorted(kinds.items()):
+            (_, inner), (_, outer) = reductors(*args), reductors(*args)
+            cfg = make_cfg([(square, ('_1', ), ('_1', )),
+                            (inner, ('_1', ), ('_1', )),
+                            (outer, ('_1', ), ('r1', ))], ['r1'])
+
+            for backend in ('process', 'thread'):
+                for n_workers in (1, 3):
+                    with self.subTest(kind=kind, backend=backend,
+                                      n_workers=n_workers):
+                        self.assertEqual(self.run_net(cfg, __input__,
+                                                      n_workers=n_workers,
+                                                      backend=backend),
+                                         expected)
+
+
+class TestStealing(RunnerTest):
+
+    def test_skewed(self):
+        # A single input message makes all the work: the worker it is dealt
+        # to keeps the tasks it may not give (routed to the owner of their
+        # list) and the others steal the rest.
+        counter, adder = reductors(True)
+        __input__ = {'_1': [[-600]]}
+
+        for reductor, expected in ((counter, ['r1 600\n']),
+                                   (adder, ['r1 %d\n' % sum(range(-599, 1))])):
+            cfg = make_cfg([(expand, ('_1', ), ('_1', )),
+                            (work, ('_1', ), ('_1', )),
+                            (reductor, ('_1', ), ('r1', ))], ['r1'])
+
+            self.assertEqual(self.run_net(cfg, __input__, n_workers=1),
+                             expected)
+
+            for transport in ('queue', 'shm'):
+                with self.subTest(reductor=reductor.name,
+                                  transport=transport):
+                    self.assertEqual(self.run_net(cfg, __input__,
+                                                  n_workers=3, quantum=4,
+                                                  transport=transport),
+                                     expected)
+
+                    stats = self.runner.stats().values()
+                    self.assertGreater(sum(s['stolen_tasks'] for s in stats),
+                                       0)
+
+
+class TestThreads(RunnerTest):
+
+    def setUp(self):
+        global nap
+
+        super().setUp()
+        nap = 0.0002
+
+    def tearDown(self):
+        global nap
+
+        super().tearDown()
+        nap = 0.
+
+    def test_continuations(self):
+        # Threads run the same inductor and reductors at once, each with
+        # its own continuations.
+        __input__ = {'_1': [[-n] for n in range(40, 80, 5)]}
+
+        counts = sorted('r1 %d\n' % n for n in range(40, 80, 5))
+        sums = sorted('r1 %d\n' % sum(range(-n + 1, 1))
+                      for n in range(40, 80, 5))
+
+        for kind, args in (('ordered', (True, )),
+                           ('combine', (False, add))):
+            counter, adder = reductors(*args)
+
+            for reductor, expected in ((counter, counts), (adder, sums)):
+                cfg = make_cfg([(expand, ('_1', ), ('_1', )),
+                                (reductor, ('_1', ), ('r1', ))], ['r1'])
+
+                for n_workers in (1, 4):
+                    with self.subTest(kind=kind, reductor=reductor.name,
+                                      n_workers=n_workers):
+                        self.assertEqual(self.run_net(cfg, __input__,
+                                                      n_workers=n_workers,
+                                                      backend='thread',
+                                                      induction_burst=2,
+                                                      quantum=1),
+                                         expected)
+
+
+class TestAsync(RunnerTest):
+
+    def test_transductor(self):
+        cfg = make_cfg([(asquare, ('_1', ), ('r1', ))], ['r1'])
+        __input__ = {'_1': [list(range(i, i + 10)) for i in range(10)]}
+
+        expected = sorted('r1 %r\n' % (m ** 2, )
+                          for l in __input__['_1'] for m in l)
+
+        for n_workers in (1, 2):
+            with self.subTest(n_workers=n_workers):
+                self.assertEqual(self.run_net(cfg, __input__,
+                                              n_workers=n_workers,
+                                              backend='asyncio'),
+                                 expected)
+
+    def test_inductor(self):
+        # An inductor step at a time: every step sees its own continuation,
+        # whatever the other lists do meanwhile.
+        counter, _ = reductors(True)
+        cfg = make_cfg([(aexpand, ('_1', ), ('_1', )),
+                        (counter, ('_1', ), ('r1', ))], ['r1'])
+
+        __input__ = {'_1': [[-n] for n in range(10, 50, 5)]}
+        expected = sorted('r1 %d\n' % n for n in range(10, 50, 5))
+
+        for n_workers in (1, 2):
+            with self.subTest(n_workers=n_workers):
+                self.assertEqual(self.run_net(cfg, __input__,
+                                              n_workers=n_workers,
+                                              backend='asyncio'),
+                                 expected)
+
+    def test_concurrency(self):
+        cfg = make_cfg([(running, ('_1', ), ('r1', ))], ['r1'])
+
+        lines = self.run_net(cfg, {'_1': [list(range(50))]}, n_workers=1,
+                             backend='asyncio', concurrency=4)
+
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(max(int(l.split()[1]) for l in lines), 4)
+
+    def test_in_flight(self):
+        # A worker waiting for invocations is not idle: the runner does not
+        # stop it before they complete.
+        cfg = make_cfg([(slow, ('_1', ), ('r1', ))], ['r1'])
+
+        self.assertEqual(self.run_net(cfg, {'_1': [[1, 2]]}, n_workers=2,
+                                      backend='asyncio'),
+                         ['r1 1\n', 'r1 2\n'])
+
+    def test_backends(self):
+        # Coroutine boxes need the asyncio backend.
+        cfg = make_cfg([(asquare, ('_1', ), ('r1', ))], ['r1'])
+
+        for backend in ('process', 'thread'):
+            with self.subTest(backend=backend):
+                with self.assertRaisesRegex(RuntimeError, 'TypeError'):
+                    self.run_net(cfg, {'_1': [[1]]}, n_workers=1,
+                                 backend=backend)
+
+        with self.assertRaises(TypeError):
+            @akr.reductor(True)
+            async def asumm(m):
+                pass
+
+
+class TestJoins(RunnerTest):
+
+    def test_pairing(self):
+        # Both inputs pass through a transductor first: their messages are
+        # dealt, stolen and batched in any order, the join pairs them by
+        # position all the same.
+        cfg = akr.DiGraph()
+        cfg.add_nodes_from([
+            ('bb_1', {'stmts': [(square, ('_1', ), ('a', ))]}),
+            ('bb_2', {'stmts': [(square, ('_2', ), ('b', ))]}),
+            ('bb_3', {'stmts': [(pair, ('a', 'b'), ('r1', ))]}),
+            ('bb_3_exit', {'stmts': [(__output__, ('r1', ), ())]}),
+        ])
+        cfg.add_edges_from([('bb_1', 'bb_3', {'chn': {'a'}}),
+                            ('bb_2', 'bb_3', {'chn': {'b'}}),
+                            ('bb_3', 'bb_3_exit', {'chn': {'r1'}})])
+        cfg.entry = {'_1': 'bb_1', '_2': 'bb_2'}
+        cfg.exit = {'r1': 'bb_3'}
+
+        __input__ = {
+            '_1': [list(range(i * 100, i * 100 + 30)) for i in range(8)],
+            '_2': [list(range(-i * 100, -i * 100 - 30, -1))
+                   for i in range(8)],
+        }
+
+        expected = sorted('r1 %r\n' % ((m ** 2, m ** 2), )
+                          for l in __input__['_1'] for m in l)
+
+        for n_workers in (1, 3):
+            with self.subTest(n_workers=n_workers):
+                self.assertEqual(self.run_net(cfg, __input__,
+                                              n_workers=n_workers,
+                                              batch_size=4),
+                                 expected)
+
+    def test_brackets(self):
+        # Lists on `_2' are shorter: they end the lists of the output.
+        counter, _ = reductors(True)
+        cfg = make_cfg([(pair, ('_1', '_2'), ('_1', )),
+                        (counter, ('_1', ), ('r1', ))], ['r1'],
+                       ('_1', '_2'))
+
+        __input__ = {'_1': [list(range(5))] * 4, '_2': [list(range(3))] * 4}
+
+        for n_workers in (1, 3):
+            with self.subTest(n_workers=n_workers):
+                # The last two elements of the lists on `_1' are left.
+                with self.assertWarnsRegex(RuntimeWarning, '^8 messages'):
+                    self.assertEqual(self.run_net(cfg, __input__,
+                                                  n_workers=n_workers),
+                                     ['r1 3\n'] * 4)
+
+    def test_limit(self):
+        cfg = make_cfg([(pair, ('_1', '_2'), ('r1', ))], ['r1'],
+                       ('_1', '_2'))
+
+        with self.assertRaisesRegex(RuntimeError, 'Input buffer'):
+            self.run_net(cfg, {'_1': [list(range(100))], '_2': [[0]]},
+                         n_workers=2, join_limit=10)
+
+    def test_reductor(self):
+        # Reductors with several inputs (diadic) are refused up front.
+        _, adder = reductors(True)
+        cfg = make_cfg([(adder, ('_1', '_2'), ('r1', ))], ['r1'],
+                       ('_1', '_2'))
+
+        with self.assertRaisesRegex(ValueError, 'summ has 2 inputs'):
+            self.run_net(cfg, {'_1': [[1, 2]], '_2': [[3]]}, n_workers=2)
+
+
+def blocks():
+    # Names of the shared memory blocks.
+    return set(os.listdir('/dev/shm'))
+
+
+@unittest.skipUnless(arrays.available() and os.path.isdir('/dev/shm'),
+                     'numpy or shared memory missing')
+class TestArrays(RunnerTest):
+
+    def setUp(self):
+        super().setUp()
+
+        # Vectors of both inputs, multiplied by a join on another worker.
+        self.cfg = akr.DiGraph()
+        self.cfg.add_nodes_from([
+            ('bb_1', {'stmts': [(vector, ('_1', ), ('a', ))]}),
+            ('bb_2', {'stmts': [(vector, ('_2', ), ('b', ))]}),
+            ('bb_3', {'stmts': [(dot, ('a', 'b'), ('r1', ))]}),
+            ('bb_3_exit', {'stmts': [(__output__, ('r1', ), ())]}),
+        ])
+        self.cfg.add_edges_from([('bb_1', 'bb_3', {'chn': {'a'}}),
+                                 ('bb_2', 'bb_3', {'chn': {'b'}}),
+                                 ('bb_3', 'bb_3_exit', {'chn': {'r1'}})])
+        self.cfg.entry = {'_1': 'bb_1', '_2': 'bb_2'}
+        self.cfg.exit = {'r1': 'bb_3'}
+
+        self.blocks = blocks()
+
+    def tearDown(self):
+        # The blocks of all arrays are unlinked.
+        self.assertEqual(blocks() - self.blocks, set())
+        super().tearDown()
+
+    def test_workers(self):
+        __input__ = {'_1': [list(range(1, 13))] * 10,
+                     '_2': [list(range(12))] * 10}
+
+        expected = sorted('r1 %d\n' % (200 * m * (m - 1))
+                          for l in __input__['_1'] for m in l)
+
+        self.assertEqual(self.run_net(self.cfg, __input__, n_workers=3,
+                                      batch_size=4),
+                         expected)
+
+        stats = self.runner.stats().values()
+        self.assertGreater(sum(s['arrays_shared'] for s in stats), 0)
+        self.assertGreater(sum(s['arrays_mapped'] for s in stats), 0)
+
+    def test_unmatched(self):
+        # Vectors of the longer lists are held by the join when the run
+        # stops.
+        __input__ = {'_1': [list(range(12))] * 10,
+                     '_2': [list(range(8))] * 10}
+
+        with self.assertWarns(RuntimeWarning):
+            lines = self.run_net(self.cfg, __input__, n_workers=3)
+
+        self.assertEqual(len(lines), 80)
+
+    def test_failure(self):
+        __input__ = {'_1': [list(range(50))] * 4, '_2': [list(range(50))] * 4}
+
+        with self.assertRaisesRegex(RuntimeError, 'ValueError: 13'):
+            self.run_net(self.cfg, __input__, n_workers=3, batch_size=4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ sys.path[0:0] = ['..', '../..']
 
 
 import unittest
+import itertools
 from akr.stream import *
 
 
@@ -40,5 +41,122 @@ class TestParser(unittest.TestCase):
             with self.assertRaises(ValueError):
                 s = factory.read(inp)
 
+    def test_iter(self):
+        read = []
+
+        def source():
+            for i in range(3):
+                read.append(i)
+                yield [i, i]
+
+        it = Stream().iter(source())
+
+        # Messages are generated one step behind the input.
+        first = next(it)
+        self.assertEqual(read, [0])
+        self.assertEqual(first.id, (0, 0, 1, 0))
+
+        rest = list(it)
+        self.assertEqual(len(rest), 5)
+        self.assertEqual([m.bracket for m in rest], [1, None, 1, None, 0])
+
+    def test_events(self):
+        seq = [[[1, 2], [3]], [[4]]]
+
+        flat = list(events(seq))
+        self.assertEqual(flat.count(OPEN), 6)
+        self.assertEqual(flat.count(CLOSE), 6)
+
+        expected = [(m.content, m.id, m.bracket) for m in Stream().read(seq)]
+        scanned = [(m.content, m.id, m.bracket)
+                   for m in Stream().scan(iter(flat))]
+
+        self.assertEqual(scanned, expected)
+
+    def test_outer_lists(self):
+        # Every outermost list gets a new identifier and indices from 0.
+        flat = [OPEN, 1, 2, CLOSE, OPEN, 3, 4, CLOSE]
+
+        s = list(Stream().scan(iter(flat)))
+
+        self.assertEqual([m.id for m in s],
+                         [(0, 0), (0, 1), (1, 0), (1, 1)])
+        self.assertEqual([m.bracket for m in s], [None, 0, None, 0])
+
+        # Streams sharing their identifiers number their lists apart.
+        outer_ids = itertools.count()
+        a, b = Stream(outer_ids), Stream(outer_ids)
+
+        ids = [m.id for m in a.scan(iter(flat))] \
+            + [m.id for m in b.read([[5], [6]])] \
+            + [m.id for m in a.read([7])]
+
+        self.assertEqual(ids, [(0, 0), (0, 1), (1, 0), (1, 1),
+                               (2, 0, 1, 0), (2, 1, 2, 0), (3, 0)])
+
+    def test_inner_lists(self):
+        # Inner lists are numbered from 0 in every mid-level list.
+        s = Stream().read([[[1, 2], [3]], [[4], [5, 6]]])
+
+        self.assertEqual([m.id[1::2] for m in s],
+                         [(0, 0, 0), (0, 0, 1), (0, 1, 0),
+                          (1, 0, 0), (1, 1, 0), (1, 1, 1)])
+        self.assertEqual([m.bracket for m in s], [None, 1, 2, 1, None, 0])
+
+        # Lists of the same level have distinct identifiers.
+        self.assertEqual(len({m.id[:-1] for m in s}), 4)
+
+    def test_strings(self):
+        s = Stream().read(['ab', b'cd'])
+
+        self.assertEqual([m.content for m in s], ['ab', b'cd'])
+        self.assertEqual(len(s), 2)
+
+    def test_unbalanced(self):
+
+        testcases = [
+            [OPEN, 1, 2],
+            [OPEN, 1, CLOSE, CLOSE],
+            [1, OPEN, CLOSE],
+        ]
+
+        for inp in testcases:
+            with self.assertRaises(ValueError):
+                list(Stream().scan(inp))
+
+    def test_deep(self):
+        # Deeper than the recursion limit.
+        seq = [1]
+
+        for _ in range(5000):
+            seq = [seq]
+
+        s = Stream().read(seq)
+
+        self.assertEqual(len(s), 1)
+        self.assertEqual(len(s[0].id), 2 * 5001)
+
+
+class TestDump(unittest.TestCase):
+
+    def test_message(self):
+        m = Message([1, 2], (2**64 - 1, 3, 0), 2)
+        m.set_loc(1, 5)
+
+        r = load(m.dump())
+
+        self.assertIs(type(r), Message)
+        self.assertEqual((r.content, r.id, r.bracket, r.channel, r.pc),
+                         ([1, 2], (2**64 - 1, 3, 0), 2, 1, 5))
+
+    def test_continuation(self):
+        m = Continuation('cont', (7, ), None, index=4)
+
+        r = load(m.dump())
+
+        self.assertIs(type(r), Continuation)
+        self.assertEqual((r.content, r.id, r.bracket, r.index, r.pc),
+                         ('cont', (7, ), None, 4, None))
+
 if __name__ == '__main__':
     unittest.main()
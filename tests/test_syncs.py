@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import re
+import os
+import unittest
+from types import SimpleNamespace
+
+from akr.stream import Message
+from akr.syncs import Syncs
+from aksync.compiler import compile_to_ast, compile_sync, preamble
+from aksync.runtime import State
+
+
+def load_cpu():
+    # The synchroniser of the driver loop in aksync/tests/cpu.py.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'aksync', 'tests', 'cpu.py')
+
+    with open(path) as f:
+        src = re.search(r'sync_src = """(.*?)"""', f.read(), re.S).group(1)
+
+    return load(src, 'cpu')
+
+
+route_src = """
+sync route (a | x, y, z)
+{
+  start {
+    on:
+      a.(v) & [v > 0] {
+        send this => x;
+      }
+
+      a.(v) & [v > 1] {
+        send this => y;
+      }
+
+      a.else {
+        send this => z;
+      }
+  }
+}
+"""
+
+
+def load(src, name, labels=()):
+    scope = {}
+    exec(preamble(), scope)
+
+    for ast in compile_to_ast(src):
+        exec(compile_sync(ast, labels), scope)
+
+    return scope[name]
+
+
+class TestDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.route = load(route_src, 'route')
+
+    def fire(self, msg):
+        output, _, consumed = self.route.run(self.route.init(), {0: msg})
+        return consumed and {p: m for p, m in output.items() if m}
+
+    def test_guards(self):
+        self.assertEqual(self.fire({'v': 1}), {0: [{'v': 1}]})
+        self.assertFalse(self.fire({'v': 0}))
+
+    def test_else(self):
+        self.assertEqual(self.fire({'w': 1}), {2: [{'w': 1}]})
+
+    def test_first_match(self):
+        self.route.first_match = True
+
+        for _ in range(20):
+            self.assertEqual(self.fire({'v': 2}), {0: [{'v': 2}]})
+
+
+class TestState(unittest.TestCase):
+
+    class State(State):
+        __slots__ = _stores = ('m', )
+        _ints = (('a', 2), ('b', 10), ('c', 64), ('d', 100))
+
+    def test_wrap(self):
+        s = self.State('start', m={}, a=1, b=0, c=0, d=0)
+
+        s.a += 1
+        self.assertEqual(s.a, -2)
+
+        s.b = 511
+        s.b += 1
+        self.assertEqual(s.b, -512)
+
+        s.c = -1 << 63
+        s.c -= 1
+        self.assertEqual(s.c, (1 << 63) - 1)
+
+        s.d = 1 << 99
+        self.assertEqual(s.d, -1 << 99)
+
+        self.assertEqual(s._size, 1 + 2 + 8 + 13)
+
+    def test_copy(self):
+        s = self.State('start', m={}, a=1, b=2, c=3, d=4)
+        t = s._copy()
+
+        t.b = 5
+        t._name = 'next'
+
+        self.assertEqual(s._scope(),
+                         {'m': {}, 'a': 1, 'b': 2, 'c': 3, 'd': 4})
+        self.assertEqual((t._name, t.b, t.d), ('next', 5, 4))
+        self.assertIs(t.m, s.m)
+
+
+pair_src = """
+sync pair (a, b | c)
+{
+  store ma;
+
+  start {
+    on:
+      a {
+        set ma = this;
+        goto s1;
+      }
+  }
+
+  s1 {
+    on:
+      b & [i > 0] {
+        send ma || this => c;
+        goto done;
+      }
+  }
+}
+"""
+
+
+class TestSyncTable(unittest.TestCase):
+
+    def test_instances(self):
+        pair = load(pair_src, 'pair', ('i', ))
+        plan = SimpleNamespace(inputs=[(0, 1)], outputs=[(2, )], succ=[(1, )])
+
+        syncs = Syncs(plan)
+        out = []
+
+        for i, (channel, content) in enumerate([
+                (0, {'i': 1, 'x': 1}), (0, {'i': 2, 'x': 2}),
+                (1, {'i': 1, 'y': 3}), (1, {'i': 0, 'y': 4})]):
+            m = Message(content, (0, i))
+            m.set_loc(channel, 0)
+
+            out.extend(syncs.put(pair, m))
+
+        self.assertEqual([content for _, content, _ in out],
+                         [{'i': 1, 'x': 1, 'y': 3}])
+
+        # 1 reached a terminal state, 0 has a buffered message it cannot
+        # consume yet.
+        self.assertEqual(sorted(syncs.hosted[0].instances), [(0, ), (2, )])
+
+        stats = syncs.stats['pair']
+        self.assertEqual((stats['created'], stats['evicted'],
+                          stats['instances']), (3, 1, 2))
+
+        with self.assertRaises(ValueError):
+            m = Message({'x': 1}, (0, 4))
+            m.set_loc(0, 0)
+            syncs.put(pair, m)
+
+
+# Variables named like methods of a state, and the state name.
+names_src = """
+sync names (a | b)
+{
+  store copy;
+  state int(8) size = 0, name = 0;
+
+  start {
+    on:
+      a.(v) {
+        set copy = [v], size = [size + v], name = [1];
+        send (copy: copy || size: [size] || name: [name]) => b;
+        goto start;
+      }
+  }
+}
+"""
+
+
+class TestSyncs(unittest.TestCase):
+
+    def test_state(self):
+        cpu = load_cpu()
+        state = cpu.init()
+        instr = {0: {'opc': 2, 'op0': 10}}
+
+        # A snapshot leaves the state alone, by default it is updated.
+        _, new, _ = cpu.run(state, instr, snapshot=True)
+        self.assertEqual((state._name, state.operand), ('start', 0))
+        self.assertEqual((new._name, new.operand), ('idecode', 10))
+
+        _, new, _ = cpu.run(state, instr)
+        self.assertIs(new, state)
+        self.assertEqual((state._name, state.operand), ('idecode', 10))
+
+        with self.assertRaises(AttributeError):
+            state.undeclared = 0
+
+    def test_names(self):
+        names = load(names_src, 'names')
+        state = names.init()
+
+        for v in (2, 3):
+            output, state, _ = names.run(state, {0: {'v': v}})
+
+        self.assertEqual(output[0], [{'copy': 3, 'size': 5, 'name': 1}])
+        self.assertEqual(state._name, 'start')
+
+    def test_cpu(self):
+        cpu = load_cpu()
+
+        # instr, load, mem, c | stdout, load, mem, c; all but stdout are
+        # wired back to the synchroniser.
+        plan = SimpleNamespace(inputs=[(0, 1, 2, 3)], outputs=[(4, 1, 2, 3)],
+                               succ=[(1, 0, 0, 0)])
+
+        LD, ST, ADD, MUL, PRT = range(0, 5)
+
+        program = [(PRT, 0), (ADD, 10), (PRT, 0), (MUL, 5), (PRT, 0),
+                   (ST, 1), (ADD, 100), (ST, 2), (PRT, 0), (LD, 1), (PRT, 0)]
+
+        syncs = Syncs(plan)
+        out = []
+
+        for i, (opc, op0) in enumerate(program):
+            m = Message({'opc': opc, 'op0': op0}, (0, i))
+            m.set_loc(0, 0)
+
+            out.extend(syncs.put(cpu, m))
+
+        self.assertEqual([(port, content) for port, content, _ in out],
+                         [(0, {'acc': acc}) for acc in (0, 10, 50, 150, 50)])
+
+        stats = syncs.stats['cpu']
+        self.assertEqual(stats['received'], len(program))
+        self.assertEqual(stats['transitions'], 26)
+
+    def test_records(self):
+        # Synchronisers take records only.
+        route = load(route_src, 'route')
+        plan = SimpleNamespace(inputs=[(0, )], outputs=[(1, 2, 3)],
+                               succ=[(-1, -1, -1)],
+                               channels=['a', 'x', 'y', 'z'])
+
+        m = Message(1, (0, 0))
+        m.set_loc(0, 0)
+
+        with self.assertRaisesRegex(TypeError, 'route got 1 on channel a'):
+            Syncs(plan).put(route, m)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+import sys
+sys.path[0:0] = ['..', '../..']
+
+import queue
+import pickle
+import unittest
+from multiprocessing import Process, Queue
+
+from akr.shm import Ring, SharedMemory
+from akr.transport import RingTransport, Empty
+
+
+def echo(queues, rings, bells):
+    # Send every record back to worker 0 until ('stop', ).
+    transport = RingTransport(1, queues, rings, bells)
+
+    while True:
+        record = transport.recv(True, 10.)
+        transport.send(0, record, urgent=True)
+
+        if record == ('stop', ):
+            break
+
+
+@unittest.skipIf(SharedMemory is None, 'shared memory missing')
+class TestRing(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = Ring(64)
+
+    def tearDown(self):
+        self.ring.close()
+        self.ring.unlink()
+
+    def test_wraparound(self):
+        # Records of sizes prime to the capacity: lengths and payloads are
+        # split by the end of the data area at every offset.
+        for i in range(200):
+            data = bytes([i % 256]) * (i % 23 + 1)
+
+            self.assertTrue(self.ring.write(data))
+            self.assertEqual(self.ring.read(), data)
+
+        self.assertIsNone(self.ring.read())
+
+    def test_full(self):
+        data = b'x' * 20
+
+        self.assertTrue(self.ring.write(data))
+        self.assertTrue(self.ring.write(data))
+
+        # 2 * 24 bytes used, 16 left.
+        self.assertFalse(self.ring.write(data))
+        self.assertTrue(self.ring.write(b'y' * 12))
+
+        self.assertEqual(self.ring.read(), data)
+        self.assertTrue(self.ring.write(data))
+
+        self.assertEqual(self.ring.read(), data)
+        self.assertEqual(self.ring.read(), b'y' * 12)
+        self.assertEqual(self.ring.read(), data)
+        self.assertIsNone(self.ring.read())
+
+    def test_fits(self):
+        self.assertTrue(self.ring.fits(60))
+        self.assertFalse(self.ring.fits(61))
+
+
+@unittest.skipIf(SharedMemory is None, 'shared memory missing')
+class TestRingTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.queues = [queue.Queue(), queue.Queue()]
+        self.rings, self.bells = RingTransport.create(self.queues, 256)
+
+        self.t0 = RingTransport(0, self.queues, self.rings, self.bells)
+        self.t1 = RingTransport(1, self.queues, self.rings, self.bells)
+
+    def tearDown(self):
+        RingTransport.destroy(self.rings)
+
+    def test_backlog(self):
+        # Batches that do not fit wait in the backlog of the sender, and
+        # are received in order once the ring is read.
+        sent = [('msg', i, b'.' * 40) for i in range(50)]
+
+        for record in sent:
+            self.t0.send(1, record)
+
+        self.assertGreater(self.t0.n_backlog, 0)
+
+        received = []
+
+        while len(received) < len(sent):
+            self.t0.flush()
+
+            try:
+                received.extend(self.t1.recv_all(False))
+            except Empty:
+                self.fail('Batches lost')
+
+        self.assertEqual(received, sent)
+        self.assertEqual(self.t0.n_backlog, 0)
+
+    def test_oversized(self):
+        # Batches larger than a ring go through the queue, behind none of
+        # those in the ring.
+        record = ('msg', b'.' * 1000)
+
+        self.t0.send(1, ('msg', 0))
+        self.t0.send(1, record)
+
+        self.assertEqual(self.queues[1].qsize(), 1)
+        self.assertEqual(self.t1.recv(False), ('msg', 0))
+        self.assertEqual(self.t1.recv(False), record)
+
+        with self.assertRaises(Empty):
+            self.t1.recv(False)
+
+    def test_doorbell(self):
+        bells, sleeping = self.bells
+
+        # Awake: the doorbell is not rung.
+        self.t0.send(1, ('msg', 0))
+        self.assertFalse(bells[1].acquire(False))
+
+        # About to sleep: it is, once.
+        sleeping[1] = 1
+        self.t0.send(1, ('msg', 1))
+        self.t0.send(1, ('msg', 2))
+
+        self.assertEqual(sleeping[1], 0)
+        self.assertTrue(bells[1].acquire(False))
+        self.assertFalse(bells[1].acquire(False))
+
+        self.assertEqual([self.t1.recv(False) for _ in range(3)],
+                         [('msg', 0), ('msg', 1), ('msg', 2)])
+
+    def test_processes(self):
+        # Worker 1 sleeps on its doorbell between records.
+        queues = [Queue(), Queue()]
+        rings, bells = RingTransport.create(queues, 256)
+
+        try:
+            p = Process(target=echo, args=(queues, rings, bells))
+            p.start()
+
+            transport = RingTransport(0, queues, rings, bells)
+
+            # Some batches are larger than the rings.
+            sent = [('msg', i, b'.' * (i * 7 % 400)) for i in range(100)]
+            sent.append(('stop', ))
+
+            received = []
+
+            for start in range(0, len(sent), 10):
+                # Wait for the echoes: the other side goes to sleep.
+                group = sent[start:start + 10]
+
+                for record in group:
+                    transport.send(1, record, urgent=True)
+
+                received.extend(transport.recv(True, 10.) for _ in group)
+
+            p.join(10.)
+
+            self.assertEqual(p.exitcode, 0)
+            self.assertEqual(sorted(received), sorted(sent))
+
+            # Those of the rings keep their order.
+            def fit(records):
+                ring = rings[0, 1]
+                return [r for r in records if ring.fits(len(
+                    pickle.dumps([r], pickle.HIGHEST_PROTOCOL)))]
+
+            self.assertLess(len(fit(sent)), len(sent))
+            self.assertEqual(fit(received), fit(sent))
+
+        finally:
+            RingTransport.destroy(rings)
+
+
+if __name__ == '__main__':
+    unittest.main()